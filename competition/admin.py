@@ -1,6 +1,6 @@
 from django import forms
 from django.contrib import admin, messages
-from django.db.models import Avg, Sum, F
+from django.db import transaction
 from django.http import HttpResponse
 from django.http import HttpResponseRedirect
 from django.shortcuts import render
@@ -8,6 +8,10 @@ from django.template import loader
 from django.utils.translation import gettext as _
 from competition.models import Team, Tournament, Match, Prediction, Participant
 from competition.models import Sport, Benchmark, BenchmarkPrediction
+from competition.cache import bump_match, bump_tournament
+from competition.simulation import Simulation
+from competition.reports import top_predictors, write_csv
+from competition.snapshot import archive
 import logging
 
 g_logger = logging.getLogger(__name__)
@@ -35,11 +39,17 @@ class BenchmarkInline(admin.TabularInline):
         return False
 
 
+class SimulationForm(forms.Form):
+    bonus = forms.DecimalField(max_digits=5, decimal_places=2)
+    draw_bonus = forms.DecimalField(max_digits=5, decimal_places=2)
+    benchmarks = forms.BooleanField(required=False, help_text="Include benchmarks")
+
+
 class TournamentAdmin(admin.ModelAdmin):
     list_display = ('name', 'participant_count', 'match_count')
     inlines = (BenchmarkInline, )
     actions = ['pop_leaderboard', 'close_tournament',
-               'open_tournament', 'archive_tournament']
+               'open_tournament', 'archive_tournament', 'simulate_rules']
     list_filter = (
         ('sport', admin.RelatedOnlyFieldListFilter),
         "state",
@@ -49,7 +59,7 @@ class TournamentAdmin(admin.ModelAdmin):
         (None, {
             'fields': ('name', 'slug', 'sport', 'state', 'bonus', 'draw_bonus', 'year',
                        'winner', 'add_matches', 'test_features_enabled', 'draw_definition',
-                       'additional_rules')
+                       'additional_rules', 'open_at', 'close_at')
         }),
     )
     prepopulated_fields = {"slug": ("name",)}
@@ -65,7 +75,8 @@ class TournamentAdmin(admin.ModelAdmin):
             if not obj or obj.state not in [Tournament.FINISHED, Tournament.ARCHIVED]:
                 return self.fieldsets
         return ((None, {'fields': ('name', 'slug', 'sport', 'state', 'bonus', 'draw_bonus',
-                                   'year', 'winner', 'draw_definition', 'additional_rules')}),)
+                                   'year', 'winner', 'draw_definition', 'additional_rules',
+                                   'open_at', 'close_at')}),)
 
     def get_queryset(self, request):
         from django.db.models import Count
@@ -102,9 +113,49 @@ class TournamentAdmin(admin.ModelAdmin):
     open_tournament.allowed_permissions = ('change',)
 
     def archive_tournament(self, request, queryset):
-        queryset.update(state=Tournament.ARCHIVED)
+        # predictions are kept, the archive_tournament command can prune them
+        skipped = []
+        for tournament in queryset:
+            if tournament.is_closed():
+                archive(tournament)
+            else:
+                skipped.append(tournament.name)
+        if skipped:
+            messages.warning(request, _('Only finished tournaments can be archived, skipped %s')
+                             % ", ".join(skipped))
     archive_tournament.allowed_permissions = ('change',)
 
+    def simulate_rules(self, request, queryset):
+        g_logger.debug("simulate_rules(%r, %r, %r)", self, request, queryset)
+
+        results = []
+        if 'apply' in request.POST:
+            form = SimulationForm(request.POST)
+            if form.is_valid():
+                for tournament in queryset:
+                    changes = Simulation(tournament).compare(form.cleaned_data['bonus'],
+                                                             form.cleaned_data['draw_bonus'],
+                                                             form.cleaned_data['benchmarks'])
+                    results.append((tournament, changes))
+        else:
+            tournament = queryset[0]
+            form = SimulationForm(initial={'bonus': tournament.bonus,
+                                           'draw_bonus': tournament.draw_bonus})
+
+        context = {
+            'tournaments': queryset,
+            'form': form,
+            'results': results,
+            'opts': self.model._meta,
+            'media': self.media,
+            }
+
+        return render(request,
+                      'admin/simulate_rules.html',
+                      context=context)
+    simulate_rules.short_description = "Simulate different bonus rules"
+    simulate_rules.allowed_permissions = ('view',)
+
 
 class MatchAdmin(admin.ModelAdmin):
     list_display = ('match_id', 'home_team', 'away_team', 'kick_off', 'postponed', 'score')
@@ -160,19 +211,20 @@ class MatchAdmin(admin.ModelAdmin):
         return super(MatchAdmin, self).formfield_for_foreignkey(db_field, request, **kwargs)
 
     def calc_match_result(self, request, queryset):
-        for match in queryset:
-            if match.score is None:
-                continue
-            match.tournament.check_predictions(match)
+        played = {}
+        for match in queryset.filter(score__isnull=False).select_related('tournament'):
+            played.setdefault(match.tournament, []).append(match)
+        for tournament, matches in played.items():
+            tournament.score_matches(matches)
     calc_match_result.allowed_permissions = ('change',)
 
     def postpone(self, request, queryset):
         queryset.update(postponed=True)
+        self.bump_matches(queryset)
     postpone.allowed_permissions = ('change',)
 
     def show_top_ten(self, request, queryset):
-        from member.forms import SocialProviderForm 
-        from django.contrib.auth.models import User
+        from member.forms import SocialProviderForm
 
         form = SocialProviderForm(request.POST)
 
@@ -181,14 +233,13 @@ class MatchAdmin(admin.ModelAdmin):
             provider = form.cleaned_data['social_provider']
             provider = provider and provider.provider
 
-        top_10 = (Prediction.objects.filter(match__in=queryset)
-                  .values('user')
-                  .annotate(Sum('score'), Avg('margin'))
-                  .order_by('score__sum')[:10])
+        top_10 = top_predictors(queryset, 10, provider)
 
-        for p in top_10:
-            p['user'] = User.objects.get(pk=p['user'])
-            p['social_name'] = p['user'].profile.get_social_name(provider)
+        if 'csv' in request.POST:
+            response = HttpResponse(content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="top10.csv"'
+            write_csv(top_10, response)
+            return response
 
         context = {
                 'matches': queryset,
@@ -204,16 +255,15 @@ class MatchAdmin(admin.ModelAdmin):
     show_top_ten.allowed_permissions = ('change',)
 
     def swap_home_and_away(self, request, queryset):
-        queryset.update(home_team=F('away_team'),
-                        away_team=F('home_team'),
-                        home_team_winner_of=F('away_team_winner_of'),
-                        away_team_winner_of=F('home_team_winner_of'),
-                        score=F('score')*-1)
-        Prediction.objects.filter(
-                match__in=queryset
-                ).update(prediction=F('prediction')*-1)
+        queryset.swap_home_and_away()
     swap_home_and_away.allowed_permissions = ('change',)
 
+    def bump_matches(self, queryset):
+        # queryset.update() doesn't call save(), so cached fragments are invalidated here
+        for match_pk, tournament_pk in queryset.values_list('pk', 'tournament'):
+            bump_match(match_pk)
+            bump_tournament(tournament_pk)
+
 
 class PredictionAdmin(admin.ModelAdmin):
     list_display = ('pk', 'user', 'match', 'entered')
@@ -290,60 +340,58 @@ class TeamAdmin(admin.ModelAdmin):
 
     def merge(self, request, queryset):
         primary_team = queryset[0]
-        secondary_teams = queryset[1:]
-        matches_to_modify = []
-
-        perform_action = True if 'apply' in request.POST else False
-
-        if perform_action:
-            team_form = TeamEditForm(request.POST, instance=primary_team)
-        else:
-            team_form = TeamEditForm(instance=primary_team)
-
-        team_form.fields['code'].choices = [(x,x) for x in queryset.values_list('code', flat=True)]
-
-        for team in secondary_teams:
-            if team.sport != primary_team.sport:
-                if perform_action:
-                    g_logger.error("Cannot merge teams from different sports (%s != %s)", team.sport, primary_team.sport)
+        secondary_teams = []
+        for team in queryset[1:]:
+            if team.sport_id != primary_team.sport_id:
+                messages.error(request, _('Cannot merge teams from different sports (%s != %s)')
+                               % (team.sport, primary_team.sport))
                 continue
+            secondary_teams.append(team)
 
-            if perform_action:
-                # The user clicked submit on the intermediate form.
-                # Perform our update action:
-
-                g_logger.debug("Merging %s into %s", team, primary_team)
-
-                Match.objects.filter(home_team=team).update(home_team=primary_team)
-                Match.objects.filter(away_team=team).update(away_team=primary_team)
+        code_choices = [(team.code, team.code) for team in [primary_team] + secondary_teams]
 
-                g_logger.debug("Deleting %s", team)
-                team.delete()
-
-            else:
-                matches_to_modify.extend(Match.objects.filter(home_team=team))
-                matches_to_modify.extend(Match.objects.filter(away_team=team))
-
-        if perform_action:
-            # Update team from edit form
-            if team_form.is_valid():
-                team_form.save()
-            else:
-                g_logger.error('Failed to update Team %s', primary_team)
-                messages.error(request, _('Failed to update Team %s' % primary_team))
-
-
-            # Redirect to our admin view after our update has 
-            # completed with a nice little info message saying 
-            # our models have been updated:
-            self.message_user(request,
-                              "Merged {} teams".format(queryset.count()))
+        if 'apply' in request.POST:
+            # The user clicked submit on the intermediate form. The matches are
+            # moved, the teams deleted and the edit form saved as one
+            # transaction, the form is validated once the merged teams are gone
+            # so that their names and code can be taken over.
+            target = str(primary_team)
+            team_form = TeamEditForm(request.POST, instance=primary_team)
+            team_form.fields['code'].choices = code_choices
+            with transaction.atomic():
+                changed = primary_team.merge(secondary_teams)
+                saved = team_form.is_valid()
+                if saved:
+                    team_form.save()
+                else:
+                    transaction.set_rollback(True)
+
+            if not saved:
+                g_logger.error('Failed to update Team %s', target)
+                messages.error(request, _('Failed to update Team %s') % target)
+                return HttpResponseRedirect(request.get_full_path())
+
+            for match_pk, tournament_pk in changed:
+                bump_match(match_pk)
+            for tournament_pk in {tournament_pk for _, tournament_pk in changed}:
+                bump_tournament(tournament_pk)
+
+            message = "Merged %s into %s, %d matches updated" % (
+                ", ".join(team.name for team in secondary_teams), primary_team.name, len(changed))
+            self.log_change(request, primary_team, message)
+            for team in secondary_teams:
+                self.log_deletion(request, team, str(team))
+
+            self.message_user(request, message)
             return HttpResponseRedirect(request.get_full_path())
 
+        team_form = TeamEditForm(instance=primary_team)
+        team_form.fields['code'].choices = code_choices
+
         context = {
             'merge_target': primary_team,
             'teams_to_delete': secondary_teams,
-            'matches_to_modify': matches_to_modify,
+            'counts': primary_team.merge_preview(secondary_teams),
             'opts': self.model._meta,
             'media': self.media,
             'team_form': team_form,
@@ -0,0 +1,216 @@
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from server.db import cache_timeout, read_alias, reading_replica
+import logging
+import threading
+import time
+
+g_logger = logging.getLogger(__name__)
+
+# hit/miss counts are kept per process and added to the shared totals in batches
+METRICS_FLUSH_EVERY = 50
+
+_missing = object()
+_metrics_lock = threading.Lock()
+_local_metrics = {}
+
+
+# Version counters used to key cached data and template fragments. Rather than
+# deleting cached entries when something changes, the counter for the
+# tournament or match is bumped and every entry keyed on the old value is never
+# read again.
+
+def _version_key(name):
+    return "version:%s" % name
+
+
+def _new_version():
+    # a counter that has been evicted restarts above any value it had before
+    return int(time.time() * 1000)
+
+
+def get_version(name):
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    key = _version_key(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), None)
+    g_logger.debug("bumped cache version %s", name)
+
+
+def bump_versions(names):
+    """bump_version for many counters, resetting the evicted ones in one round trip"""
+    evicted = {}
+    for name in names:
+        try:
+            cache.incr(_version_key(name))
+        except ValueError:
+            evicted[_version_key(name)] = _new_version()
+    cache.set_many(evicted, None)
+    g_logger.debug("bumped %d cache versions", len(names))
+
+
+def tournament_version(tournament_pk):
+    return get_version("tournament:%s" % tournament_pk)
+
+
+def bump_tournament(tournament_pk):
+    bump_version("tournament:%s" % tournament_pk)
+
+
+def match_version(match_pk):
+    return get_version("match:%s" % match_pk)
+
+
+def bump_match(match_pk):
+    bump_version("match:%s" % match_pk)
+
+
+def bump_matches(match_pks):
+    bump_versions(["match:%s" % pk for pk in match_pks])
+
+
+def match_versions(match_pks):
+    """{pk: version} for many matches with one cache round trip"""
+    keys = {_version_key("match:%s" % pk): pk for pk in match_pks}
+    found = cache.get_many(keys)
+    return {pk: found[key] if key in found else match_version(pk) for key, pk in keys.items()}
+
+
+def user_version(user_pk):
+    return get_version("user:%s" % user_pk)
+
+
+def bump_user(user_pk):
+    bump_version("user:%s" % user_pk)
+
+
+def bump_users(user_pks):
+    bump_versions(["user:%s" % pk for pk in user_pks])
+
+
+def sport_version(sport_pk):
+    return get_version("sport:%s" % sport_pk)
+
+
+def bump_sport(sport_pk):
+    bump_version("sport:%s" % sport_pk)
+
+
+def tournament_list_version():
+    return get_version("tournament_list")
+
+
+def bump_tournament_list():
+    bump_version("tournament_list")
+
+
+def schedule_version():
+    return get_version("schedule")
+
+
+def bump_schedule():
+    bump_version("schedule")
+
+
+# Namespaced keys. The current version is part of the key, so bumping the
+# tournament (or match) invalidates everything cached under it.
+
+def tournament_key(tournament_pk, name, *parts):
+    return ":".join(["tournament", str(tournament_pk), str(tournament_version(tournament_pk)),
+                     name] + [str(p) for p in parts])
+
+
+def match_key(match_pk, name, *parts):
+    return ":".join(["match", str(match_pk), str(match_version(match_pk)),
+                     name] + [str(p) for p in parts])
+
+
+def get_or_set(key, func, timeout=DEFAULT_TIMEOUT, metric=None):
+    metric = metric or key.split(':')[0]
+    if reading_replica():
+        # see server/db.py
+        key = "%s:%s" % (read_alias(), key)
+        timeout = cache_timeout(timeout)
+    value = cache.get(key, _missing)
+    if value is _missing:
+        record(metric, hit=False)
+        value = func()
+        cache.set(key, value, timeout)
+    else:
+        record(metric, hit=True)
+    return value
+
+
+def tournament_cached(tournament_pk, name, func, *parts, timeout=DEFAULT_TIMEOUT):
+    return get_or_set(tournament_key(tournament_pk, name, *parts), func,
+                      timeout=timeout, metric=name)
+
+
+def match_cached(match_pk, name, func, *parts, timeout=DEFAULT_TIMEOUT):
+    return get_or_set(match_key(match_pk, name, *parts), func,
+                      timeout=timeout, metric=name)
+
+
+# Metrics
+
+def _metrics_key(metric, outcome):
+    return "metrics:%s:%s" % (metric, outcome)
+
+
+def record(metric, hit):
+    outcome = 'hits' if hit else 'misses'
+    with _metrics_lock:
+        counts = _local_metrics.setdefault(metric, {'hits': 0, 'misses': 0})
+        counts[outcome] += 1
+        pending = sum(sum(c.values()) for c in _local_metrics.values())
+    if pending >= METRICS_FLUSH_EVERY:
+        flush_metrics()
+
+
+def flush_metrics():
+    with _metrics_lock:
+        pending = dict(_local_metrics)
+        _local_metrics.clear()
+
+    metrics = set(cache.get("metrics:names") or [])
+    for metric, counts in pending.items():
+        metrics.add(metric)
+        for outcome, count in counts.items():
+            if not count:
+                continue
+            key = _metrics_key(metric, outcome)
+            if not cache.add(key, count, None):
+                try:
+                    cache.incr(key, count)
+                except ValueError:
+                    cache.set(key, count, None)
+    cache.set("metrics:names", sorted(metrics), None)
+
+
+def cache_stats():
+    flush_metrics()
+    stats = {}
+    for metric in cache.get("metrics:names") or []:
+        stats[metric] = {
+            'hits': cache.get(_metrics_key(metric, 'hits'), 0),
+            'misses': cache.get(_metrics_key(metric, 'misses'), 0),
+        }
+    return stats
+
+
+def reset_stats():
+    with _metrics_lock:
+        _local_metrics.clear()
+    for metric in cache.get("metrics:names") or []:
+        cache.delete_many([_metrics_key(metric, 'hits'), _metrics_key(metric, 'misses')])
+    cache.delete("metrics:names")
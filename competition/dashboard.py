@@ -0,0 +1,67 @@
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+import datetime
+import logging
+from .cache import get_or_set, tournament_list_version, tournament_version, user_version
+from .models import Tournament, Match, Prediction
+
+g_logger = logging.getLogger(__name__)
+
+DASHBOARD_TIMEOUT = 60
+
+RECENT = datetime.timedelta(days=1)
+UPCOMING = datetime.timedelta(days=2)
+
+
+# Everything shown on a user's home page. The data is cached per user under
+# the user's version, bumped by their predictions and by joining or leaving a
+# tournament, the tournament list version and the versions of the active
+# tournaments they are in, bumped when a match is added or changed. The short
+# timeout moves matches from upcoming to recent soon after they kick off.
+
+def dashboard_key(user):
+    parts = [str(user.pk), str(user_version(user.pk)), str(tournament_list_version())]
+    tournaments = get_or_set(":".join(['dashboard'] + parts + ['tournaments']),
+                             lambda: user_tournaments(user), timeout=DASHBOARD_TIMEOUT,
+                             metric='dashboard')
+    parts += ["%s.%s" % (pk, tournament_version(pk)) for pk in tournaments]
+    return ":".join(['dashboard'] + parts), tournaments
+
+
+def user_tournaments(user):
+    return list(Tournament.objects.filter(state=Tournament.ACTIVE,
+                                          participant__user=user).values_list('pk', flat=True))
+
+
+def get_dashboard(user):
+    key, tournaments = dashboard_key(user)
+    return get_or_set(key, lambda: build_dashboard(user, tournaments),
+                      timeout=DASHBOARD_TIMEOUT, metric='dashboard')
+
+
+def build_dashboard(user, tournaments):
+    now = timezone.now()
+    matches = list(Match.objects.filter(
+        tournament__in=tournaments,
+        kick_off__gt=now - RECENT,
+        kick_off__lt=now + UPCOMING,
+        postponed=False,
+    ).annotate(
+        predicted=Exists(Prediction.objects.filter(match=OuterRef('pk'), user=user))
+    ).select_related(
+        'home_team', 'away_team',
+        'home_team_winner_of__home_team', 'home_team_winner_of__away_team',
+        'away_team_winner_of__home_team', 'away_team_winner_of__away_team',
+    ).order_by('kick_off'))
+    for match in matches:
+        match.label = str(match)
+
+    g_logger.debug("built dashboard for %s with %d matches", user, len(matches))
+    return {
+        'matches_recent': [match for match in matches if match.kick_off < now],
+        'matches_future': [match for match in matches if match.kick_off > now],
+        'live_tournaments': list(Tournament.objects.filter(state=Tournament.ACTIVE)),
+        'closed_tournaments': list(Tournament.objects.filter(
+            state=Tournament.FINISHED).select_related('winner').order_by('-pk')),
+        'tournament_list_version': tournament_list_version(),
+    }
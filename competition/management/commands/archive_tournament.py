@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from competition.models import Tournament
+from competition.snapshot import SnapshotError, archive, retake_snapshot
+
+
+class Command(BaseCommand):
+    help = "Archive finished tournaments, storing a compressed snapshot of their standings and " \
+           "predictions from which their tables and prediction histories are then served."
+
+    def add_arguments(self, parser):
+        parser.add_argument('tournaments', nargs='*', help="slugs of the tournaments")
+        parser.add_argument('--all-finished', action='store_true',
+                            help="archive every finished tournament")
+        parser.add_argument('--prune', action='store_true',
+                            help="delete the archived tournaments' predictions "
+                                 "once they are in the snapshot")
+        parser.add_argument('--resnapshot', action='store_true',
+                            help="retake the snapshots of the tournaments, e.g. after a result "
+                                 "was corrected, instead of archiving them. Browsers may show the "
+                                 "old standings until SNAPSHOT_MAX_AGE has passed")
+
+    def handle(self, *args, **options):
+        tournaments = list(Tournament.objects.filter(slug__in=options['tournaments']))
+        missing = set(options['tournaments']) - {t.slug for t in tournaments}
+        if missing:
+            raise CommandError("Tournaments %s do not exist" % ", ".join(sorted(missing)))
+        if options['all_finished']:
+            tournaments += Tournament.objects.filter(state=Tournament.FINISHED).exclude(
+                pk__in=[t.pk for t in tournaments])
+
+        for tournament in tournaments:
+            if not tournament.is_closed():
+                self.stderr.write("%s is not finished, skipped" % tournament)
+                continue
+            if options['resnapshot']:
+                self.resnapshot(tournament)
+                continue
+            snapshot = archive(tournament, prune=options['prune'])
+            pruned = ", predictions pruned" if snapshot.pruned else ""
+            self.stdout.write("%s: %d byte snapshot%s" % (tournament, len(snapshot.data), pruned))
+
+    def resnapshot(self, tournament):
+        try:
+            snapshot = retake_snapshot(tournament)
+        except SnapshotError as e:
+            self.stderr.write("%s, skipped" % e)
+            return
+        self.stdout.write("%s: %d byte snapshot retaken" % (tournament, len(snapshot.data)))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from competition.cache import cache_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = "Show the hit/miss counts of the shared cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help="clear the counts after showing them")
+
+    def handle(self, *args, **options):
+        stats = cache_stats()
+        if not stats:
+            self.stdout.write("No cache metrics recorded")
+        for metric, counts in sorted(stats.items()):
+            total = counts['hits'] + counts['misses']
+            ratio = 100.0 * counts['hits'] / total if total else 0
+            self.stdout.write("%-30s hits: %8d  misses: %8d  (%.1f%% hit rate)"
+                              % (metric, counts['hits'], counts['misses'], ratio))
+        if options['reset']:
+            reset_stats()
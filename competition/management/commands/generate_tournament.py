@@ -0,0 +1,314 @@
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.template.defaultfilters import slugify
+from django.utils import timezone
+from competition.models import Sport, Team, Tournament, Participant, Match
+from competition.models import Prediction, Benchmark, BenchmarkPrediction
+from member.models import Profile, Organisation, Competition
+from decimal import Decimal
+from itertools import combinations
+import datetime
+import logging
+import random
+import statistics
+import time
+
+g_logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+FIRST_NAMES = ["Alice", "Bob", "Carol", "Dave", "Eve", "Frank", "Grace", "Heidi", "Ivan", "Judy"]
+LAST_NAMES = ["Smith", "Jones", "Murphy", "Kelly", "Walsh", "Byrne", "Ryan", "O'Brien", ""]
+
+
+class Command(BaseCommand):
+    help = ("Generate a synthetic tournament (teams, fixtures, users, predictions, results, "
+            "benchmarks and organisations) using bulk inserts, for performance testing")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', help="tournament name, defaults to 'Synthetic <seed>'")
+        parser.add_argument('--sport', default="Synthetic sport")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--teams', type=int, default=16)
+        parser.add_argument('--groups', type=int, default=4,
+                            help="number of round robin groups the teams are split into")
+        parser.add_argument('--knockout', type=int, default=8,
+                            help="number of teams in the knockout bracket, "
+                                 "a power of 2 (0 for none)")
+        parser.add_argument('--participants', type=int, default=100)
+        parser.add_argument('--coverage', type=float, default=0.9,
+                            help="chance that a participant predicts any given match")
+        parser.add_argument('--played', type=float, default=0.5,
+                            help="fraction of the matches that have already been played")
+        parser.add_argument('--benchmarks', type=int, default=3)
+        parser.add_argument('--organisations', type=int, default=2)
+        parser.add_argument('--password', default="password",
+                            help="password given to every generated user")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        name = options['name'] or "Synthetic %d" % options['seed']
+
+        knockout = options['knockout']
+        if knockout and (knockout & (knockout - 1) or knockout > options['teams']):
+            raise CommandError("--knockout must be a power of 2 no bigger than --teams")
+        if options['groups'] < 1 or options['groups'] > options['teams']:
+            raise CommandError("--groups must be between 1 and --teams")
+        if Tournament.objects.filter(name=name).exists():
+            raise CommandError('Tournament "%s" already exists' % name)
+
+        start = time.time()
+        with transaction.atomic():
+            sport, _ = Sport.objects.get_or_create(name=options['sport'])
+            tourn = Tournament.objects.create(name=name, sport=sport, state=Tournament.ACTIVE)
+
+            teams = self.create_teams(sport, options['teams'])
+            matches = self.create_matches(tourn, teams, options['groups'], knockout,
+                                          options['played'])
+            participants = self.create_participants(tourn, options['participants'],
+                                                    options['password'])
+            n_predictions = self.create_predictions(tourn, matches, participants,
+                                                    options['coverage'])
+            self.create_benchmarks(tourn, matches, options['benchmarks'])
+            self.create_organisations(tourn, participants, options['organisations'])
+
+            if all(m.score is not None for m in matches):
+                tourn.state = Tournament.FINISHED
+                tourn.winner = tourn.participant_set.order_by('score').first()
+                tourn.save()
+
+        self.stdout.write('Generated "%s": %d teams, %d matches, %d participants, '
+                          '%d predictions in %.2fs' % (tourn.name, len(teams), len(matches),
+                                                       len(participants), n_predictions,
+                                                       time.time() - start))
+
+    def create_teams(self, sport, n_teams):
+        existing = set(sport.team_set.values_list('name', flat=True))
+        Team.objects.bulk_create([
+            Team(name="Team %03d" % i, code="%03d" % i, sport=sport)
+            for i in range(1, n_teams + 1) if "Team %03d" % i not in existing
+        ], batch_size=BATCH_SIZE)
+
+        teams = list(sport.team_set.filter(name__in=["Team %03d" % i
+                                                     for i in range(1, n_teams + 1)]))
+        # hidden strength of each team, used to give results and predictions a realistic spread
+        self.strength = {team.pk: self.rng.gauss(0, 8) for team in teams}
+        return teams
+
+    def expected_margin(self, home, away):
+        if home is None or away is None:
+            return 0
+        return self.strength[home.pk] - self.strength[away.pk] + 3
+
+    def play(self, match, knockout=False):
+        result = round(self.rng.gauss(self.expected_margin(match.home_team, match.away_team), 12))
+        if knockout and result == 0:
+            result = self.rng.choice([-1, 1])
+        return result
+
+    def group_fixtures(self, teams, n_groups):
+        fixtures = []
+        for group in range(n_groups):
+            for home, away in combinations(teams[group::n_groups], 2):
+                if self.rng.random() < 0.5:
+                    home, away = away, home
+                fixtures.append((home, away))
+        self.rng.shuffle(fixtures)
+        return fixtures
+
+    def knockout_rounds(self, teams, knockout):
+        # the first round is seeded, later rounds (None) are decided by the earlier ones
+        seeds = self.rng.sample(teams, knockout)
+        rounds = [list(zip(seeds[::2], seeds[1::2]))]
+        while len(rounds[-1]) > 1:
+            rounds.append([None] * (len(rounds[-1]) // 2))
+        return rounds
+
+    def set_knockout_teams(self, match, feeders, winners, by_match_id):
+        # later knockout rounds take the winners of the previous round
+        match.home_team = winners.get(feeders[0].match_id)
+        match.away_team = winners.get(feeders[1].match_id)
+        if match.home_team is None:
+            match.home_team_winner_of = by_match_id[feeders[0].match_id]
+        if match.away_team is None:
+            match.away_team_winner_of = by_match_id[feeders[1].match_id]
+
+    def create_matches(self, tourn, teams, n_groups, knockout, played):
+        rounds = [self.group_fixtures(teams, n_groups)]
+        if knockout:
+            rounds.extend(self.knockout_rounds(teams, knockout))
+
+        n_matches = sum(len(r) for r in rounds)
+        n_played = round(n_matches * played)
+        now = timezone.now().replace(minute=0, second=0, microsecond=0)
+
+        def kick_off(index):
+            if index < n_played:
+                return now - datetime.timedelta(hours=6 * (n_played - index))
+            return now + datetime.timedelta(hours=6 * (index - n_played + 1))
+
+        matches = []
+        winners = {}
+        index = 0
+        for round_no, fixture_round in enumerate(rounds):
+            by_match_id = {m.match_id: m for m in tourn.match_set.all()}
+            new_matches = []
+            for i, fixture in enumerate(fixture_round):
+                match = Match(tournament=tourn, match_id=index + 1, kick_off=kick_off(index))
+                if fixture is not None:
+                    match.home_team, match.away_team = fixture
+                else:
+                    feeders = [matches[-len(fixture_round) * 2 + i * 2 + j] for j in range(2)]
+                    self.set_knockout_teams(match, feeders, winners, by_match_id)
+                if index < n_played:
+                    match.score = self.play(match, knockout=round_no > 0)
+                    if round_no > 0:
+                        winners[match.match_id] = (match.home_team if match.score > 0
+                                                   else match.away_team)
+                new_matches.append(match)
+                index += 1
+            Match.objects.bulk_create(new_matches, batch_size=BATCH_SIZE)
+            matches.extend(new_matches)
+
+        matches = list(tourn.match_set.select_related('home_team', 'away_team')
+                       .order_by('match_id'))
+        for match in matches:
+            match.tournament = tourn
+        g_logger.debug("Generated %d matches for %s (%d played)", len(matches), tourn, n_played)
+        return matches
+
+    def create_participants(self, tourn, n_participants, password):
+        prefix = slugify(tourn.name).replace('-', '_')
+        usernames = ["%s_%05d" % (prefix, i) for i in range(1, n_participants + 1)]
+        existing = set(User.objects.filter(username__startswith=prefix + '_')
+                       .values_list('username', flat=True))
+
+        hashed_password = make_password(password)
+        users = []
+        for username in usernames:
+            if username in existing:
+                continue
+            users.append(User(username=username,
+                              email="%s@example.com" % username,
+                              password=hashed_password,
+                              first_name=self.rng.choice(FIRST_NAMES),
+                              last_name=self.rng.choice(LAST_NAMES)))
+        User.objects.bulk_create(users, batch_size=BATCH_SIZE)
+
+        users = User.objects.filter(username__in=usernames).in_bulk()
+        with_profile = set(Profile.objects.filter(user_id__in=users)
+                           .values_list('user_id', flat=True))
+        formats = [Profile.DNF_FULL, Profile.DNF_USR]
+        profiles = [Profile(user=user, display_name_format=self.rng.choice(formats))
+                    for user_id, user in users.items() if user_id not in with_profile]
+        for profile in profiles:
+            profile.display_name = profile.get_name()
+        Profile.objects.bulk_create(profiles, batch_size=BATCH_SIZE)
+
+        names = dict(Profile.objects.filter(user_id__in=users)
+                     .values_list('user_id', 'display_name'))
+        Participant.objects.bulk_create([Participant(tournament=tourn, user_id=user_id,
+                                                     display_name=names[user_id])
+                                         for user_id in users], batch_size=BATCH_SIZE)
+        return list(tourn.participant_set.all())
+
+    def create_predictions(self, tourn, matches, participants, coverage):
+        self.match_predictions = {match.pk: [] for match in matches}
+        predictions = []
+        n_predictions = 0
+
+        for participant in participants:
+            accuracy = self.rng.uniform(6, 16)
+            own = []
+            for match in matches:
+                if self.rng.random() < coverage:
+                    value = round(self.rng.gauss(
+                        self.expected_margin(match.home_team, match.away_team), accuracy))
+                    prediction = Prediction(user_id=participant.user_id, match=match,
+                                            prediction=Decimal(value))
+                    self.match_predictions[match.pk].append(value)
+                elif match.score is not None:
+                    # what check_prediction does for a participant who missed a match
+                    prediction = Prediction(user_id=participant.user_id, match=match, late=True)
+                else:
+                    continue
+
+                if match.score is not None:
+                    prediction.calc_score(match.score)
+                own.append(prediction)
+
+            self.set_totals(participant, own)
+            predictions.extend(own)
+            if len(predictions) >= BATCH_SIZE * 10:
+                Prediction.objects.bulk_create(predictions, batch_size=BATCH_SIZE)
+                n_predictions += len(predictions)
+                predictions = []
+
+        Prediction.objects.bulk_create(predictions, batch_size=BATCH_SIZE)
+        n_predictions += len(predictions)
+
+        Participant.objects.bulk_update(participants, ['score', 'margin_per_match'],
+                                        batch_size=BATCH_SIZE)
+        return n_predictions
+
+    def set_totals(self, predictor, predictions):
+        # same sums as Predictor.update_score
+        margins = [p.margin for p in predictions if p.margin is not None]
+        if not margins:
+            return
+        predictor.score = sum(p.score for p in predictions if p.score is not None)
+        predictor.margin_per_match = sum(margins) / len(margins)
+
+    def create_benchmarks(self, tourn, matches, n_benchmarks):
+        kinds = [
+            dict(name="Zero", prediction_algorithm=Benchmark.STATIC, static_value=0),
+            dict(name="Mean", prediction_algorithm=Benchmark.MEAN),
+            dict(name="Median", prediction_algorithm=Benchmark.MEDIAN),
+            dict(name="Random", prediction_algorithm=Benchmark.RANDOM,
+                 range_start=-10, range_end=10),
+        ]
+        Benchmark.objects.bulk_create([
+            Benchmark(tournament=tourn, **kinds[i % len(kinds)]) for i in range(n_benchmarks)
+        ])
+
+        benchmarks = list(tourn.benchmark_set.all())
+        played = [match for match in matches if match.score is not None]
+        for benchmark in benchmarks:
+            predictions = []
+            for match in played:
+                prediction = BenchmarkPrediction(benchmark=benchmark, match=match,
+                                                 prediction=self.benchmark_value(benchmark, match))
+                prediction.calc_score(match.score)
+                predictions.append(prediction)
+            BenchmarkPrediction.objects.bulk_create(predictions, batch_size=BATCH_SIZE)
+            self.set_totals(benchmark, predictions)
+
+        Benchmark.objects.bulk_update(benchmarks, ['score', 'margin_per_match'])
+
+    def benchmark_value(self, benchmark, match):
+        values = self.match_predictions[match.pk]
+        if benchmark.prediction_algorithm == Benchmark.STATIC:
+            return benchmark.static_value
+        if benchmark.prediction_algorithm == Benchmark.RANDOM:
+            return self.rng.randint(benchmark.range_start, benchmark.range_end)
+        if not values:
+            return 0
+        if benchmark.prediction_algorithm == Benchmark.MEAN:
+            mean = Decimal(statistics.mean(values))
+            return 0 if abs(mean) < 0.5 else mean.quantize(Decimal('0.01'))
+        return Decimal(statistics.median(values))
+
+    def create_organisations(self, tourn, participants, n_organisations):
+        through = Competition.participants.through
+        members = []
+        for i in range(1, n_organisations + 1):
+            org, _ = Organisation.objects.get_or_create(name=("%s org %d" % (tourn.name, i))[:50])
+            comp = Competition.objects.create(organisation=org, tournament=tourn)
+            size = max(1, len(participants) // (n_organisations + 1))
+            for participant in self.rng.sample(participants, min(size, len(participants))):
+                members.append(through(competition_id=comp.pk, participant_id=participant.pk))
+        through.objects.bulk_create(members, batch_size=BATCH_SIZE)
+        for comp in Competition.objects.filter(tournament=tourn):
+            comp.update_standings()
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from competition.models import Tournament
+from competition.results import FeedError, read_feed, diff_results, apply_results
+
+
+class Command(BaseCommand):
+    help = "Apply the results in a CSV or JSON feed file to a tournament. Only the scores " \
+           "that differ from the stored ones are written, so the same feed can be run repeatedly."
+
+    def add_arguments(self, parser):
+        parser.add_argument('tournament', help="slug of the tournament")
+        parser.add_argument('feed', help="path of the results file")
+        parser.add_argument('--format', choices=['csv', 'json'],
+                            help="format of the feed, by default from the file extension")
+        parser.add_argument('--ignore-case', action='store_true',
+                            help="match team names ignoring case")
+        parser.add_argument('--fuzzy', action='store_true', help="accept a single close team name")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="show the changes without saving them")
+
+    def handle(self, *args, **options):
+        try:
+            tournament = Tournament.objects.get(slug=options['tournament'])
+        except Tournament.DoesNotExist:
+            raise CommandError("Tournament %s does not exist" % options['tournament'])
+
+        try:
+            rows = read_feed(options['feed'], options['format'])
+        except (OSError, ValueError, FeedError) as e:
+            raise CommandError("Can't read %s: %s" % (options['feed'], e))
+
+        changes, errors = diff_results(tournament, rows, options['ignore_case'], options['fuzzy'])
+        for number, error in errors:
+            self.stderr.write("row %d: %s" % (number, error))
+        for match, score in changes:
+            self.stdout.write("%s: %s -> %s" % (match, match.score, score))
+
+        if not options['dry_run']:
+            apply_results(tournament, changes)
+        self.stdout.write("%d results changed, %d rows rejected" % (len(changes), len(errors)))
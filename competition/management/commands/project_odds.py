@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from competition.models import Tournament
+from competition.projection import project
+import os
+
+
+class Command(BaseCommand):
+    help = "Simulate the remaining matches of active tournaments and cache each participant's " \
+           "chance of winning, shown on the table page. Run it from cron after results come in."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tournament', help="slug of the tournament (default all active)")
+        parser.add_argument('--simulations', type=int, default=2000)
+        parser.add_argument('--top', type=int, default=3, help="also count finishes in the top N")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="number of processes to simulate with")
+        parser.add_argument('--seed', type=int)
+
+    def handle(self, *args, **options):
+        if options['tournament']:
+            tournaments = Tournament.objects.filter(slug=options['tournament'])
+            if not tournaments:
+                raise CommandError("Tournament %s does not exist" % options['tournament'])
+        else:
+            tournaments = Tournament.objects.filter(state=Tournament.ACTIVE)
+
+        for tournament in tournaments:
+            projection = project(tournament, options['simulations'], options['top'],
+                                 options['workers'], options['seed'])
+            if projection is None:
+                self.stdout.write("%s has no participants" % tournament)
+                continue
+            self.stdout.write("%s: %d simulations of %d remaining matches"
+                              % (tournament, projection['simulations'], projection['remaining']))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+import datetime
+from competition.models import Tournament
+from competition.reconcile import read_fixtures, plan_fixtures, apply_plan
+
+
+class Command(BaseCommand):
+    help = "Update a tournament's matches from a new fixture CSV: kick off changes, " \
+           "postponements and new matches. Matches are never deleted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('tournament', help="slug of the tournament")
+        parser.add_argument('fixtures', help="path of the fixture CSV")
+        parser.add_argument('--window', type=int, default=7,
+                            help="days either side of a row's kick off to look for a match between "
+                                 "the same teams when the row has no match_id")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="show the changes without saving them")
+
+    def handle(self, *args, **options):
+        try:
+            tournament = Tournament.objects.get(slug=options['tournament'])
+        except Tournament.DoesNotExist:
+            raise CommandError("Tournament %s does not exist" % options['tournament'])
+
+        try:
+            rows = read_fixtures(options['fixtures'])
+        except (OSError, ValueError) as e:
+            raise CommandError("Can't read %s: %s" % (options['fixtures'], e))
+
+        plan = plan_fixtures(tournament, rows, datetime.timedelta(days=options['window']))
+        for number, error in plan.errors:
+            self.stderr.write("row %d: %s" % (number, error))
+        for match, kick_off in plan.rescheduled:
+            postponed = " (postponed)" if match.postponed else ""
+            self.stdout.write("%d %s: %s -> %s%s" % (match.match_id, match, kick_off,
+                                                     match.kick_off, postponed))
+        for match in plan.postponed:
+            self.stdout.write("%d %s: postponed" % (match.match_id, match))
+        for match in plan.new:
+            self.stdout.write("%d: new match at %s" % (match.match_id, match.kick_off))
+
+        if not options['dry_run']:
+            apply_plan(tournament, plan)
+        self.stdout.write("%d rescheduled, %d postponed, %d new, %d unchanged, %d rows rejected"
+                          % (len(plan.rescheduled), len(plan.postponed), len(plan.new),
+                             plan.unchanged, len(plan.errors)))
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand
+import datetime
+import logging
+import time
+from competition import scheduler
+
+g_logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Open, score and close tournaments when due, rebuild tables and send queued emails. " \
+           "Runs until stopped unless --once is given; only one runner acts at a time."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="run the due steps once and exit")
+        parser.add_argument('--interval', type=int, default=60, help="seconds between runs")
+        parser.add_argument('--rebuild-every', type=int, default=15,
+                            help="minutes between table rebuilds of the active tournaments")
+        parser.add_argument('--lease', type=int,
+                            help="minutes a runner holds the lease for, which must be longer "
+                                 "than its longest step (default the longer of 5 minutes and "
+                                 "3 intervals)")
+
+    def handle(self, *args, **options):
+        owner = scheduler.owner_name()
+        interval = options['interval']
+        rebuild_every = datetime.timedelta(minutes=options['rebuild_every'])
+        if options['lease']:
+            lease = datetime.timedelta(minutes=options['lease'])
+        else:
+            # a runner that stops renewing is taken over after missing a few runs
+            lease = max(scheduler.LEASE_DURATION, datetime.timedelta(seconds=3 * interval))
+        last_rebuild = None
+
+        try:
+            while True:
+                started = datetime.datetime.now()
+                rebuild = last_rebuild is None or started - last_rebuild >= rebuild_every
+                done = self.run(owner, rebuild, lease, options['once'])
+                if done is not None and 'rebuilt' in done:
+                    last_rebuild = started
+                self.report(started, done, options['once'])
+
+                if options['once']:
+                    break
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            scheduler.release(owner)
+
+    def run(self, owner, rebuild, lease, once):
+        try:
+            return scheduler.run_once(owner, rebuild=rebuild, lease=lease)
+        except Exception:
+            if once:
+                raise
+            g_logger.exception("run_scheduler step failed")
+            return None
+
+    def report(self, started, done, once):
+        if done is None:
+            self.stdout.write("Another runner holds the scheduler lease")
+            return
+        work = ", ".join("%s: %d" % item for item in done.items() if item[1])
+        if work or once:
+            self.stdout.write("%s %s" % (started.strftime('%Y-%m-%d %H:%M:%S'),
+                                         work or "nothing due"))
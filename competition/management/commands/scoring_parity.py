@@ -0,0 +1,53 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from competition.models import Tournament
+from competition.parity import run, snapshot, differences
+from io import StringIO
+
+
+class Command(BaseCommand):
+    help = "Check that every scoring path gives the same results as the reference path on " \
+           "randomly generated tournaments, and show how long each takes. Nothing is saved."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seeds', type=int, default=3,
+                            help="number of tournaments to generate")
+        parser.add_argument('--first-seed', type=int, default=1)
+        parser.add_argument('--participants', type=int, default=50)
+        parser.add_argument('--benchmarks', type=int, default=4)
+        parser.add_argument('--played', type=float, default=0.5)
+
+    def handle(self, *args, **options):
+        failed = False
+        for seed in range(options['first_seed'], options['first_seed'] + options['seeds']):
+            with transaction.atomic():
+                name = "Parity %d" % seed
+                call_command('generate_tournament', seed=seed, name=name,
+                             participants=options['participants'], benchmarks=options['benchmarks'],
+                             organisations=0, played=options['played'], stdout=StringIO())
+                tournament = Tournament.objects.get(name=name)
+                generated = snapshot(tournament)
+
+                results = run(tournament)
+                diffs = differences(snapshot(tournament), generated)
+                self.report(seed, 'generator', None, None, diffs)
+                failed |= bool(diffs)
+
+                reference = results['reference'][0]
+                for path, (seconds, diffs) in sorted(results.items()):
+                    self.report(seed, path, seconds, reference, diffs)
+                    failed |= bool(diffs)
+                transaction.set_rollback(True)
+
+        if failed:
+            raise CommandError("Scoring paths do not match the reference path")
+
+    def report(self, seed, path, seconds, reference, diffs):
+        if seconds is None:
+            timing = ""
+        else:
+            timing = "%8.3fs %7.1fx" % (seconds, reference / seconds if seconds else 0)
+        self.stdout.write("seed %-4d %-12s %s  %d differences" % (seed, path, timing, len(diffs)))
+        for section, key, expected, actual in diffs[:10]:
+            self.stdout.write("    %s %s: expected %s got %s" % (section, key, expected, actual))
@@ -0,0 +1,47 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+from competition.models import Tournament
+from competition.reports import top_predictors, write_csv
+
+
+class Command(BaseCommand):
+    help = "Write the top predictors over a set of a tournament's matches as CSV, " \
+           "e.g. for posting a round's or a week's best scores."
+
+    def add_arguments(self, parser):
+        parser.add_argument('tournament', help="slug of the tournament")
+        parser.add_argument('--top', type=int, default=10)
+        parser.add_argument('--first', type=int, help="first match_id of the round")
+        parser.add_argument('--last', type=int, help="last match_id of the round")
+        parser.add_argument('--start', help="only matches kicking off at or after this date time")
+        parser.add_argument('--end', help="only matches kicking off before this date time")
+        parser.add_argument('--competition', type=int,
+                            help="pk of an organisation's competition to limit the users to")
+        parser.add_argument('--provider',
+                            help="social provider used for social names, e.g. twitter")
+
+    def handle(self, *args, **options):
+        try:
+            tournament = Tournament.objects.get(slug=options['tournament'])
+        except Tournament.DoesNotExist:
+            raise CommandError("Tournament %s does not exist" % options['tournament'])
+
+        matches = tournament.match_set.all()
+        if options['first'] is not None:
+            matches = matches.filter(match_id__gte=options['first'])
+        if options['last'] is not None:
+            matches = matches.filter(match_id__lte=options['last'])
+        for option, lookup in (('start', 'kick_off__gte'), ('end', 'kick_off__lt')):
+            if options[option]:
+                when = parse_datetime(options[option])
+                if when is None:
+                    raise CommandError("Invalid --%s %s" % (option, options[option]))
+                matches = matches.filter(**{lookup: when})
+
+        users = None
+        if options['competition'] is not None:
+            users = User.objects.filter(participant__competition=options['competition'],
+                                        participant__tournament=tournament)
+
+        write_csv(top_predictors(matches, options['top'], options['provider'], users), self.stdout)
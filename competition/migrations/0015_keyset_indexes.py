@@ -0,0 +1,21 @@
+# Generated by Django 3.2.24 on 2026-10-19 11:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('competition', '0014_alter_tournament_year'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='participant',
+            index=models.Index(fields=['tournament', 'score'], name='competition_tournam_3317da_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prediction',
+            index=models.Index(fields=['match', 'score'], name='competition_match_i_d21867_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.24 on 2026-10-19 12:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('competition', '0015_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='participant',
+            name='display_name',
+            field=models.CharField(blank=True, editable=False, max_length=301),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.2.24 on 2026-10-19 12:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('competition', '0016_participant_display_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchedulerLease',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('owner', models.CharField(max_length=100)),
+                ('expires', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='tournament',
+            name='close_at',
+            field=models.DateTimeField(blank=True, help_text='When run_scheduler closes the tournament, if active', null=True),
+        ),
+        migrations.AddField(
+            model_name='tournament',
+            name='open_at',
+            field=models.DateTimeField(blank=True, help_text='When run_scheduler opens the tournament, if pending', null=True),
+        ),
+        migrations.CreateModel(
+            name='OutboxEmail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=200)),
+                ('message', models.TextField()),
+                ('new_comp', models.BooleanField(default=False)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('sent', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
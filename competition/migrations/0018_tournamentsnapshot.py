@@ -0,0 +1,24 @@
+# Generated by Django 3.2.24 on 2026-10-19 12:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('competition', '0017_scheduler'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TournamentSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('data', models.BinaryField()),
+                ('pruned', models.BooleanField(default=False, help_text='The raw predictions have been deleted')),
+                ('tournament', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='snapshot', to='competition.tournament')),
+            ],
+        ),
+    ]
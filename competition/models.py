@@ -1,10 +1,13 @@
 from django.db import models, IntegrityError, transaction
-from django.db.models import Avg, Max, Q
+from django.db.models import Avg, Count, Max, Q, Sum
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.contrib import messages
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.sites.shortcuts import get_current_site
 from django.core import mail
-from django.core.exceptions import ValidationError
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.urls import reverse
 from django.template.defaultfilters import slugify
 from django.template.loader import render_to_string
@@ -18,6 +21,11 @@ import datetime
 import random
 from decimal import Decimal
 import statistics
+from .cache import bump_match, bump_schedule, bump_sport, bump_user
+from .cache import bump_tournament, bump_tournament_list
+from .signals import table_updated
+from .scoring import CENTS, prediction_outcome, prediction_score, match_bonus
+from . import teams
 
 g_logger = logging.getLogger(__name__)
 
@@ -62,12 +70,8 @@ class Sport(models.Model):
             except IntegrityError as e:
                 g_logger.error(f"Failed to add team({row['name']}, {row['code']}) -- {e}")
 
-    def find_team(self, name):
-        return self.team_set.get(Q(name=name)|
-                                 Q(code=name)|
-                                 Q(short_name=name)|
-                                 Q(full_name=name)|
-                                 Q(alt_name=name))
+    def find_team(self, name, ignore_case=False, fuzzy=False):
+        return teams.find_team(self, name, ignore_case=ignore_case, fuzzy=fuzzy)
 
 
 class Team(models.Model):
@@ -85,28 +89,30 @@ class Team(models.Model):
 
         super().validate_unique(exclude)
 
-        def add_name_query(name):
-            return Q(name=name)| Q(code=name)| Q(short_name=name)| Q(full_name=name)| Q(alt_name=name)
-
         name_checks = [
                 ('name', self.name, False),
                 ('short_name', self.short_name, True),
                 ('full_name', self.full_name, True),
                 ('alt_name', self.alt_name, True)]
+        names = [name for _, name, optional in name_checks if not (optional and name is None)]
+
+        # every name used by another team that clashes with one of ours
+        q = Q()
+        for field in teams.NAME_FIELDS:
+            q |= Q(**{field + '__in': names})
+        qs = Team.objects.filter(q, sport_id=self.sport_id)
+        if not self._state.adding and self.pk is not None:
+            qs = qs.exclude(pk=self.pk)
+        taken = set()
+        for row in qs.values_list(*teams.NAME_FIELDS):
+            taken.update(row)
 
         errors = {}
         for field_name, name, optional in name_checks:
             if optional and name is None:
                 continue
 
-            q = Q(name=name)| Q(code=name)| Q(short_name=name)| Q(full_name=name)| Q(alt_name=name)
-
-            qs = self.sport.team_set.filter(q)
-
-            if not self._state.adding and self.pk is not None:
-                qs = qs.exclude(pk=self.pk)
-
-            if qs.exists():
+            if name in taken:
                 opts = self._meta
                 params = {
                         'model': self,
@@ -129,6 +135,38 @@ class Team(models.Model):
         if errors:
             raise ValidationError(errors)
 
+    def _merge_matches(self, others):
+        return Match.objects.filter(Q(home_team__in=others) | Q(away_team__in=others))
+
+    def merge_preview(self, merged):
+        """Counts of what merging the merged teams into this team would change"""
+        others = [team.pk for team in merged]
+        counts = self._merge_matches(others).aggregate(
+            matches=Count('pk'),
+            tournaments=Count('tournament', distinct=True),
+            # fixtures between the merged teams end up as this team playing itself
+            same_team=Count('pk', filter=(Q(home_team=self) | Q(home_team__in=others)) &
+                                         (Q(away_team=self) | Q(away_team__in=others))))
+        # undecided matches that show the merged teams through a winner_of placeholder
+        involved = self._merge_matches(others).values('pk')
+        counts['placeholders'] = Match.objects.filter(
+            Q(home_team_winner_of__in=involved) | Q(away_team_winner_of__in=involved)).count()
+        return counts
+
+    def merge(self, merged):
+        """Move every match of the merged teams to this team and delete them
+
+        Returns [(match_pk, tournament_pk)] of the matches changed."""
+        others = [team.pk for team in merged if team.pk != self.pk]
+        with transaction.atomic():
+            changed = list(self._merge_matches(others).values_list('pk', 'tournament_id'))
+            Match.objects.filter(home_team__in=others).update(home_team=self)
+            Match.objects.filter(away_team__in=others).update(away_team=self)
+            Team.objects.filter(pk__in=others).delete()
+        g_logger.info("merged %d teams into %s, %d matches changed",
+                      len(others), self, len(changed))
+        return changed
+
     class Meta:
         unique_together = (('code', 'sport'),
                            ('name', 'sport'),
@@ -161,6 +199,10 @@ class Tournament(models.Model):
                                related_name='+')
     add_matches = models.FileField(null=True, blank=True)
     year = models.IntegerField(choices=YEAR_CHOICES, default=current_year)
+    open_at = models.DateTimeField(null=True, blank=True,
+                                   help_text="When run_scheduler opens the tournament, if pending")
+    close_at = models.DateTimeField(null=True, blank=True,
+                                    help_text="When run_scheduler closes the tournament, if active")
     test_features_enabled = models.BooleanField(default=False)
     draw_definition = models.CharField(
             max_length=20,
@@ -189,6 +231,9 @@ class Tournament(models.Model):
         for benchmark in self.benchmark_set.all():
             benchmark.update_score()
 
+        table_updated.send(sender=Tournament, tournament=self)
+        bump_tournament(self.pk)
+
     def check_predictions(self, match):
         g_logger.debug("%s: update_scores for %s", self, match)
 
@@ -200,72 +245,149 @@ class Tournament(models.Model):
 
         self.update_table()
 
-    def find_team(self, name):
-        return self.sport.find_team(name)
+    def score_matches(self, matches):
+        """check_predictions for several matches with a few bulk queries
 
-    def close(self, request):
-        if self.state != Tournament.ACTIVE:
+        Every participant and benchmark gets a scored prediction for each
+        played match, missing ones being predicted as check_prediction would."""
+        matches = [match for match in matches if match.score is not None]
+        if not matches:
             return
-        self.update_table()
-        self.winner = Participant.objects.filter(tournament=self).order_by("score")[0]
-        self.state = Tournament.FINISHED
-
-        current_site = get_current_site(request)
-        subject = "Thank you for participating in %s" % self.name
-
-        n_sent = 0
-        connection = mail.get_connection()
-        connection.open()
-        for user in self.participants.all():
-            message = render_to_string('close_email.html', {
-                'user': user,
-                'winner': self.winner.user.profile.get_name(),
-                'winner_score': "%.2f" % self.winner.score,
-                'tournament_name': self.name,
-                'site_name': current_site.name,
-            })
-            if user.profile.email_user(subject,
-                                       message,
-                                       connection=connection):
-                n_sent += 1
-
-        connection.close()
-        messages.success(request,
-                         'The tournament "%s" was closed successfully, %d emails sent.' % (self.name, n_sent))
-
-        self.save()
-
-    def open(self, request):
-        if self.state != Tournament.PENDING:
-            g_logger.error("can only open tournaments that are pending")
-            return
-        self.state = Tournament.ACTIVE
-
-        current_site = get_current_site(request)
-        subject = "A new competition has started"
-
-        n_sent = 0
-        connection = mail.get_connection()
-        connection.open()
-        for user in User.objects.all():
-            message = render_to_string('open_email.html', {
-                'user': user,
-                'tournament': self,
-                'site_name': current_site.name,
-                'site_domain': current_site.name,
-                'protocol': 'https' if request.is_secure() else 'http',
-            })
-            if user.profile.email_user(subject,
-                                       message,
-                                       new_comp=True,
-                                       connection=connection):
-                n_sent += 1
-
-        connection.close()
-        messages.success(request,
-                         'The tournament "%s" was opened successfully, %d emails sent.' % (self.name, n_sent))
-
-        self.save()
+        g_logger.debug("%s: score_matches for %d matches", self, len(matches))
+        for match in matches:
+            match.tournament = self
+        participants = list(self.participant_set.all())
+        benchmarks = {b.pk: b for b in self.benchmark_set.all()}
+
+        predictions = {(p.match_id, p.user_id): p
+                       for p in Prediction.objects.filter(match__in=matches)}
+        benchmark_predictions = {(p.match_id, p.benchmark_id): p for p in
+                                 BenchmarkPrediction.objects.filter(match__in=matches)}
+        scored = {Prediction: [], BenchmarkPrediction: []}
+        for match in matches:
+            for participant in participants:
+                key = (match.pk, participant.user_id)
+                prediction = predictions.get(key) or participant.predict(match)
+                prediction.match = match
+                scored[Prediction].append(prediction)
+            for benchmark in benchmarks.values():
+                key = (match.pk, benchmark.pk)
+                prediction = benchmark_predictions.get(key) or benchmark.predict(match)
+                prediction.match, prediction.benchmark = match, benchmark
+                scored[BenchmarkPrediction].append(prediction)
+
+        with transaction.atomic():
+            for model, rows in scored.items():
+                for prediction in rows:
+                    prediction.calc_score(prediction.match.score)
+                model.objects.bulk_update([p for p in rows if p.pk is not None],
+                                          ['score', 'margin', 'correct'], batch_size=500)
+                # a runner scoring the same matches meanwhile creates the same predictions
+                model.objects.bulk_create([p for p in rows if p.pk is None], batch_size=500,
+                                          ignore_conflicts=True)
+
+        for match in matches:
+            bump_match(match.pk)
+        self.update_totals()
+
+    def update_totals(self):
+        """update_table with one grouped query per kind of predictor
+
+        Only the predictors whose score or margin_per_match changed are written."""
+        g_logger.debug("%s update_totals" % self)
+        for predictors, predictions, key in (
+                (self.participant_set.all(), Prediction, lambda p: p.user_id),
+                (self.benchmark_set.all(), BenchmarkPrediction, lambda p: p.pk)):
+            group = 'user' if predictions is Prediction else 'benchmark'
+            totals = {row[group]: row for row in predictions.objects.filter(
+                match__tournament=self).order_by().values(group).annotate(
+                total=Sum('score'), total_margin=Sum('margin'), count=Count('margin'))}
+
+            changed = []
+            for predictor in predictors:
+                row = totals.get(key(predictor))
+                if not row or not row['count']:
+                    continue
+                score = Decimal(row['total'] or 0).quantize(CENTS)
+                margin_per_match = (Decimal(row['total_margin']) / row['count']).quantize(CENTS)
+                if (predictor.score, predictor.margin_per_match) != (score, margin_per_match):
+                    predictor.score, predictor.margin_per_match = score, margin_per_match
+                    changed.append(predictor)
+            if changed:
+                predictors.model.objects.bulk_update(changed, ['score', 'margin_per_match'])
+
+        table_updated.send(sender=Tournament, tournament=self)
+        bump_tournament(self.pk)
+
+    def find_team(self, name, ignore_case=False, fuzzy=False):
+        return self.sport.find_team(name, ignore_case=ignore_case, fuzzy=fuzzy)
+
+    def close(self, request=None):
+        from .snapshot import take_snapshot
+        with transaction.atomic():
+            # claimed with a conditional UPDATE, so that of several runners closing
+            # the tournament at once only one closes it and emails the participants
+            if not Tournament.objects.filter(pk=self.pk, state=Tournament.ACTIVE).update(
+                    state=Tournament.FINISHED):
+                return
+            self.update_table()
+            self.winner = Participant.objects.filter(tournament=self).order_by("score")[0]
+            self.state = Tournament.FINISHED
+
+            current_site = get_current_site(request)
+            subject = "Thank you for participating in %s" % self.name
+
+            emails = []
+            for user in self.participants.all():
+                emails.append((user, render_to_string('close_email.html', {
+                    'user': user,
+                    'winner': self.winner.get_name(),
+                    'winner_score': "%.2f" % self.winner.score,
+                    'tournament_name': self.name,
+                    'site_name': current_site.name,
+                })))
+            n_sent = email_users(subject, emails)
+
+            # the final standings and predictions, which the views of the finished
+            # tournament serve
+            self.save()
+            take_snapshot(self)
+        bump_tournament(self.pk)
+
+        if request is not None:
+            messages.success(request, 'The tournament "%s" was closed successfully, %d emails %s.'
+                             % (self.name, n_sent, 'queued' if settings.DEFER_EMAILS else 'sent'))
+        g_logger.info("%s closed, %d emails", self, n_sent)
+
+    def open(self, request=None):
+        with transaction.atomic():
+            # claimed as in close, so that the users are emailed once
+            if not Tournament.objects.filter(pk=self.pk, state=Tournament.PENDING).update(
+                    state=Tournament.ACTIVE):
+                g_logger.error("can only open tournaments that are pending")
+                return
+            self.state = Tournament.ACTIVE
+
+            current_site = get_current_site(request)
+            subject = "A new competition has started"
+
+            emails = []
+            for user in User.objects.all():
+                emails.append((user, render_to_string('open_email.html', {
+                    'user': user,
+                    'tournament': self,
+                    'site_name': current_site.name,
+                    'site_domain': current_site.name,
+                    'protocol': ('http' if request is not None and not request.is_secure()
+                                 else 'https'),
+                })))
+            n_sent = email_users(subject, emails, new_comp=True)
+            self.save()
+
+        if request is not None:
+            messages.success(request, 'The tournament "%s" was opened successfully, %d emails %s.'
+                             % (self.name, n_sent, 'queued' if settings.DEFER_EMAILS else 'sent'))
+        g_logger.info("%s opened, %d emails", self, n_sent)
 
     def save(self, *args, **kwargs):
         csv_file = self.add_matches
@@ -276,6 +398,10 @@ class Tournament(models.Model):
 
         super(Tournament, self).save(*args, **kwargs)
 
+        bump_tournament(self.pk)
+        bump_tournament_list()
+        bump_schedule()
+
         if csv_file:
             self.handle_match_upload(csv_file)
 
@@ -385,12 +511,27 @@ class Predictor(models.Model):
 
 class Participant(Predictor):
     user = models.ForeignKey(User, models.CASCADE)
+    # a copy of the user's Profile.display_name, kept up to date by Profile.save
+    display_name = models.CharField(max_length=301, blank=True, editable=False)
 
     def __str__(self):
         return "%s:%s" % (self.tournament, self.user)
 
+    def save(self, *args, **kwargs):
+        if not self.display_name:
+            self.display_name = self.profile_name()
+        super().save(*args, **kwargs)
+
+    def profile_name(self):
+        try:
+            profile = self.user.profile
+        except ObjectDoesNotExist:
+            # users created without a Profile, e.g. directly or by older data
+            return self.user.username
+        return profile.display_name or profile.get_name()
+
     def get_name(self):
-        return self.user.profile.get_name()
+        return self.display_name or self.profile_name()
 
     def predict(self, match):
         return Prediction(user=self.user, match=match, late=True)
@@ -412,6 +553,36 @@ class Participant(Predictor):
 
     class Meta:
         unique_together = ('tournament', 'user',)
+        indexes = [models.Index(fields=['tournament', 'score'])]
+
+
+class MatchQuerySet(models.QuerySet):
+    def swap_home_and_away(self):
+        """Swap the teams of the matches, negating results and predictions
+
+        Played matches are re-scored and their tournaments' tables updated in
+        the same transaction."""
+        pks = list(self.values_list('pk', flat=True))
+        with transaction.atomic():
+            matches = Match.objects.filter(pk__in=pks)
+            matches.update(home_team=models.F('away_team'),
+                           away_team=models.F('home_team'),
+                           home_team_winner_of=models.F('away_team_winner_of'),
+                           away_team_winner_of=models.F('home_team_winner_of'),
+                           score=models.F('score') * -1)
+            for model in (Prediction, BenchmarkPrediction):
+                model.objects.filter(match__in=pks).update(prediction=models.F('prediction') * -1)
+
+            played = {}
+            for match in matches.filter(score__isnull=False).select_related('tournament'):
+                played.setdefault(match.tournament, []).append(match)
+            for tournament, tournament_matches in played.items():
+                tournament.score_matches(tournament_matches)
+
+        for match_pk, tournament_pk in matches.values_list('pk', 'tournament'):
+            bump_match(match_pk)
+            bump_tournament(tournament_pk)
+        return len(pks)
 
 
 class Match(models.Model):
@@ -441,6 +612,8 @@ class Match(models.Model):
     score = models.IntegerField(blank=True, null=True)
     postponed = models.BooleanField(blank=True, default=False)
 
+    objects = MatchQuerySet.as_manager()
+
     def __str__(self):
         s = ''
         if not self.home_team:
@@ -512,6 +685,10 @@ class Match(models.Model):
             g_logger.debug("checking for next round matches: %s", self)
             self.check_next_round_matches()
 
+        bump_match(self.pk)
+        bump_tournament(self.tournament_id)
+        bump_schedule()
+
     class Meta:
         unique_together = ('tournament', 'match_id',)
         verbose_name_plural = "matches"
@@ -525,21 +702,12 @@ class PredictionBase(models.Model):
     correct = models.BooleanField(null=True)
 
     def calc_score(self, result):
-        self.margin = abs(result - self.prediction)
-        if self.prediction == result:
-            self.score = -self.bonus(result)
-            self.correct = True
-        elif (self.prediction < 0 and result < 0) or (self.prediction > 0 and result > 0):
-            self.score = self.margin - self.bonus(result)
-            self.correct = True
-        else:
-            self.score = self.margin
-            self.correct = False
+        self.margin, self.correct = prediction_outcome(self.prediction, result)
+        self.score = prediction_score(self.margin, self.correct,
+                                      self.bonus(result) if self.correct else 0)
 
     def bonus(self, result):
-        if result == 0:  # draw
-            return self.match.tournament.bonus * self.match.tournament.draw_bonus
-        return self.match.tournament.bonus
+        return match_bonus(result, self.match.tournament.bonus, self.match.tournament.draw_bonus)
 
     def get_predictor(self):
         raise NotImplementedError("%s didn't override get_predictor" % self.__class__)
@@ -571,6 +739,22 @@ class Prediction(PredictionBase):
     def get_predictor(self):
         return self.match.tournament.participant_set.get(user=self.user)
 
+    def save_before_kick_off(self):
+        """Save unless the match has kicked off, returns whether it was saved
+
+        The kick off is checked after the write in the same transaction, so a
+        prediction that passes was written before the match started."""
+        adding = self._state.adding
+        with transaction.atomic():
+            self.save()
+            if Match.objects.filter(pk=self.match_id, kick_off__gt=timezone.now()).exists():
+                return True
+            transaction.set_rollback(True)
+        if adding:
+            self.pk = None
+            self._state.adding = True
+        return False
+
     def css_class_correct(self):
         if self.late:
             return "prediction_missed"
@@ -579,6 +763,7 @@ class Prediction(PredictionBase):
     class Meta:
         unique_together = ('user', 'match',)
         ordering = ['-match__kick_off', '-match__match_id']
+        indexes = [models.Index(fields=['match', 'score'])]
 
 
 class Benchmark(Predictor):
@@ -699,3 +884,158 @@ class BenchmarkPrediction(PredictionBase):
         unique_together = ('benchmark', 'match',)
         ordering = ['-match__kick_off', '-match__match_id']
 
+
+class TournamentSnapshot(models.Model):
+    """The final state of a closed tournament, see snapshot.py"""
+    tournament = models.OneToOneField(Tournament, models.CASCADE, related_name='snapshot')
+    created = models.DateTimeField(auto_now_add=True)
+    # zlib compressed JSON
+    data = models.BinaryField()
+    pruned = models.BooleanField(default=False,
+                                 help_text="The raw predictions have been deleted")
+
+    def __str__(self):
+        return "%s snapshot" % self.tournament
+
+
+# Emails to many users, e.g. when a tournament opens, are sent inline over one
+# connection unless settings.DEFER_EMAILS is set, in which case they are
+# queued as OutboxEmail rows and sent by run_scheduler (see scheduler.py).
+# Inside a transaction, e.g. closing a tournament, the rows are queued with it
+# and inline emails are only sent once it commits.
+
+def email_users(subject, emails, new_comp=False):
+    """Send or queue (user, message) pairs, returns the number sent or queued"""
+    if settings.DEFER_EMAILS:
+        OutboxEmail.objects.bulk_create([OutboxEmail(user=user, subject=subject, message=message,
+                                                     new_comp=new_comp)
+                                         for user, message in emails], batch_size=500)
+        return len(emails)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: send_emails(subject, emails, new_comp))
+        return len(emails)
+    return send_emails(subject, emails, new_comp)
+
+
+def send_emails(subject, emails, new_comp):
+    n_sent = 0
+    connection = mail.get_connection()
+    connection.open()
+    for user, message in emails:
+        if user.profile.email_user(subject, message, new_comp=new_comp, connection=connection):
+            n_sent += 1
+    connection.close()
+    return n_sent
+
+
+class OutboxEmailManager(models.Manager):
+    def send_pending(self, limit=500):
+        """Send up to limit queued emails, returns the number sent"""
+        pending = list(self.filter(sent__isnull=True).select_related('user__profile')
+                       .order_by('pk')[:limit])
+        if not pending:
+            return 0
+
+        n_sent = 0
+        connection = mail.get_connection()
+        connection.open()
+        try:
+            for email in pending:
+                # claimed before sending, so that an email is sent once when several
+                # runners send at once; emails the user does not accept are done with too
+                if not self.filter(pk=email.pk, sent__isnull=True).update(sent=timezone.now()):
+                    continue
+                try:
+                    if email.user.profile.email_user(email.subject, email.message,
+                                                     new_comp=email.new_comp,
+                                                     connection=connection):
+                        n_sent += 1
+                except Exception:
+                    self.filter(pk=email.pk).update(sent=None)
+                    raise
+        finally:
+            connection.close()
+        g_logger.debug("sent %d of %d queued emails", n_sent, len(pending))
+        return n_sent
+
+
+class OutboxEmail(models.Model):
+    user = models.ForeignKey(User, models.CASCADE)
+    subject = models.CharField(max_length=200)
+    message = models.TextField()
+    new_comp = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+    sent = models.DateTimeField(null=True, blank=True)
+
+    objects = OutboxEmailManager()
+
+    def __str__(self):
+        return "%s: %s" % (self.user, self.subject)
+
+
+class SchedulerLeaseManager(models.Manager):
+    def acquire(self, name, owner, duration):
+        """Take, or renew, the lease called name for owner until duration from now
+
+        Returns whether owner holds the lease. The row is taken with one
+        conditional UPDATE, so only one of several runners can succeed."""
+        now = timezone.now()
+        if self.filter(Q(owner=owner) | Q(expires__lte=now), name=name).update(
+                owner=owner, expires=now + duration):
+            return True
+        try:
+            with transaction.atomic():
+                self.create(name=name, owner=owner, expires=now + duration)
+            return True
+        except IntegrityError:
+            return False
+
+    def release(self, name, owner):
+        self.filter(name=name, owner=owner).update(expires=timezone.now())
+
+
+class SchedulerLease(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    owner = models.CharField(max_length=100)
+    expires = models.DateTimeField()
+
+    objects = SchedulerLeaseManager()
+
+    def __str__(self):
+        return "%s: %s until %s" % (self.name, self.owner, self.expires)
+
+
+@receiver(post_save, sender=Prediction)
+@receiver(post_delete, sender=Prediction)
+@receiver(post_save, sender=BenchmarkPrediction)
+@receiver(post_delete, sender=BenchmarkPrediction)
+def prediction_changed(sender, instance, **kwargs):
+    bump_match(instance.match_id)
+    if sender is Prediction:
+        bump_user(instance.user_id)
+
+
+@receiver(post_save, sender=Participant)
+@receiver(post_delete, sender=Participant)
+def participant_changed(sender, instance, created=True, **kwargs):
+    # the home page lists the matches of the tournaments the user is in
+    if created:
+        bump_user(instance.user_id)
+
+
+@receiver(post_delete, sender=Match)
+def match_deleted(sender, instance, **kwargs):
+    bump_schedule()
+
+
+@receiver(post_save, sender=Sport)
+@receiver(post_save, sender=Team)
+@receiver(post_delete, sender=Team)
+def team_changed(sender, instance, **kwargs):
+    bump_sport(instance.pk if sender is Sport else instance.sport_id)
+
+
+@receiver(post_delete, sender=Participant)
+@receiver(post_delete, sender=Benchmark)
+def predictor_deleted(sender, instance, **kwargs):
+    bump_tournament(instance.tournament_id)
@@ -0,0 +1,221 @@
+from django.db.models import F, Q
+import decimal
+import heapq
+import logging
+
+g_logger = logging.getLogger(__name__)
+
+CURSOR_SEP = '~'
+
+
+# Keyset (seek) pagination for leaderboard style lists. Rows are ordered on
+# (field, source, pk) with NULL values last, where source is the position of
+# the queryset in the list passed to the paginator so that several querysets
+# (e.g. participants and benchmarks) can be shown as one list. Each page is
+# fetched with a range query on the ordering key instead of an OFFSET so that
+# the last page is as cheap as the first.
+
+class KeysetPaginator:
+    def __init__(self, querysets, per_page, field='score', descending=False, count=None):
+        if not isinstance(querysets, (list, tuple)):
+            querysets = [querysets]
+        self.querysets = querysets
+        self.per_page = per_page
+        self.field = field
+        self.descending = descending
+        self._count = count
+        self._total = None
+
+    @property
+    def count(self):
+        if self._total is None:
+            if self._count is not None:
+                self._total = self._count()
+            else:
+                self._total = sum(qs.count() for qs in self.querysets)
+        return self._total
+
+    @property
+    def num_pages(self):
+        return max(1, -(-self.count // self.per_page))
+
+    def key(self, obj, source=0):
+        value = getattr(obj, self.field)
+        return (value is None, value, source, obj.pk)
+
+    def _sort_key(self, key):
+        is_null, value, source, pk = key
+        if is_null:
+            value = 0
+        if self.descending:
+            return (is_null, -value, -source, -pk)
+        return (is_null, value, source, pk)
+
+    def _order(self, forward):
+        field = F(self.field)
+        nulls = {'nulls_last': True} if forward else {'nulls_first': True}
+        if forward != self.descending:
+            return field.asc(**nulls), 'pk'
+        return field.desc(**nulls), '-pk'
+
+    def _tie(self, source, key, later):
+        _, _, key_source, key_pk = key
+        ascending = later != self.descending
+        if source == key_source:
+            return Q(pk__gt=key_pk) if ascending else Q(pk__lt=key_pk)
+        if (source > key_source) == ascending:
+            return Q()
+        return None
+
+    def _beyond(self, source, key, later):
+        # rows strictly after (or before) key in the display order
+        is_null, value, _, _ = key
+        tie = self._tie(source, key, later)
+        lookup = '%s__%s' % (self.field, 'gt' if later != self.descending else 'lt')
+        if later:
+            if is_null:
+                return None if tie is None else Q(**{self.field + '__isnull': True}) & tie
+            q = Q(**{lookup: value}) | Q(**{self.field + '__isnull': True})
+        else:
+            if is_null:
+                q = Q(**{self.field + '__isnull': False})
+                return q if tie is None else q | (Q(**{self.field + '__isnull': True}) & tie)
+            q = Q(**{lookup: value})
+        if tie is not None:
+            q |= Q(**{self.field: value}) & tie
+        return q
+
+    def _fetch(self, key, later, limit):
+        rows = []
+        for source, qs in enumerate(self.querysets):
+            if key is not None:
+                q = self._beyond(source, key, later)
+                if q is None:
+                    continue
+                qs = qs.filter(q)
+            qs = qs.order_by(*self._order(later))[:limit]
+            rows.append([(self._sort_key(self.key(obj, source)), obj) for obj in qs])
+        merged = heapq.merge(*rows, key=lambda row: row[0], reverse=not later)
+        return [obj for _, obj in merged][:limit]
+
+    def rank(self, obj, source=0):
+        """1-based position of obj; a single count per queryset."""
+        key = self.key(obj, source)
+        before = 0
+        for i, qs in enumerate(self.querysets):
+            q = self._beyond(i, key, later=False)
+            if q is not None:
+                before += qs.filter(q).count()
+        return before + 1
+
+    def parse_cursor(self, cursor):
+        try:
+            value, source, pk = cursor.split(CURSOR_SEP)
+            value = decimal.Decimal(value) if value else None
+            return (value is None, value, int(source), int(pk))
+        except (AttributeError, ValueError, decimal.InvalidOperation):
+            return None
+
+    def cursor(self, obj):
+        is_null, value, source, pk = self.key(obj, self._source(obj))
+        return CURSOR_SEP.join(['' if is_null else str(value), str(source), str(pk)])
+
+    def _source(self, obj):
+        for source, qs in enumerate(self.querysets):
+            if isinstance(obj, qs.model):
+                return source
+        return 0
+
+    def page(self, after=None, before=None):
+        after = self.parse_cursor(after) if after else None
+        before = self.parse_cursor(before) if before else None
+
+        if before is not None:
+            rows = self._fetch(before, later=False, limit=self.per_page + 1)
+            has_previous = len(rows) > self.per_page
+            rows = list(reversed(rows[:self.per_page]))
+            if not rows:
+                return self.page()
+            has_next = True
+        else:
+            rows = self._fetch(after, later=True, limit=self.per_page + 1)
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = after is not None
+        return KeysetPage(rows, self, has_previous, has_next)
+
+    def page_around(self, obj):
+        """The page with obj in the middle, used to jump to a user's position."""
+        source = self._source(obj)
+        # the row as the queryset gives it, with its annotations and related objects
+        obj = self.querysets[source].filter(pk=obj.pk).first() or obj
+        key = self.key(obj, source)
+        above = self._fetch(key, later=False, limit=self.per_page // 2 + 1)
+        has_previous = len(above) > self.per_page // 2
+        above = list(reversed(above[:self.per_page // 2]))
+        below = self._fetch(key, later=True, limit=self.per_page - len(above))
+        rows = above + [obj] + below
+        has_next = len(rows) > self.per_page
+        return KeysetPage(rows[:self.per_page], self, has_previous, has_next,
+                          start=self.rank(obj, source) - len(above))
+
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, has_previous, has_next, start=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_previous = has_previous
+        self._has_next = has_next
+        self._start = start
+
+    def __repr__(self):
+        return '<Page %s of %s>' % (self.number, self.paginator.num_pages)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def start_index(self):
+        if self._start is None:
+            if not self.object_list:
+                self._start = 0
+            elif not self._has_previous:
+                self._start = 1
+            else:
+                self._start = self.paginator.rank(self.object_list[0],
+                                                  self.paginator._source(self.object_list[0]))
+        return self._start
+
+    def end_index(self):
+        return self.start_index() + len(self) - 1
+
+    @property
+    def number(self):
+        return (max(self.start_index(), 1) - 1) // self.paginator.per_page + 1
+
+    @property
+    def cache_key(self):
+        # within one cache version the first row identifies the page
+        if not self.object_list:
+            return ''
+        first = self.object_list[0]
+        return '%s-%s' % (self.paginator._source(first), first.pk)
+
+    @property
+    def previous_cursor(self):
+        return self.paginator.cursor(self.object_list[0]) if self.object_list else None
+
+    @property
+    def next_cursor(self):
+        return self.paginator.cursor(self.object_list[-1]) if self.object_list else None
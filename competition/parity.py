@@ -0,0 +1,102 @@
+from decimal import Decimal
+import logging
+import time
+from .models import Prediction, BenchmarkPrediction, Participant, Benchmark
+from .scoring import CENTS
+from .simulation import Simulation
+
+g_logger = logging.getLogger(__name__)
+
+
+# Differential testing of scoring paths. The reference path is the per row
+# calc_score/update_score code run when a result is entered. Every other path
+# must produce the same score, margin and correct for each prediction and the
+# same score and margin_per_match for each predictor. A path is a function
+# taking the tournament and returning a snapshot of what it computed, a path
+# that only computes totals leaves 'predictions' out of its snapshot.
+
+def cents(value):
+    # the rounding applied when a DecimalField is saved
+    return None if value is None else Decimal(value).quantize(CENTS)
+
+
+def snapshot(tournament):
+    """The stored scores of tournament"""
+    predictions = {}
+    for model in (Prediction, BenchmarkPrediction):
+        for pk, score, margin, correct in model.objects.filter(
+                match__tournament=tournament).values_list('pk', 'score', 'margin', 'correct'):
+            predictions[(model.__name__, pk)] = (cents(score), cents(margin), correct)
+    predictors = {}
+    for model in (Participant, Benchmark):
+        for pk, score, margin_per_match in model.objects.filter(
+                tournament=tournament).values_list('pk', 'score', 'margin_per_match'):
+            predictors[(model.__name__, pk)] = (cents(score), cents(margin_per_match))
+    return {'predictions': predictions, 'predictors': predictors}
+
+
+def clear_scores(tournament):
+    """Forget every computed score so that a path has to work them out again"""
+    for model in (Prediction, BenchmarkPrediction):
+        model.objects.filter(match__tournament=tournament).update(score=None, margin=None,
+                                                                  correct=None)
+    for model in (Participant, Benchmark):
+        model.objects.filter(tournament=tournament).update(score=None, margin_per_match=None)
+
+
+def reference_path(tournament):
+    for match in tournament.match_set.filter(score__isnull=False).order_by('kick_off'):
+        tournament.check_predictions(match)
+    return snapshot(tournament)
+
+
+def simulation_path(tournament):
+    simulation = Simulation(tournament)
+    predictors = {}
+    for totals in simulation.totals:
+        predictor = totals.predictor
+        margin_per_match = totals.margin / totals.count if totals.count else None
+        predictors[(predictor.__class__.__name__, predictor.pk)] = (
+            cents(totals.score(tournament.bonus, tournament.draw_bonus)), cents(margin_per_match))
+    return {'predictors': predictors}
+
+
+def bulk_path(tournament):
+    tournament.score_matches(tournament.match_set.filter(score__isnull=False))
+    return snapshot(tournament)
+
+
+PATHS = {
+    'simulation': simulation_path,
+    'bulk': bulk_path,
+}
+
+
+def differences(expected, actual):
+    """[(section, key, expected, actual)] for every value that does not match"""
+    diffs = []
+    for section, values in actual.items():
+        for key in set(expected[section]) | set(values):
+            if expected[section].get(key) != values.get(key):
+                diffs.append((section, key, expected[section].get(key), values.get(key)))
+    return sorted(diffs, key=str)
+
+
+def run(tournament, paths=None):
+    """Run each of paths and the reference path against tournament
+
+    Returns {name: (seconds, differences)} including 'reference'. The
+    reference path runs last so that it leaves tournament scored."""
+    paths = PATHS if paths is None else paths
+
+    actual = {}
+    timings = {}
+    for name, path in list(paths.items()) + [('reference', reference_path)]:
+        clear_scores(tournament)
+        start = time.perf_counter()
+        actual[name] = path(tournament)
+        timings[name] = time.perf_counter() - start
+        g_logger.debug("%s: %s path took %.3fs", tournament, name, timings[name])
+
+    expected = actual['reference']
+    return {name: (timings[name], differences(expected, actual[name])) for name in actual}
@@ -0,0 +1,126 @@
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+from operator import add
+import logging
+import random
+import time
+from .cache import record, tournament_key
+from .scoring import prediction_outcome, prediction_score, match_bonus
+
+g_logger = logging.getLogger(__name__)
+
+PROJECTION_TIMEOUT = 7 * 24 * 60 * 60
+
+
+# Monte Carlo projection of the final table. Each remaining match is played
+# by drawing its result from the predictions made for it, every participant's
+# prediction for that match is scored and the table is ranked. A participant
+# without a prediction is scored as a late 0, as they would be if the match
+# were played now.
+#
+# For each match the score of every participant is worked out once for each
+# result that can be drawn, so a simulated match is a single addition of two
+# lists. Batches of simulations only use plain lists so that they can be run
+# in a process pool, this module only imports the models when loading for the
+# same reason.
+#
+# The projection is cached under the tournament's version as it was when the
+# simulation started, so a result or rescore since then drops it.
+
+def get_projection(tournament_pk):
+    # only the project_odds command computes projections, a miss is just counted
+    projection = cache.get(tournament_key(tournament_pk, 'projection'))
+    record('projection', hit=projection is not None)
+    return projection
+
+
+def match_outcomes(tournament, predictions, participants):
+    """The results that can be drawn for a match, with their weights and score lists
+
+    predictions maps user_id to (prediction, late) for the match"""
+    weights = Counter(round(prediction) for prediction, late in predictions.values() if not late)
+    if not weights:
+        weights = Counter([0])
+
+    results, result_weights, scores = [], [], []
+    for result, weight in sorted(weights.items()):
+        bonus = match_bonus(result, tournament.bonus, tournament.draw_bonus)
+        row = []
+        for participant in participants:
+            prediction, late = predictions.get(participant.user_id, (0, True))
+            margin, correct = prediction_outcome(prediction, result)
+            row.append(float(prediction_score(margin, correct, 0 if late else bonus)))
+        results.append(result)
+        result_weights.append(weight)
+        scores.append(row)
+    return results, result_weights, scores
+
+
+def simulate_batch(base, outcomes, simulations, top_n, seed):
+    """Win and top N counts per participant (in the order of base)"""
+    rng = random.Random(seed)
+    wins = [0] * len(base)
+    top = [0] * len(base)
+    positions = range(len(base))
+    for _ in range(simulations):
+        totals = base
+        for weights, scores in outcomes:
+            totals = list(map(add, totals, rng.choices(scores, weights)[0]))
+        # ties go to the participant that is first in the table now
+        order = sorted(positions, key=totals.__getitem__)
+        wins[order[0]] += 1
+        for i in order[:top_n]:
+            top[i] += 1
+    return wins, top
+
+
+def project(tournament, simulations=2000, top_n=3, workers=1, seed=None):
+    from .models import Prediction
+    start = time.perf_counter()
+    key = tournament_key(tournament.pk, 'projection')
+
+    participants = list(tournament.participant_set.order_by(F('score').asc(nulls_last=True), 'pk'))
+    if not participants:
+        return None
+    base = [float(p.score or 0) for p in participants]
+
+    remaining = {pk: {} for pk in tournament.match_set.filter(
+        score__isnull=True).values_list('pk', flat=True)}
+    for match_id, user_id, prediction, late in Prediction.objects.filter(
+            match_id__in=remaining).values_list('match_id', 'user_id', 'prediction', 'late'):
+        remaining[match_id][user_id] = (prediction, late)
+    outcomes = []
+    for match_id, predictions in sorted(remaining.items()):
+        _, weights, scores = match_outcomes(tournament, predictions, participants)
+        outcomes.append((weights, scores))
+
+    rng = random.Random(seed)
+    workers = max(1, workers)
+    sizes = [simulations // workers + (1 if i < simulations % workers else 0)
+             for i in range(workers)]
+    batches = [(base, outcomes, size, top_n, rng.getrandbits(32)) for size in sizes if size]
+
+    if workers == 1:
+        counts = [simulate_batch(*batch) for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            counts = list(executor.map(simulate_batch, *zip(*batches)))
+
+    wins = [sum(c[0][i] for c in counts) for i in range(len(participants))]
+    top = [sum(c[1][i] for c in counts) for i in range(len(participants))]
+
+    projection = {
+        'computed': timezone.now(),
+        'simulations': simulations,
+        'remaining': len(outcomes),
+        'top_n': top_n,
+        'odds': {p.pk: (100.0 * wins[i] / simulations, 100.0 * top[i] / simulations)
+                 for i, p in enumerate(participants)},
+    }
+    cache.set(key, projection, PROJECTION_TIMEOUT)
+    g_logger.info("%s: %d simulations of %d matches in %.2fs", tournament, simulations,
+                  len(outcomes), time.perf_counter() - start)
+    return projection
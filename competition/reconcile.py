@@ -0,0 +1,185 @@
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+import csv
+import datetime
+import logging
+from . import teams
+from .cache import bump_match, bump_schedule, bump_tournament
+from .models import Match
+
+g_logger = logging.getLogger(__name__)
+
+# a row without a match_id is the existing match between the same teams
+# kicking off closest to it within this window
+WINDOW = datetime.timedelta(days=7)
+
+TRUE_VALUES = ('1', 'true', 'yes', 'y')
+
+
+# Reconciling a tournament's fixtures with a new fixture CSV, in the format of
+# Tournament.add_matches (match_id, home_team, away_team, kick_off or
+# start_time and the *_winner_of match_ids of TBD teams) plus an optional
+# postponed column. Rows are matched to the existing matches in memory and
+# the plan, i.e. the kick off changes, postponements and new matches, is
+# applied with a few bulk queries in one transaction. Matches are never
+# deleted, so their predictions are kept, and the cache versions of the
+# changed matches, the tournament and the kick-off schedule are bumped.
+
+class FixtureError(Exception):
+    pass
+
+
+class Plan:
+    def __init__(self):
+        self.rescheduled = []  # (match, old kick_off)
+        self.postponed = []
+        self.new = []
+        self.winners_of = {}  # new match_id -> (home, away) *_winner_of match_ids
+        self.unchanged = 0
+        self.errors = []  # (row number, error)
+
+    def changed(self):
+        return {m.pk: m for m in [m for m, _ in self.rescheduled] + self.postponed}.values()
+
+    def __bool__(self):
+        return bool(self.rescheduled or self.postponed or self.new)
+
+
+def parse_kick_off(value):
+    kick_off = parse_datetime((value or '').strip())
+    if kick_off is None:
+        raise FixtureError("Invalid kick off %r" % value)
+    if timezone.is_naive(kick_off):
+        kick_off = timezone.make_aware(kick_off)
+    return kick_off
+
+
+def winner_of(row, side, by_id):
+    value = (row.get(side + '_winner_of') or '').strip()
+    if not value:
+        raise FixtureError("TBD %s without %s_winner_of" % (side, side))
+    if int(value) not in by_id:
+        raise FixtureError("No match %s for %s_winner_of" % (value, side))
+    return int(value)
+
+
+def row_team(row, side, index):
+    name = (row.get(side) or '').strip()
+    if name == 'TBD':
+        return None
+    pks = teams.lookup(index, name)
+    if len(pks) != 1:
+        raise FixtureError("Unknown or ambiguous team %r" % name)
+    return next(iter(pks))
+
+
+def row_match(row, by_id, by_teams, index, window):
+    """(kick_off, home, away, match_id, existing match or None) for a fixture row"""
+    kick_off = parse_kick_off(row.get('kick_off') or row.get('start_time'))
+    home, away = row_team(row, 'home_team', index), row_team(row, 'away_team', index)
+    match_id = int(row['match_id']) if (row.get('match_id') or '').strip() else None
+    match = by_id.get(match_id)
+    if match is not None and match.pk is None:
+        raise FixtureError("Match %d is in the file more than once" % match_id)
+    if match is not None and (home, away) != (match.home_team_id, match.away_team_id) \
+            and None not in (home, away, match.home_team_id, match.away_team_id):
+        raise FixtureError("Match %d is %s" % (match_id, match))
+    if match is None and match_id is None and None not in (home, away):
+        near = [m for m in by_teams.get((home, away), [])
+                if abs(m.kick_off - kick_off) <= window]
+        match = min(near, key=lambda m: abs(m.kick_off - kick_off), default=None)
+    return kick_off, home, away, match_id, match
+
+
+def plan_change(plan, match, kick_off, postponed):
+    if match.kick_off != kick_off:
+        plan.rescheduled.append((match, match.kick_off))
+        match.kick_off = kick_off
+        # a new date replaces a postponement unless the row still says postponed
+        match.postponed = postponed
+    elif postponed and not match.postponed:
+        match.postponed = True
+        plan.postponed.append(match)
+    else:
+        plan.unchanged += 1
+
+
+def plan_fixtures(tournament, rows, window=WINDOW):
+    """Work out the changes the fixture rows make to the tournament's matches"""
+    matches = list(tournament.match_set.all())
+    by_id = {match.match_id: match for match in matches}
+    by_teams = {}
+    for match in matches:
+        by_teams.setdefault((match.home_team_id, match.away_team_id), []).append(match)
+    index = teams.get_index(tournament.sport_id)
+
+    plan = Plan()
+    seen = set()
+    unnumbered = []
+    for number, row in enumerate(rows, 1):
+        postponed = (row.get('postponed') or '').strip().lower() in TRUE_VALUES
+        try:
+            kick_off, home, away, match_id, match = row_match(row, by_id, by_teams, index, window)
+            if match is None:
+                winners_of = tuple(winner_of(row, side, by_id) if team is None else None
+                                   for side, team in (('home_team', home), ('away_team', away)))
+        except (FixtureError, ValueError) as e:
+            plan.errors.append((number, str(e)))
+            continue
+
+        if match is None:
+            match = Match(tournament=tournament, match_id=match_id, kick_off=kick_off,
+                          home_team_id=home, away_team_id=away, postponed=postponed)
+            if match_id is None:
+                unnumbered.append((match, winners_of))
+            else:
+                by_id[match_id] = match
+                plan.new.append(match)
+                plan.winners_of[match_id] = winners_of
+        elif match.pk in seen:
+            plan.errors.append((number, "Match %d is in the file more than once" % match.match_id))
+        else:
+            seen.add(match.pk)
+            plan_change(plan, match, kick_off, postponed)
+
+    # numbered once every match_id in the file is known, so they can't collide
+    next_id = max(by_id, default=0) + 1
+    for match, winners_of in unnumbered:
+        match.match_id = next_id
+        plan.new.append(match)
+        plan.winners_of[next_id] = winners_of
+        next_id += 1
+    return plan
+
+
+def apply_plan(tournament, plan):
+    if not plan:
+        return
+    with transaction.atomic():
+        Match.objects.bulk_update(list(plan.changed()), ['kick_off', 'postponed'])
+
+        # the new matches get their pks, and so can be linked, once inserted
+        Match.objects.bulk_create(plan.new)
+        pks = dict(tournament.match_set.values_list('match_id', 'pk'))
+        linked = []
+        for match in plan.new:
+            match.pk = pks[match.match_id]
+            home, away = plan.winners_of[match.match_id]
+            if home or away:
+                match.home_team_winner_of_id = home and pks[home]
+                match.away_team_winner_of_id = away and pks[away]
+                linked.append(match)
+        Match.objects.bulk_update(linked, ['home_team_winner_of', 'away_team_winner_of'])
+
+    for match in list(plan.changed()) + plan.new:
+        bump_match(match.pk)
+    bump_tournament(tournament.pk)
+    bump_schedule()
+    g_logger.info("%s: %d matches rescheduled, %d postponed, %d added", tournament,
+                  len(plan.rescheduled), len(plan.postponed), len(plan.new))
+
+
+def read_fixtures(path):
+    with open(path, newline='', encoding='utf-8') as fixtures:
+        return [row for row in csv.DictReader(fixtures) if row]
@@ -0,0 +1,81 @@
+from django.contrib.auth.models import User
+from django.db.models import Avg, Count, Sum
+import csv
+import hashlib
+import logging
+from .cache import get_or_set, match_versions
+from .models import Prediction
+
+g_logger = logging.getLogger(__name__)
+
+REPORT_TIMEOUT = 10 * 60
+
+CSV_HEADER = ['position', 'username', 'name', 'social_name', 'score', 'average_margin',
+              'predictions']
+
+
+# Top N reports over any set of matches, e.g. a round, a date range or the
+# matches of a tournament, optionally limited to a set of users such as an
+# organisation's members. The totals are one grouped query, after which the
+# users with their profiles and their social accounts for the provider (see
+# member.social) are loaded with one query each. Reports are cached on the
+# versions of the matches, which are bumped whenever a prediction for them
+# changes, so a report only goes stale through name changes and expires after
+# REPORT_TIMEOUT.
+
+def report_key(match_pks, user_pks, provider, n):
+    versions = sorted(match_versions(match_pks).items())
+    digest = hashlib.md5(repr((versions, user_pks, provider, n)).encode()).hexdigest()
+    return "report:top:%s" % digest
+
+
+def top_predictors(matches, n=10, provider=None, users=None):
+    """The best n predictors by total score over a queryset of matches
+
+    Returns a list of dicts with the keys in CSV_HEADER plus user_id and
+    handle, which is set when social_name came from the social account."""
+    match_pks = sorted(matches.values_list('pk', flat=True))
+    user_pks = None if users is None else sorted(users.values_list('pk', flat=True))
+    return get_or_set(report_key(match_pks, user_pks, provider, n),
+                      lambda: build_report(match_pks, user_pks, provider, n),
+                      timeout=REPORT_TIMEOUT, metric='top_report')
+
+
+def build_report(match_pks, user_pks, provider, n):
+    predictions = Prediction.objects.filter(match__in=match_pks, score__isnull=False)
+    if user_pks is not None:
+        predictions = predictions.filter(user__in=user_pks)
+    totals = list(predictions.order_by().values('user').annotate(
+        total=Sum('score'), average_margin=Avg('margin'), count=Count('pk')
+    ).order_by('total', 'user')[:n])
+
+    from member.social import social_accounts
+    users = User.objects.select_related('profile').in_bulk([row['user'] for row in totals])
+    accounts = social_accounts(users, [provider])[provider] if provider else {}
+
+    rows = []
+    for i, row in enumerate(totals, 1):
+        user = users[row['user']]
+        profile = user.profile
+        social_name = profile.get_social_name(provider, accounts=accounts)
+        rows.append({
+            # equal totals share a position
+            'position': rows[-1]['position'] if rows and rows[-1]['score'] == row['total'] else i,
+            'user_id': user.pk,
+            'username': user.username,
+            'name': profile.get_name(),
+            'social_name': social_name,
+            'handle': social_name != profile.get_social_name(provider, accounts={}),
+            'score': row['total'],
+            'average_margin': row['average_margin'],
+            'predictions': row['count'],
+        })
+    g_logger.debug("top %d report over %d matches", n, len(match_pks))
+    return rows
+
+
+def write_csv(rows, out):
+    writer = csv.writer(out)
+    writer.writerow(CSV_HEADER)
+    for row in rows:
+        writer.writerow([row[column] for column in CSV_HEADER])
@@ -0,0 +1,134 @@
+from django.db import transaction
+from django.utils import timezone
+from decimal import Decimal, InvalidOperation
+import csv
+import json
+import logging
+import os
+from . import teams
+from .models import Match
+
+g_logger = logging.getLogger(__name__)
+
+
+# Results feeds, e.g. a file dropped by another system every minute. A feed is
+# a CSV file or a JSON list of rows (or {"results": [...]}); each row names a
+# match by match_id or by its home_team and away_team, and gives its result
+# as score (the home team's winning margin) or as home_score and away_score.
+#
+# Rows of matches that have not kicked off yet are rejected, like rows that do
+# not name a match, rather than scoring predictions that can still be changed.
+#
+# The rows are diffed against the stored scores with one query for the
+# tournament's matches and the sport's team index, so running an unchanged
+# feed again writes nothing. The changed matches are saved with one bulk
+# UPDATE and scored with one Tournament.score_matches.
+
+class FeedError(Exception):
+    pass
+
+
+def read_feed(path, format=None):
+    """The rows of the feed file at path as dicts, format is 'csv' or 'json'"""
+    format = format or os.path.splitext(path)[1].lstrip('.').lower()
+    with open(path, newline='', encoding='utf-8') as feed:
+        if format == 'csv':
+            return [row for row in csv.DictReader(feed) if row]
+        if format == 'json':
+            rows = json.load(feed)
+            if isinstance(rows, dict):
+                rows = rows.get('results')
+            if not isinstance(rows, list):
+                raise FeedError("A JSON feed must be a list of rows or {\"results\": [...]}")
+            return rows
+    raise FeedError("Unknown feed format %r" % format)
+
+
+def parse_score(value):
+    try:
+        score = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise FeedError("Invalid score %r" % value)
+    if not score.is_finite() or score != score.to_integral_value():
+        raise FeedError("Score %r is not a whole number" % value)
+    return int(score)
+
+
+def row_score(row):
+    if not isinstance(row, dict):
+        raise FeedError("Row is not an object")
+    if row.get('score') not in (None, ''):
+        return parse_score(row['score'])
+    if row.get('home_score') in (None, '') or row.get('away_score') in (None, ''):
+        return None
+    return parse_score(row['home_score']) - parse_score(row['away_score'])
+
+
+def find_match(row, by_id, by_teams, index, ignore_case=False, fuzzy=False):
+    """(match, swapped) for a feed row, swapped if it names the teams away first"""
+    if row.get('match_id') not in (None, ''):
+        match = by_id.get(int(row['match_id']))
+        if match is None:
+            raise FeedError("No match %s" % row['match_id'])
+        return match, False
+
+    home, away = (teams.lookup(index, row.get(side) or '', ignore_case=ignore_case, fuzzy=fuzzy)
+                  for side in ('home_team', 'away_team'))
+    if len(home) != 1 or len(away) != 1:
+        raise FeedError("Unknown or ambiguous teams %r v %r"
+                        % (row.get('home_team'), row.get('away_team')))
+    home, away = next(iter(home)), next(iter(away))
+    for key, swapped in (((home, away), False), ((away, home), True)):
+        matches = by_teams.get(key, [])
+        if len(matches) > 1:
+            raise FeedError("%d matches between %r and %r, give the match_id"
+                            % (len(matches), row['home_team'], row['away_team']))
+        if matches:
+            return matches[0], swapped
+    raise FeedError("No match between %r and %r" % (row['home_team'], row['away_team']))
+
+
+def diff_results(tournament, rows, ignore_case=False, fuzzy=False):
+    """([(match, score)] for the rows that change a score, [(row number, error)])"""
+    matches = list(tournament.match_set.all())
+    by_id = {match.match_id: match for match in matches}
+    by_teams = {}
+    for match in matches:
+        by_teams.setdefault((match.home_team_id, match.away_team_id), []).append(match)
+    index = teams.get_index(tournament.sport_id)
+    now = timezone.now()
+
+    changes, errors = {}, []
+    for number, row in enumerate(rows, 1):
+        try:
+            score = row_score(row)
+            if score is None:
+                continue
+            match, swapped = find_match(row, by_id, by_teams, index, ignore_case, fuzzy)
+            if match.kick_off > now:
+                raise FeedError("%s has not kicked off" % match)
+        except (FeedError, ValueError, TypeError) as e:
+            errors.append((number, str(e)))
+            continue
+        if swapped:
+            score = -score
+        if match.score != score:
+            changes[match.pk] = (match, score)
+    return list(changes.values()), errors
+
+
+def apply_results(tournament, changes):
+    """Save the new scores and score the matches, returns the changed matches"""
+    if not changes:
+        return []
+    matches = []
+    with transaction.atomic():
+        for match, score in changes:
+            match.score = score
+            matches.append(match)
+        Match.objects.bulk_update(matches, ['score'])
+        for match in matches:
+            match.check_next_round_matches()
+        tournament.score_matches(matches)
+    g_logger.info("%s: %d results applied", tournament, len(matches))
+    return matches
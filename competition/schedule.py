@@ -0,0 +1,75 @@
+from django.utils import timezone
+import datetime
+import heapq
+import logging
+import threading
+from .cache import schedule_version
+from .models import Tournament, Match
+
+g_logger = logging.getLogger(__name__)
+
+# reloaded at least this often, covering changes made without Match.save
+RELOAD_EVERY = datetime.timedelta(minutes=5)
+
+
+# The matches still open for predictions, i.e. kicking off in the future in a
+# tournament that is not closed, held in memory by each process. Each match
+# is dropped at its kick off without a query by popping the lock times from a
+# heap, so answering "is this match open" costs one cache read of the schedule
+# version, which Match.save and Tournament.save bump, prompting a reload.
+#
+# The set only saves the reads; a prediction written around kick off is still
+# rejected by the database, see Prediction.save_before_kick_off.
+
+class KickOffSchedule:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open = {}  # match pk -> tournament pk
+        self._locks = []  # heap of (kick_off, match pk)
+        self._version = None
+        self._loaded = None
+
+    def _load(self, now):
+        matches = Match.objects.filter(
+            kick_off__gt=now,
+            tournament__state__in=[Tournament.PENDING, Tournament.ACTIVE])
+        self._open = {}
+        self._locks = []
+        for pk, tournament_pk, kick_off in matches.values_list('pk', 'tournament', 'kick_off'):
+            self._open[pk] = tournament_pk
+            self._locks.append((kick_off, pk))
+        heapq.heapify(self._locks)
+        g_logger.debug("kick off schedule loaded, %d open matches", len(self._open))
+
+    def _refresh(self):
+        now = timezone.now()
+        version = schedule_version()
+        with self._lock:
+            stale = self._loaded is None or now - self._loaded > RELOAD_EVERY
+            if version != self._version or stale:
+                self._load(now)
+                self._version = version
+                self._loaded = now
+            while self._locks and self._locks[0][0] <= now:
+                _, pk = heapq.heappop(self._locks)
+                self._open.pop(pk, None)
+
+    def is_open(self, match_pk):
+        self._refresh()
+        return int(match_pk) in self._open
+
+    def open_matches(self, tournament_pk=None):
+        """The pks of the open matches, of one tournament if given"""
+        self._refresh()
+        with self._lock:
+            return {pk for pk, t_pk in self._open.items()
+                    if tournament_pk is None or t_pk == tournament_pk}
+
+    def next_lock(self):
+        """When the next open match kicks off, None if there are none"""
+        self._refresh()
+        with self._lock:
+            return self._locks[0][0] if self._locks else None
+
+
+kick_off_schedule = KickOffSchedule()
@@ -0,0 +1,97 @@
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+import datetime
+import logging
+import os
+import socket
+from .models import Tournament, Match, Prediction, BenchmarkPrediction
+from .models import OutboxEmail, SchedulerLease
+
+g_logger = logging.getLogger(__name__)
+
+LEASE_NAME = 'run_scheduler'
+LEASE_DURATION = datetime.timedelta(minutes=5)
+EMAIL_BATCH = 500
+
+
+# The work done by the run_scheduler command, outside of any request:
+#  - pending tournaments are opened at their open_at and active ones closed at
+#    their close_at,
+#  - played matches with unscored predictions, e.g. results written with an
+#    UPDATE, are scored with Tournament.score_matches,
+#  - the tables of active tournaments are rebuilt from the predictions now and
+#    again, as the pop_leaderboard admin action does,
+#  - queued OutboxEmails are sent.
+# Several runners may be started, each step is only run while holding the
+# SchedulerLease, which a runner that dies gives up when it expires. The lease
+# is only checked and renewed between steps, so a long step may overlap with
+# the same step in a runner that takes the lease meanwhile. The steps are safe
+# to overlap: tournaments are opened and closed, and OutboxEmails sent, under a
+# conditional UPDATE that only one runner wins, while scoring and rebuilding
+# the tables recompute the same rows from the predictions.
+
+def owner_name():
+    return "%s:%d" % (socket.gethostname(), os.getpid())
+
+
+def open_due(now):
+    tournaments = list(Tournament.objects.filter(state=Tournament.PENDING, open_at__lte=now))
+    for tournament in tournaments:
+        tournament.open()
+    return len(tournaments)
+
+
+def unscored_matches():
+    unscored = Q()
+    for model in (Prediction, BenchmarkPrediction):
+        unscored |= Exists(model.objects.filter(match=OuterRef('pk'), score__isnull=True))
+    return Match.objects.filter(unscored, score__isnull=False, tournament__state=Tournament.ACTIVE)
+
+
+def score_due():
+    played = {}
+    for match in unscored_matches().select_related('tournament'):
+        played.setdefault(match.tournament, []).append(match)
+    for tournament, matches in played.items():
+        tournament.score_matches(matches)
+    return sum(len(matches) for matches in played.values())
+
+
+def close_due(now):
+    tournaments = list(Tournament.objects.filter(state=Tournament.ACTIVE, close_at__lte=now))
+    for tournament in tournaments:
+        tournament.close()
+    return len(tournaments)
+
+
+def rebuild_tables():
+    tournaments = list(Tournament.objects.filter(state=Tournament.ACTIVE))
+    for tournament in tournaments:
+        tournament.update_totals()
+    return len(tournaments)
+
+
+def run_once(owner, rebuild=False, lease=LEASE_DURATION):
+    """Run each step that is due, returns {step: count} or None if another
+    runner holds the lease"""
+    now = timezone.now()
+    steps = [
+        ('opened', lambda: open_due(now)),
+        ('scored', score_due),
+        ('closed', lambda: close_due(now)),
+        ('rebuilt', rebuild_tables if rebuild else None),
+        ('emailed', lambda: OutboxEmail.objects.send_pending(EMAIL_BATCH)),
+    ]
+    done = {}
+    for name, step in steps:
+        if step is None:
+            continue
+        if not SchedulerLease.objects.acquire(LEASE_NAME, owner, lease):
+            g_logger.debug("%s does not hold the scheduler lease", owner)
+            return done or None
+        done[name] = step()
+    return done
+
+
+def release(owner):
+    SchedulerLease.objects.release(LEASE_NAME, owner)
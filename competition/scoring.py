@@ -0,0 +1,30 @@
+# The scoring rules, shared by PredictionBase.calc_score and code that scores
+# predictions without model instances (e.g. the what-if simulator).
+
+from decimal import Decimal
+
+# scores are stored to the cent, rounding half to even
+CENTS = Decimal('0.01')
+
+
+def prediction_outcome(prediction, result):
+    """The margin of a prediction and whether it picked the right winner"""
+    margin = abs(result - prediction)
+    if prediction == result:
+        return margin, True
+    if (prediction < 0 and result < 0) or (prediction > 0 and result > 0):
+        return margin, True
+    return margin, False
+
+
+def match_bonus(result, bonus, draw_bonus):
+    """The bonus for a correct prediction; a draw earns bonus * draw_bonus"""
+    if result == 0:
+        return bonus * draw_bonus
+    return bonus
+
+
+def prediction_score(margin, correct, bonus):
+    if correct:
+        return margin - bonus
+    return margin
@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# sent by Tournament.update_table once every predictor's score is up to date
+table_updated = Signal()
@@ -0,0 +1,100 @@
+from decimal import Decimal
+import logging
+import time
+from .models import Prediction, Benchmark, BenchmarkPrediction
+from .scoring import CENTS, prediction_outcome
+
+g_logger = logging.getLogger(__name__)
+
+
+# What-if scoring. A predictor's total is
+#
+#   sum(margin) - bonus * (correct non-draw predictions)
+#               - bonus * draw_bonus * (correct draw predictions)
+#
+# counting only the predictions that can receive a bonus (not late, and not
+# from a benchmark with can_receive_bonus unset). The predictions are loaded
+# once and reduced to those sums, after which a leaderboard for any bonus and
+# draw_bonus costs one pass over the predictors.
+#
+# draw_definition is not simulated: results are stored as a single margin, so
+# there is no normal time score to apply the other definition to.
+
+class PredictorTotals:
+    __slots__ = ('predictor', 'margin', 'count', 'correct', 'correct_draws')
+
+    def __init__(self, predictor):
+        self.predictor = predictor
+        self.margin = Decimal(0)
+        self.count = 0
+        self.correct = 0
+        self.correct_draws = 0
+
+    def add(self, prediction, result, eligible):
+        margin, correct = prediction_outcome(prediction, result)
+        self.margin += margin
+        self.count += 1
+        if correct and eligible:
+            if result == 0:
+                self.correct_draws += 1
+            else:
+                self.correct += 1
+
+    def score(self, bonus, draw_bonus):
+        if not self.count:
+            return None
+        # only an exact prediction of a draw is correct, so each one is stored
+        # as the draw bonus rounded to cents
+        draw = (bonus * draw_bonus).quantize(CENTS)
+        return self.margin - bonus * self.correct - draw * self.correct_draws
+
+
+class Simulation:
+    def __init__(self, tournament):
+        self.tournament = tournament
+        start = time.perf_counter()
+        self.totals = []
+
+        participants = {p.user_id: PredictorTotals(p) for p in
+                        tournament.participant_set.select_related('user__profile')}
+        for user_id, prediction, late, result in Prediction.objects.filter(
+                match__tournament=tournament, match__score__isnull=False).values_list(
+                'user_id', 'prediction', 'late', 'match__score').order_by().iterator():
+            if user_id in participants:
+                participants[user_id].add(prediction, result, not late)
+        self.totals.extend(participants.values())
+
+        benchmarks = {b.pk: PredictorTotals(b) for b in tournament.benchmark_set.all()}
+        for benchmark_id, prediction, result in BenchmarkPrediction.objects.filter(
+                match__tournament=tournament, match__score__isnull=False).values_list(
+                'benchmark_id', 'prediction', 'match__score').order_by().iterator():
+            totals = benchmarks[benchmark_id]
+            totals.add(prediction, result, totals.predictor.can_receive_bonus)
+        self.totals.extend(benchmarks.values())
+
+        g_logger.debug("%s: loaded simulation in %.3fs", tournament, time.perf_counter() - start)
+
+    def leaderboard(self, bonus, draw_bonus, benchmarks=False):
+        """[(predictor, score)] ordered as the table with unscored predictors last"""
+        rows = [(t.predictor, t.score(bonus, draw_bonus)) for t in self.totals
+                if benchmarks or not isinstance(t.predictor, Benchmark)]
+        return sorted(rows, key=lambda row: (row[1] is None, row[1] or 0,
+                                             isinstance(row[0], Benchmark), row[0].pk))
+
+    def compare(self, bonus, draw_bonus, benchmarks=False):
+        """Rank changes from the tournament's current rules to bonus and draw_bonus"""
+        current = {predictor: (rank, score) for rank, (predictor, score) in enumerate(
+            self.leaderboard(self.tournament.bonus, self.tournament.draw_bonus, benchmarks), 1)}
+        changes = []
+        leaderboard = self.leaderboard(bonus, draw_bonus, benchmarks)
+        for rank, (predictor, score) in enumerate(leaderboard, 1):
+            old_rank, old_score = current[predictor]
+            changes.append({
+                'predictor': predictor,
+                'old_rank': old_rank,
+                'old_score': old_score,
+                'rank': rank,
+                'score': score,
+                'movement': old_rank - rank,
+            })
+        return changes
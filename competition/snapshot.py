@@ -0,0 +1,268 @@
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Avg, Count, F, Q
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from decimal import Decimal
+import json
+import logging
+import zlib
+from .cache import bump_matches, bump_tournament, bump_tournament_list, bump_users
+from .cache import tournament_cached
+from .models import Tournament, Match, Team, Prediction, BenchmarkPrediction, TournamentSnapshot
+
+g_logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_TIMEOUT = 24 * 60 * 60
+
+MATCH_FIELDS = ('pk', 'match_id', 'kick_off', 'home', 'away', 'score', 'postponed',
+                'predictions', 'mean_prediction', 'correct')
+PARTICIPANT_FIELDS = ('user_id', 'username', 'name', 'score', 'margin_per_match')
+BENCHMARK_FIELDS = ('pk', 'name', 'score', 'margin_per_match')
+PREDICTION_FIELDS = ('pk', 'match', 'prediction', 'score', 'margin', 'correct', 'late')
+
+
+# Snapshots of finished tournaments: the final standings, a summary of each
+# match and every participant's and benchmark's predictions, as lists of
+# values (see the *_FIELDS above) in zlib compressed JSON. The snapshot is
+# taken when the tournament is closed, or archived if it has none, and only
+# changes after that when it is retaken with archive_tournament --resnapshot,
+# e.g. after a result is corrected. The tables, prediction histories and match predictions of a
+# finished tournament are served from it, with long lived HTTP caching, so
+# archiving can prune its raw Prediction and BenchmarkPrediction rows from
+# the tables the active tournaments use.
+
+def build_snapshot(tournament):
+    matches = tournament.match_set.select_related('home_team', 'away_team').order_by(
+        'kick_off', 'match_id')
+    predictions = Prediction.objects.filter(match__tournament=tournament).order_by(
+        '-match__kick_off', '-match__match_id')
+    benchmark_predictions = BenchmarkPrediction.objects.filter(
+        match__tournament=tournament).order_by('-match__kick_off', '-match__match_id')
+    summaries = {row['match']: row for row in predictions.order_by().values('match').annotate(
+        n=Count('pk'), mean=Avg('prediction'), correct=Count('pk', filter=Q(correct=True)))}
+
+    def team(team):
+        return team.name if team else "TBD"
+
+    data = {
+        'version': SNAPSHOT_VERSION,
+        'taken': timezone.now(),
+        'matches': [[m.pk, m.match_id, m.kick_off, team(m.home_team),
+                     team(m.away_team), m.score, m.postponed,
+                     summaries.get(m.pk, {}).get('n', 0), summaries.get(m.pk, {}).get('mean'),
+                     summaries.get(m.pk, {}).get('correct', 0)] for m in matches],
+        'participants': [[p.user_id, p.user.username, p.get_name(), p.score, p.margin_per_match]
+                         for p in tournament.participant_set.select_related('user').order_by(
+                             F('score').asc(nulls_last=True), 'pk')],
+        'benchmarks': [[b.pk, b.name, b.score, b.margin_per_match]
+                       for b in tournament.benchmark_set.order_by(
+                           F('score').asc(nulls_last=True), 'pk')],
+        'predictions': {},
+        'benchmark_predictions': {},
+    }
+    for user_id, *row in predictions.values_list('user', *PREDICTION_FIELDS):
+        data['predictions'].setdefault(str(user_id), []).append(row)
+    # benchmark predictions are never late
+    rows = benchmark_predictions.values_list('benchmark', *PREDICTION_FIELDS[:-1])
+    for benchmark_id, *row in rows:
+        data['benchmark_predictions'].setdefault(str(benchmark_id), []).append(row + [False])
+    return data
+
+
+def compress(data):
+    return zlib.compress(json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')).encode())
+
+
+def decompress(blob):
+    return json.loads(zlib.decompress(bytes(blob)).decode())
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def take_snapshot(tournament):
+    """The tournament's snapshot, taken now unless it already has one"""
+    snapshot = TournamentSnapshot.objects.filter(tournament=tournament).first()
+    if snapshot is None:
+        data = compress(build_snapshot(tournament))
+        snapshot = TournamentSnapshot.objects.create(tournament=tournament, data=data)
+        g_logger.info("%s: %d byte snapshot", tournament, len(data))
+    return snapshot
+
+
+def retake_snapshot(tournament):
+    """Replace the snapshot of a closed tournament, e.g. after a result was corrected"""
+    if not tournament.is_closed():
+        raise SnapshotError("%s is not finished" % tournament)
+    with transaction.atomic():
+        snapshot = TournamentSnapshot.objects.select_for_update().filter(
+            tournament=tournament).first()
+        if snapshot is None:
+            snapshot = take_snapshot(tournament)
+        elif snapshot.pruned:
+            raise SnapshotError("%s's predictions have been pruned" % tournament)
+        else:
+            snapshot.data = compress(build_snapshot(tournament))
+            snapshot.save(update_fields=['data'])
+            g_logger.info("%s: %d byte snapshot retaken", tournament, len(snapshot.data))
+    bump_tournament(tournament.pk)
+    return snapshot
+
+
+def archive(tournament, prune=False):
+    """Archive the tournament, taking its snapshot if there isn't one yet
+
+    With prune its predictions are deleted once they are in the snapshot."""
+    matches, users = [], []
+    with transaction.atomic():
+        snapshot = take_snapshot(tournament)
+        if prune and not snapshot.pruned:
+            matches = list(tournament.match_set.values_list('pk', flat=True))
+            users = list(Prediction.objects.filter(match__tournament=tournament).order_by()
+                         .values_list('user', flat=True).distinct())
+            # a plain DELETE rather than loading every row to send its post_delete
+            # signal, the versions prediction_changed would bump are bumped once below
+            for model in (Prediction, BenchmarkPrediction):
+                predictions = model.objects.filter(match__tournament=tournament)
+                predictions._raw_delete(predictions.db)
+            snapshot.pruned = True
+            snapshot.save(update_fields=['pruned'])
+        Tournament.objects.filter(pk=tournament.pk).update(state=Tournament.ARCHIVED)
+    tournament.state = Tournament.ARCHIVED
+    bump_matches(matches)
+    bump_users(users)
+    bump_tournament(tournament.pk)
+    bump_tournament_list()
+    return snapshot
+
+
+def load_snapshot(tournament_pk):
+    blob = TournamentSnapshot.objects.filter(tournament=tournament_pk).values_list(
+        'data', flat=True).first()
+    return None if blob is None else decompress(blob)
+
+
+def get_snapshot(tournament):
+    """The Snapshot of a finished or archived tournament, None if it has none"""
+    if not tournament.is_closed():
+        return None
+    data = tournament_cached(tournament.pk, 'snapshot', lambda: load_snapshot(tournament.pk),
+                             timeout=SNAPSHOT_TIMEOUT)
+    return data and Snapshot(tournament, data)
+
+
+class SnapshotPaginator(Paginator):
+    def _get_page(self, *args, **kwargs):
+        page = super()._get_page(*args, **kwargs)
+        # keys the cached fragments of the page as KeysetPage.cache_key does
+        page.cache_key = "page%d" % page.number
+        return page
+
+
+def score_key(predictor):
+    score = predictor['score']
+    return (score is None, Decimal(score or 0))
+
+
+class Snapshot:
+    """A loaded snapshot, handing out unsaved model instances for the templates"""
+
+    def __init__(self, tournament, data):
+        self.tournament = tournament
+        self.data = data
+        self.taken = data.get('taken')
+
+        url = reverse('competition:predictions', args=(tournament.slug,))
+        self.participants = []
+        for row in data['participants']:
+            participant = dict(zip(PARTICIPANT_FIELDS, row))
+            participant['url'] = "%s?user=%s" % (url, participant['username'])
+            participant['predictions'] = data['predictions'].get(str(participant['user_id']), [])
+            self.participants.append(participant)
+        self.benchmarks = []
+        for row in data['benchmarks']:
+            benchmark = dict(zip(BENCHMARK_FIELDS, row))
+            benchmark['url'] = reverse('competition:benchmark', args=(benchmark['pk'],))
+            benchmark['predictions'] = data['benchmark_predictions'].get(str(benchmark['pk']), [])
+            self.benchmarks.append(benchmark)
+        self.users = {p['username']: p for p in self.participants}
+        self._matches = {}
+
+    def participant(self, user_id):
+        for participant in self.participants:
+            if participant['user_id'] == user_id:
+                return participant
+        return None
+
+    def benchmark(self, pk):
+        for benchmark in self.benchmarks:
+            if benchmark['pk'] == pk:
+                return benchmark
+        return None
+
+    def predictors(self):
+        """The participants and benchmarks in table order"""
+        return sorted(self.participants + self.benchmarks, key=score_key)
+
+    def match(self, pk):
+        if not self._matches:
+            for row in self.data['matches']:
+                m = dict(zip(MATCH_FIELDS, row))
+                self._matches[m['pk']] = Match(
+                    pk=m['pk'], tournament=self.tournament, match_id=m['match_id'],
+                    kick_off=parse_datetime(m['kick_off']), score=m['score'],
+                    postponed=m['postponed'],
+                    home_team=Team(name=m['home']), away_team=Team(name=m['away']))
+        return self._matches.get(pk)
+
+    def _prediction(self, row):
+        p = dict(zip(PREDICTION_FIELDS, row))
+        return Prediction(pk=p['pk'], match=self.match(p['match']), prediction=p['prediction'],
+                          score=p['score'], margin=p['margin'], correct=p['correct'],
+                          late=p['late'])
+
+    def history(self, user_id):
+        """The user's predictions, latest match first"""
+        participant = self.participant(user_id)
+        return [self._prediction(row) for row in participant['predictions']] if participant else []
+
+    def benchmark_history(self, pk):
+        """The benchmark's predictions of matches that were not postponed, latest first"""
+        benchmark = self.benchmark(pk)
+        rows = benchmark['predictions'] if benchmark else []
+        return [p for p in map(self._prediction, rows) if not p.match.postponed]
+
+    def prediction(self, user_id, match_pk):
+        participant = self.participant(user_id)
+        for row in participant['predictions'] if participant else []:
+            if row[1] == match_pk:
+                return self._prediction(row)
+        return None
+
+    def match_predictions(self, match_pk, benchmarks=False):
+        """The match's predictions with their predictor_name, in the match view's order"""
+        predictions = []
+        for predictor in self.participants + (self.benchmarks if benchmarks else []):
+            for row in predictor['predictions']:
+                if row[1] == match_pk:
+                    prediction = self._prediction(row)
+                    prediction.predictor_name = predictor['name']
+                    predictions.append(prediction)
+                    break
+        if self.match(match_pk).score is None:
+            return sorted(predictions, key=lambda p: -Decimal(p.prediction))
+        return sorted(predictions, key=lambda p: (p.score is None, Decimal(p.score or 0)))
+
+    def leaderboard(self, predictors):
+        """Rows for some of the predictors as views.leaderboard_rows makes them"""
+        rows = []
+        for p in predictors:
+            played = [row for row in p['predictions'] if self.match(row[1]).score is not None]
+            rows.append((p['url'], p['name'], p['score'], p['margin_per_match'],
+                         [self._prediction(row) for row in played[:5]], None))
+        return rows
@@ -0,0 +1,91 @@
+from django.core.cache import cache
+import copy
+import difflib
+import logging
+import threading
+from .cache import sport_version
+
+g_logger = logging.getLogger(__name__)
+
+NAME_FIELDS = ('name', 'code', 'short_name', 'full_name', 'alt_name')
+INDEX_TIMEOUT = 24 * 60 * 60
+FUZZY_CUTOFF = 0.85
+
+_local_lock = threading.Lock()
+_local_indexes = {}
+
+
+# Name index for resolving the team names found in fixture files. Every name,
+# code, short, full and alternate name of the teams in a sport maps to the
+# teams using it, both exactly and case folded. The index is keyed on the
+# sport's cache version, which is bumped whenever one of its teams is saved or
+# deleted, and kept both in the shared cache and in this process so that a
+# lookup is normally a version check and two dict reads.
+
+def normalise(name):
+    return " ".join(name.split()).casefold()
+
+
+def team_names(team):
+    return [n for n in (getattr(team, f) for f in NAME_FIELDS) if n]
+
+
+def build_index(sport_pk):
+    from .models import Team
+    teams = {team.pk: team for team in Team.objects.filter(sport_id=sport_pk)}
+    exact, folded = {}, {}
+    for team in teams.values():
+        for name in team_names(team):
+            exact.setdefault(name, set()).add(team.pk)
+            folded.setdefault(normalise(name), set()).add(team.pk)
+    g_logger.debug("built team index for sport %s with %d teams", sport_pk, len(teams))
+    return {'teams': teams, 'exact': exact, 'folded': folded}
+
+
+def get_index(sport_pk):
+    version = sport_version(sport_pk)
+    with _local_lock:
+        local = _local_indexes.get(sport_pk)
+    if local is not None and local[0] == version:
+        return local[1]
+
+    key = "team_index:%s:%s" % (sport_pk, version)
+    index = cache.get(key)
+    if index is None:
+        index = build_index(sport_pk)
+        cache.set(key, index, INDEX_TIMEOUT)
+    with _local_lock:
+        _local_indexes[sport_pk] = (version, index)
+    return index
+
+
+def lookup(index, name, ignore_case=False, fuzzy=False):
+    """The pks of the teams matching name, trying each enabled match in turn
+
+    fuzzy implies ignore_case and only accepts a single close name."""
+    pks = index['exact'].get(name)
+    if pks or not (ignore_case or fuzzy):
+        return pks or set()
+
+    folded = normalise(name)
+    pks = index['folded'].get(folded)
+    if pks or not fuzzy:
+        return pks or set()
+
+    close = difflib.get_close_matches(folded, index['folded'], n=2, cutoff=FUZZY_CUTOFF)
+    if len(close) == 1:
+        g_logger.info("matched team %r to %r", name, close[0])
+        return index['folded'][close[0]]
+    return set()
+
+
+def find_team(sport, name, ignore_case=False, fuzzy=False):
+    from .models import Team
+    index = get_index(sport.pk)
+    pks = lookup(index, name, ignore_case=ignore_case, fuzzy=fuzzy)
+    if not pks:
+        raise Team.DoesNotExist("No %s team matches %r" % (sport, name))
+    if len(pks) > 1:
+        raise Team.MultipleObjectsReturned("%d %s teams match %r" % (len(pks), sport, name))
+    # callers may change the team, so never hand out the cached instance
+    return copy.copy(index['teams'][next(iter(pks))])
@@ -1,17 +1,39 @@
+from django.contrib.admin.models import LogEntry
 from django.contrib.auth.models import User, Permission
-from django.test import TestCase, TransactionTestCase
+from allauth.socialaccount.models import SocialAccount
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
 from django.db.models.signals import pre_save
 
 import datetime
+import json
+import os
+import tempfile
 import pytz
 import unittest
+from unittest import mock
 from decimal import Decimal
+from io import StringIO
 import string
 
 from .models import Sport, Tournament, Participant
-from .models import Benchmark, Team, Match, Prediction
+from .models import Benchmark, Team, Match, Prediction, OutboxEmail, SchedulerLease
+from .models import BenchmarkPrediction, TournamentSnapshot
+from . import cache as competition_cache
+from .pagination import KeysetPaginator
+from .simulation import Simulation
+from .projection import project, get_projection, match_outcomes
+from . import parity
+from .reports import top_predictors
+from .schedule import KickOffSchedule
+from . import scheduler
+from .snapshot import take_snapshot, decompress
 
 class CompetitionViewLoggedOutTest(TestCase):
     fixtures = ['social.json']
@@ -739,6 +761,7 @@ class HomePageContent(TestCase):
 
 
     def setUp(self):
+        cache.clear()
         login = self.client.login(username='testuser1', password='test123')
         self.assertTrue(login)
 
@@ -812,6 +835,30 @@ class HomePageContent(TestCase):
         self.assertEqual(len(response.context['matches_recent']), 0)
         self.assertEqual(len(response.context['matches_future']), 0)
 
+    def test_dashboard(self):
+        for tourn in self.tourns:
+            for time in self.times_past_24 + self.times_next_24:
+                Match.objects.create(tournament=tourn, home_team=self.team_a, away_team=self.team_b, kick_off=time)
+
+        url = reverse('competition:dashboard')
+        response = self.client.get(url)
+        self.assertTemplateUsed(response, 'partial/dashboard.html')
+        self.assertEqual(len(response.context['matches_recent']), 8)
+        self.assertEqual(len(response.context['live_tournaments']), 3)
+        self.assertEqual(len(response.context['closed_tournaments']), 1)
+        self.assertContains(response, 'match_no_prediction', count=8)
+
+        # only the session and user are loaded once the data is cached
+        with self.assertNumQueries(2):
+            self.client.get(url)
+
+        match = response.context['matches_future'][0]
+        Prediction.objects.create(user=self.user, match=match, prediction=1)
+        self.assertContains(self.client.get(url), 'match_no_prediction', count=7)
+
+        Participant.objects.create(user=self.user, tournament=self.tourns[2])
+        self.assertEqual(len(self.client.get(url).context['matches_future']), 12)
+
 
 class PredictionsAndMatches(TransactionTestCase):
     fixtures = ['social.json']
@@ -1425,3 +1472,1172 @@ class CsvMatchUploadTest(TestCase):
         self.assertEqual(f"{matches[6]}", "Team J Vs Team G/Team H")
         self.assertEqual(f"{matches[7]}", "Team E/Team F/Team I Vs Team J/Team G/Team H")
         self.assertEqual(f"{matches[8]}", "Team A/Team B/Team C/Team D Vs Team E/Team F/Team I/Team J/Team G/Team H")
+
+
+class GenerateTournamentTest(TestCase):
+    fixtures = ['social.json']
+
+    def test_generate(self):
+        out = StringIO()
+        call_command('generate_tournament', seed=1, teams=8, groups=2, knockout=4,
+                     participants=20, benchmarks=4, organisations=2, played=0.6, stdout=out)
+        self.assertIn('Generated "Synthetic 1"', out.getvalue())
+
+        tourn = Tournament.objects.get(name='Synthetic 1')
+        self.assertEqual(tourn.state, Tournament.ACTIVE)
+        # 2 groups of 4 teams (6 matches each) and a 4 team knockout
+        self.assertEqual(tourn.match_set.count(), 15)
+        self.assertEqual(tourn.participant_set.count(), 20)
+        self.assertEqual(tourn.benchmark_set.count(), 4)
+        self.assertEqual(tourn.competition_set.count(), 2)
+        self.assertEqual(tourn.match_set.filter(score__isnull=False).count(), 9)
+
+        final = tourn.match_set.get(match_id=15)
+        self.assertIsNone(final.home_team)
+        self.assertEqual(final.home_team_winner_of.match_id, 13)
+        self.assertEqual(final.away_team_winner_of.match_id, 14)
+
+        for participant in tourn.participant_set.all():
+            self.assertEqual(participant.user.profile.user, participant.user)
+
+        generated = {p.pk: (p.score, p.margin_per_match) for p in tourn.participant_set.all()}
+        generated_bm = {b.pk: (b.score, b.margin_per_match) for b in tourn.benchmark_set.all()}
+        tourn.update_table()
+        self.assertEqual(generated,
+                         {p.pk: (p.score, p.margin_per_match) for p in tourn.participant_set.all()})
+        self.assertEqual(generated_bm,
+                         {b.pk: (b.score, b.margin_per_match) for b in tourn.benchmark_set.all()})
+
+    def test_generate_same_seed(self):
+        call_command('generate_tournament', seed=2, name='first', participants=5, stdout=StringIO())
+        call_command('generate_tournament', seed=2, name='second', participants=5, stdout=StringIO())
+
+        first = Prediction.objects.filter(match__tournament__name='first')
+        second = Prediction.objects.filter(match__tournament__name='second')
+        self.assertEqual([p.prediction for p in first.order_by('user__username', 'match__match_id')],
+                         [p.prediction for p in second.order_by('user__username', 'match__match_id')])
+
+
+class FragmentCacheTest(TestCase):
+    fixtures = ['social.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser1', password='test123')
+        cls.other_user = User.objects.create_user(username='testuser2', password='test123')
+
+        sport = Sport.objects.create(name='sport')
+        cls.tourn = Tournament.objects.create(name='tourn', sport=sport, state=Tournament.ACTIVE)
+        Participant.objects.create(user=cls.user, tournament=cls.tourn)
+        Participant.objects.create(user=cls.other_user, tournament=cls.tourn)
+
+        team_a = Team.objects.create(name='team A', code='AAA', sport=sport)
+        team_b = Team.objects.create(name='team B', code='BBB', sport=sport)
+        cls.match = Match.objects.create(tournament=cls.tourn, home_team=team_a, away_team=team_b,
+                                         kick_off=timezone.now() - datetime.timedelta(hours=1))
+        Prediction.objects.create(match=cls.match, prediction=7, user=cls.user)
+        Prediction.objects.create(match=cls.match, prediction=-3, user=cls.other_user)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_table(self):
+        url = reverse('competition:table', kwargs={'slug': self.tourn.slug})
+        response = self.client.get(url)
+        self.assertNotContains(response, '123.00')
+
+        # changes that bypass save() are not seen until the tournament version is bumped
+        Participant.objects.filter(user=self.user).update(score=123)
+        response = self.client.get(url)
+        self.assertNotContains(response, '123.00')
+
+        self.match.score = 4
+        self.match.save()
+        response = self.client.get(url)
+        self.assertContains(response, '1.00')  # 7 vs 4: margin 3 - bonus 2
+        self.assertContains(response, '7.00')  # -3 vs 4: margin 7
+
+    def test_match(self):
+        url = reverse('competition:match', kwargs={'match_pk': self.match.pk})
+        response = self.client.get(url)
+        self.assertContains(response, '-3.00')
+
+        Prediction.objects.filter(user=self.other_user).update(prediction=-9)
+        response = self.client.get(url)
+        self.assertContains(response, '-3.00')
+
+        prediction = Prediction.objects.get(user=self.other_user)
+        prediction.save()
+        response = self.client.get(url)
+        self.assertContains(response, '-9.00')
+        self.assertNotContains(response, '-3.00')
+
+
+class CacheLayerTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        competition_cache.reset_stats()
+
+    def test_tournament_cached(self):
+        calls = []
+
+        def count():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(competition_cache.tournament_cached(1, 'count', count), 1)
+        self.assertEqual(competition_cache.tournament_cached(1, 'count', count), 1)
+        self.assertEqual(competition_cache.tournament_cached(2, 'count', count), 2)
+
+        competition_cache.bump_tournament(1)
+        self.assertEqual(competition_cache.tournament_cached(1, 'count', count), 3)
+        self.assertEqual(competition_cache.tournament_cached(2, 'count', count), 2)
+
+        stats = competition_cache.cache_stats()
+        self.assertEqual(stats['count'], {'hits': 2, 'misses': 3})
+
+        out = StringIO()
+        call_command('cache_stats', reset=True, stdout=out)
+        self.assertIn('count', out.getvalue())
+        self.assertEqual(competition_cache.cache_stats(), {})
+
+    def test_version_evicted(self):
+        version = competition_cache.tournament_version(1)
+        key = competition_cache.tournament_key(1, 'name')
+        cache.delete('version:tournament:1')
+        self.assertGreaterEqual(competition_cache.tournament_version(1), version)
+        competition_cache.bump_tournament(1)
+        self.assertNotEqual(competition_cache.tournament_key(1, 'name'), key)
+
+
+class PredictionsPaginationTest(TestCase):
+    fixtures = ['social.json']
+
+    def setUp(self):
+        cache.clear()
+        call_command('generate_tournament', seed=3, name='paged', participants=2, benchmarks=1,
+                     organisations=0, played=1.0, coverage=1.0, password='secret', stdout=StringIO())
+        self.tourn = Tournament.objects.get(name='paged')
+        self.user, self.other = [p.user for p in self.tourn.participant_set.order_by('user__username')]
+        self.client.login(username=self.user.username, password='secret')
+
+    def test_own_predictions(self):
+        # 24 group matches and 7 knockout matches
+        response = self.client.get(reverse('competition:predictions', args=[self.tourn.slug]))
+        self.assertEqual(len(response.context['predictions']), 20)
+        self.assertEqual(response.context['predictions'].paginator.num_pages, 2)
+        self.assertContains(response, '?page=2')
+
+        response = self.client.get(reverse('competition:predictions', args=[self.tourn.slug]),
+                                   {'page': 2})
+        self.assertEqual(len(response.context['predictions']), 11)
+
+    def test_other_user_predictions(self):
+        url = reverse('competition:predictions', args=[self.tourn.slug])
+        response = self.client.get(url, {'user': self.other.username})
+        self.assertContains(response, '?user=%s&amp;page=2' % self.other.username)
+
+        response = self.client.get(url, {'user': self.other.username, 'page': 2})
+        self.assertEqual(len(response.context['predictions']), 11)
+        self.assertTrue(all(p.user == self.other for p in response.context['predictions']))
+
+    def test_benchmark_predictions(self):
+        benchmark = self.tourn.benchmark_set.get()
+        response = self.client.get(reverse('competition:benchmark', args=[benchmark.pk]),
+                                   {'page': 2})
+        self.assertEqual(response.context['predictions'].number, 2)
+        self.assertEqual(len(response.context['predictions']), 11)
+
+
+class KeysetPaginationTest(TestCase):
+    fixtures = ['social.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('generate_tournament', seed=4, name='keyset', participants=45, benchmarks=3,
+                     organisations=0, played=0.5, password='secret', stdout=StringIO())
+        cls.tourn = Tournament.objects.get(name='keyset')
+        # a tie on score to check that pk breaks it
+        first, second = cls.tourn.participant_set.order_by('pk')[:2]
+        Participant.objects.filter(pk=second.pk).update(score=first.score)
+
+    def setUp(self):
+        cache.clear()
+
+    def expected(self, querysets):
+        rows = [(p.score is None, p.score or 0, source, p.pk, p)
+                for source, qs in enumerate(querysets) for p in qs]
+        return [row[-1] for row in sorted(rows, key=lambda row: row[:4])]
+
+    def walk(self, paginator):
+        page = paginator.page()
+        rows = list(page)
+        while page.has_next():
+            page = paginator.page(after=page.next_cursor)
+            self.assertEqual(page.start_index(), len(rows) + 1)
+            rows += list(page)
+        return page, rows
+
+    def test_forward_and_back(self):
+        participants = self.tourn.participant_set.all()
+        paginator = KeysetPaginator(participants, 20)
+        page, rows = self.walk(paginator)
+        self.assertEqual(rows, self.expected([participants]))
+        self.assertEqual(paginator.num_pages, 3)
+        self.assertEqual(page.number, 3)
+
+        page = paginator.page(before=page.previous_cursor)
+        self.assertEqual(list(page), rows[20:40])
+        self.assertTrue(page.has_previous())
+        page = paginator.page(before=page.previous_cursor)
+        self.assertEqual(list(page), rows[:20])
+        self.assertFalse(page.has_previous())
+
+        for i, participant in enumerate(rows):
+            self.assertEqual(paginator.rank(participant), i + 1)
+
+    def test_merged_querysets(self):
+        querysets = [self.tourn.participant_set.all(), self.tourn.benchmark_set.all()]
+        paginator = KeysetPaginator(querysets, 7)
+        page, rows = self.walk(paginator)
+        self.assertEqual(rows, self.expected(querysets))
+        self.assertEqual(paginator.count, 48)
+
+    def test_page_around(self):
+        participants = self.tourn.participant_set.all()
+        rows = self.expected([participants])
+        paginator = KeysetPaginator(participants, 10)
+        page = paginator.page_around(rows[30])
+        self.assertEqual(list(page), rows[25:35])
+        self.assertEqual(page.start_index(), 26)
+
+        page = paginator.page_around(rows[1])
+        self.assertEqual(list(page), rows[:10])
+        self.assertFalse(page.has_previous())
+
+    def test_table_view(self):
+        rows = self.expected([self.tourn.participant_set.all()])
+        user = rows[33].user
+        self.client.login(username=user.username, password='secret')
+        url = reverse('competition:table', kwargs={'slug': self.tourn.slug})
+
+        response = self.client.get(url, {'mine': 1})
+        self.assertEqual(list(response.context['participants']), rows[23:43])
+        self.assertContains(response, '24th')
+
+        response = self.client.get(url, {'after': response.context['participants'].next_cursor})
+        self.assertEqual(list(response.context['participants']), rows[43:])
+
+    def test_match_view_mine(self):
+        match = self.tourn.match_set.filter(score__isnull=False).order_by('match_id')[0]
+        predictions = list(match.prediction_set.order_by('score', 'pk').select_related('user'))
+        own = predictions[2]
+        url = reverse('competition:match', kwargs={'match_pk': match.pk})
+
+        self.client.login(username=own.user.username, password='secret')
+        response = self.client.get(url, {'mine': 1})
+        names = [p.predictor_name for p in response.context['predictions']]
+        self.assertNotIn('', names)
+        self.assertIn(own.user.participant_set.get(tournament=self.tourn).display_name, names)
+
+        # the cached fragment of the same page is served to other users
+        other = predictions[-1].user
+        self.client.login(username=other.username, password='secret')
+        response = self.client.get(url)
+        for prediction in predictions[:3]:
+            name = prediction.user.participant_set.get(tournament=self.tourn).display_name
+            self.assertContains(response, '<td>%s</td>' % name, html=True)
+
+    def test_bad_cursor(self):
+        paginator = KeysetPaginator(self.tourn.participant_set.all(), 20)
+        self.assertEqual(list(paginator.page(after='nonsense')), list(paginator.page()))
+
+
+class SimulationTest(TestCase):
+    fixtures = ['social.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('generate_tournament', seed=5, name='simulated', participants=30, benchmarks=4,
+                     organisations=0, played=0.7, stdout=StringIO())
+        cls.tourn = Tournament.objects.get(name='simulated')
+        # make sure some draws are scored
+        for match in cls.tourn.match_set.filter(score__isnull=False)[:3]:
+            match.score = 0
+            match.save()
+
+    def rescore(self, bonus, draw_bonus):
+        Tournament.objects.filter(pk=self.tourn.pk).update(bonus=bonus, draw_bonus=draw_bonus)
+        tourn = Tournament.objects.get(pk=self.tourn.pk)
+        for match in tourn.match_set.filter(score__isnull=False):
+            tourn.check_predictions(match)
+        return tourn
+
+    def test_current_rules(self):
+        simulation = Simulation(self.tourn)
+        leaderboard = simulation.leaderboard(self.tourn.bonus, self.tourn.draw_bonus, benchmarks=True)
+        self.assertEqual(len(leaderboard), 34)
+        for predictor, score in leaderboard:
+            predictor.refresh_from_db()
+            self.assertEqual(predictor.score, score)
+
+    def test_alternative_rules(self):
+        simulation = Simulation(self.tourn)
+        changes = simulation.compare(Decimal('3.5'), Decimal('2'), benchmarks=True)
+
+        self.rescore(Decimal('3.5'), Decimal('2'))
+        for row in changes:
+            row['predictor'].refresh_from_db()
+            self.assertEqual(row['predictor'].score, row['score'])
+        self.assertEqual(sorted(row['rank'] for row in changes), list(range(1, 35)))
+        self.assertEqual(sum(row['movement'] for row in changes), 0)
+
+    def test_admin_action(self):
+        user = User.objects.create_superuser(username='admin', password='test123', email='a@b.com')
+        self.client.force_login(user)
+        url = reverse('admin:competition_tournament_changelist')
+        response = self.client.post(url, {'action': 'simulate_rules', '_selected_action': [self.tourn.pk]})
+        self.assertTemplateUsed(response, 'admin/simulate_rules.html')
+        self.assertEqual(response.context['form'].initial['bonus'], self.tourn.bonus)
+
+        response = self.client.post(url, {'action': 'simulate_rules', '_selected_action': [self.tourn.pk],
+                                          'apply': 'Simulate', 'bonus': '0', 'draw_bonus': '1'})
+        tournament, changes = response.context['results'][0]
+        self.assertEqual(len(changes), 30)
+
+
+class ProjectionTest(TestCase):
+    fixtures = ['social.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('generate_tournament', seed=6, name='projected', teams=8, groups=2, knockout=0,
+                     participants=12, benchmarks=0, organisations=0, played=0.5, password='secret',
+                     stdout=StringIO())
+        cls.tourn = Tournament.objects.get(name='projected')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_match_outcomes(self):
+        participants = list(self.tourn.participant_set.order_by('pk'))
+        predictions = {participants[0].user_id: (Decimal(5), False),
+                       participants[1].user_id: (Decimal(-3), False),
+                       participants[2].user_id: (Decimal(5), True)}
+        results, weights, scores = match_outcomes(self.tourn, predictions, participants)
+        self.assertEqual(results, [-3, 5])
+        self.assertEqual(weights, [1, 1])
+        # participant 0 scores -bonus for an exact result, participant 2 was late
+        self.assertEqual(scores[1][:3], [-2.0, 8.0, 0.0])
+        self.assertEqual(scores[0][3], 3.0)
+
+    def test_project(self):
+        projection = project(self.tourn, simulations=300, top_n=3, seed=1)
+        self.assertEqual(projection['remaining'], 6)
+        odds = projection['odds']
+        self.assertEqual(set(odds), set(self.tourn.participant_set.values_list('pk', flat=True)))
+        self.assertAlmostEqual(sum(win for win, top in odds.values()), 100.0)
+        self.assertAlmostEqual(sum(top for win, top in odds.values()), 300.0)
+        self.assertEqual(get_projection(self.tourn.pk)['odds'], odds)
+
+        competition_cache.bump_tournament(self.tourn.pk)
+        self.assertIsNone(get_projection(self.tourn.pk))
+
+    def test_process_pool(self):
+        single = project(self.tourn, simulations=200, seed=2)
+        pooled = project(self.tourn, simulations=200, workers=2, seed=2)
+        self.assertAlmostEqual(sum(win for win, top in pooled['odds'].values()), 100.0)
+        self.assertEqual(single['simulations'], pooled['simulations'])
+
+    def test_finished(self):
+        # nothing left to play, the leader has won
+        self.tourn.match_set.filter(score__isnull=True).update(score=1)
+        self.tourn.update_table()
+        projection = project(self.tourn, simulations=10, top_n=1)
+        leader = self.tourn.participant_set.order_by('score', 'pk')[0]
+        self.assertEqual(projection['odds'][leader.pk], (100.0, 100.0))
+
+    def test_table(self):
+        user = self.tourn.participant_set.first().user
+        self.client.login(username=user.username, password='secret')
+        url = reverse('competition:table', kwargs={'slug': self.tourn.slug})
+        response = self.client.get(url)
+        self.assertNotContains(response, 'Top 3')
+
+        call_command('project_odds', tournament=self.tourn.slug, simulations=50, workers=1,
+                     stdout=StringIO())
+        response = self.client.get(url)
+        self.assertContains(response, 'Top 3')
+        self.assertEqual(len(response.context['leaderboard'][0]), 6)
+
+
+class ScoringParityTest(TestCase):
+    fixtures = ['social.json']
+
+    def generate(self, seed, **options):
+        call_command('generate_tournament', seed=seed, name='parity %d' % seed, teams=8, groups=2,
+                     knockout=4, participants=15, benchmarks=4, organisations=0, played=0.8,
+                     stdout=StringIO(), **options)
+        return Tournament.objects.get(name='parity %d' % seed)
+
+    def assertParity(self, tourn):
+        generated = parity.snapshot(tourn)
+        results = parity.run(tourn)
+        self.assertEqual(set(results), {'reference'} | set(parity.PATHS))
+        for path, (seconds, diffs) in results.items():
+            self.assertEqual(diffs, [], path)
+        self.assertEqual(parity.differences(parity.snapshot(tourn), generated), [])
+
+    def test_random_tournaments(self):
+        for seed in range(3):
+            self.assertParity(self.generate(seed))
+
+    def test_edge_cases(self):
+        tourn = self.generate(10, coverage=0.5)
+        Tournament.objects.filter(pk=tourn.pk).update(bonus=Decimal('1.5'), draw_bonus=Decimal('2.25'))
+        tourn.refresh_from_db()
+        played = list(tourn.match_set.filter(score__isnull=False))
+        for match in played[:3]:
+            match.score = 0
+            match.save()
+        tourn.benchmark_set.filter(name='Mean').update(can_receive_bonus=False)
+        Prediction.objects.filter(match=played[3]).update(prediction=Decimal('0.5'))
+
+        predictions = Prediction.objects.filter(match__tournament=tourn, match__score__isnull=False)
+        self.assertTrue(predictions.filter(late=True).exists())
+        self.assertTrue(predictions.filter(match__score=0).exists())
+
+        results = parity.run(tourn)
+        for path, (seconds, diffs) in results.items():
+            self.assertEqual(diffs, [], path)
+
+    def test_detects_differences(self):
+        tourn = self.generate(20)
+
+        def wrong_path(tournament):
+            snapshot = parity.reference_path(tournament)
+            key = sorted(snapshot['predictors'])[0]
+            snapshot['predictors'][key] = (Decimal('999.00'), None)
+            return snapshot
+
+        results = parity.run(tourn, {'wrong': wrong_path})
+        self.assertEqual(len(results['wrong'][1]), 1)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('scoring_parity', seeds=1, participants=10, stdout=out)
+        self.assertIn('0 differences', out.getvalue())
+        self.assertFalse(Tournament.objects.filter(name__startswith='Parity').exists())
+
+
+class TeamIndexTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sport = Sport.objects.create(name='sport')
+        cls.team_a = Team.objects.create(name='Team A', code='AAA', short_name='A',
+                                         full_name='The A Team', alt_name='Alpha', sport=cls.sport)
+        cls.team_b = Team.objects.create(name='Team B', code='BBB', sport=cls.sport)
+        cls.other = Team.objects.create(name='Team A', code='AAA', sport=Sport.objects.create(name='other'))
+
+    def test_find_team(self):
+        for name in ('Team A', 'AAA', 'A', 'The A Team', 'Alpha'):
+            self.assertEqual(self.sport.find_team(name), self.team_a)
+        with self.assertRaises(Team.DoesNotExist):
+            self.sport.find_team('team a')
+        self.assertEqual(self.sport.find_team('  team   a', ignore_case=True), self.team_a)
+        self.assertEqual(self.sport.find_team('The A-Team', fuzzy=True), self.team_a)
+        with self.assertRaises(Team.DoesNotExist):
+            self.sport.find_team('Team', fuzzy=True)
+
+    def test_cached(self):
+        self.sport.find_team('Team A')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.sport.find_team('BBB'), self.team_b)
+
+    def test_invalidated(self):
+        self.assertEqual(self.sport.find_team('Team B'), self.team_b)
+        self.team_b.alt_name = 'Bravo'
+        self.team_b.save()
+        self.assertEqual(self.sport.find_team('Bravo'), self.team_b)
+        self.team_b.delete()
+        with self.assertRaises(Team.DoesNotExist):
+            self.sport.find_team('Team B')
+
+    def test_returns_copy(self):
+        team = self.sport.find_team('Team A')
+        team.name = 'changed'
+        self.assertEqual(self.sport.find_team('AAA').name, 'Team A')
+
+    def test_validate_unique(self):
+        team = Team(name='Alpha', code='CCC', short_name='B', full_name='Team B', sport=self.sport)
+        with self.assertRaises(ValidationError) as cm:
+            team.validate_unique()
+        self.assertEqual(set(cm.exception.message_dict), {'name', 'full_name'})
+
+        self.team_a.validate_unique()
+        Team(name='Team C', code='CCC', short_name='C', sport=self.sport).validate_unique()
+
+
+class TeamMergeTest(TestCase):
+
+    def setUp(self):
+        self.sport = Sport.objects.create(name='sport')
+        self.tourn = Tournament.objects.create(name='tourn', sport=self.sport, state=Tournament.ACTIVE)
+        self.team_a = Team.objects.create(name='Team A', code='AAA', sport=self.sport)
+        self.team_b = Team.objects.create(name='Team B', code='BBB', sport=self.sport)
+        self.team_c = Team.objects.create(name='Team C', code='CCC', sport=self.sport)
+        kick_off = timezone.now()
+        self.m1 = Match.objects.create(tournament=self.tourn, home_team=self.team_a, away_team=self.team_c,
+                                       kick_off=kick_off)
+        self.m2 = Match.objects.create(tournament=self.tourn, home_team=self.team_b, away_team=self.team_c,
+                                       kick_off=kick_off)
+        self.m3 = Match.objects.create(tournament=self.tourn, home_team=self.team_a, away_team=self.team_b,
+                                       kick_off=kick_off)
+        Match.objects.create(tournament=self.tourn, home_team_winner_of=self.m2,
+                             away_team_winner_of=self.m1, kick_off=kick_off)
+        user = User.objects.create_superuser(username='admin', password='test123', email='a@b.com')
+        self.client.force_login(user)
+        self.url = reverse('admin:competition_team_changelist')
+
+    def test_preview(self):
+        self.assertEqual(self.team_a.merge_preview([self.team_b]),
+                         {'matches': 2, 'tournaments': 1, 'same_team': 1, 'placeholders': 1})
+        response = self.client.post(self.url, {'action': 'merge',
+                                               '_selected_action': [self.team_a.pk, self.team_b.pk]})
+        self.assertTemplateUsed(response, 'admin/merge_teams.html')
+        self.assertEqual(response.context['counts']['matches'], 2)
+        self.assertTrue(Team.objects.filter(pk=self.team_b.pk).exists())
+
+    def test_merge(self):
+        self.assertEqual(self.sport.find_team('BBB'), self.team_b)
+        response = self.client.post(self.url, {
+            'action': 'merge', 'apply': 'Merge teams',
+            '_selected_action': [self.team_a.pk, self.team_b.pk],
+            'name': 'Team A', 'code': 'BBB', 'short_name': 'A'})
+        self.assertEqual(response.status_code, 302)
+
+        self.assertFalse(Team.objects.filter(pk=self.team_b.pk).exists())
+        self.m2.refresh_from_db()
+        self.assertEqual(self.m2.home_team, self.team_a)
+        self.assertEqual(self.sport.find_team('BBB'), self.team_a)
+        self.assertEqual(str(Match.objects.last()), "Team A/Team C Vs Team A/Team C")
+
+        self.assertEqual(LogEntry.objects.filter(object_id=str(self.team_a.pk)).get().change_message,
+                         "Merged Team B into Team A, 2 matches updated")
+        self.assertTrue(LogEntry.objects.filter(object_id=str(self.team_b.pk)).exists())
+
+    def test_invalid_form_rolls_back(self):
+        response = self.client.post(self.url, {
+            'action': 'merge', 'apply': 'Merge teams',
+            '_selected_action': [self.team_a.pk, self.team_b.pk],
+            'name': 'Team C', 'code': 'AAA'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Team.objects.filter(pk=self.team_b.pk).exists())
+        self.m2.refresh_from_db()
+        self.assertEqual(self.m2.home_team, self.team_b)
+
+
+class SwapHomeAndAwayTest(TestCase):
+    fixtures = ['social.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('generate_tournament', seed=7, name='swapped', participants=12, benchmarks=3,
+                     organisations=0, played=0.6, stdout=StringIO())
+        cls.tourn = Tournament.objects.get(name='swapped')
+
+    def test_swap(self):
+        match = self.tourn.match_set.exclude(score=0).filter(score__isnull=False).first()
+        home, away, score = match.home_team, match.away_team, match.score
+        missing = Prediction.objects.filter(match=match).first()
+        missing.delete()
+        benchmark_predictions = dict(match.benchmarkprediction_set.values_list('pk', 'prediction'))
+        self.assertTrue(benchmark_predictions)
+
+        user = User.objects.create_superuser(username='admin', password='test123', email='a@b.com')
+        self.client.force_login(user)
+        response = self.client.post(reverse('admin:competition_match_changelist'), {
+            'action': 'swap_home_and_away', '_selected_action': [match.pk]})
+        self.assertEqual(response.status_code, 302)
+
+        match.refresh_from_db()
+        self.assertEqual((match.home_team, match.away_team, match.score), (away, home, -score))
+        for pk, prediction in match.benchmarkprediction_set.values_list('pk', 'prediction'):
+            self.assertEqual(prediction, -benchmark_predictions[pk])
+        self.assertTrue(Prediction.objects.get(match=match, user=missing.user).late)
+
+        swapped = parity.snapshot(self.tourn)
+        self.assertEqual(parity.differences(parity.reference_path(self.tourn), swapped), [])
+
+    def test_unplayed(self):
+        match = self.tourn.match_set.filter(score__isnull=True, home_team__isnull=False,
+                                            away_team__isnull=False).first()
+        predictions = dict(match.prediction_set.values_list('pk', 'prediction'))
+        self.assertTrue(predictions)
+        Match.objects.filter(pk=match.pk).swap_home_and_away()
+        for pk, prediction in match.prediction_set.values_list('pk', 'prediction'):
+            self.assertEqual(prediction, -predictions[pk])
+            self.assertIsNone(match.prediction_set.get(pk=pk).score)
+
+
+class TopReportTest(TestCase):
+    fixtures = ['social.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('generate_tournament', seed=8, name='reported', participants=15, benchmarks=0,
+                     organisations=0, played=0.6, stdout=StringIO())
+        cls.tourn = Tournament.objects.get(name='reported')
+        cls.matches = cls.tourn.match_set.filter(score__isnull=False)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_report(self):
+        best = self.tourn.participant_set.order_by('score', 'pk').first()
+        SocialAccount.objects.create(user=best.user, provider='twitter', uid='1',
+                                     extra_data={'screen_name': 'best_handle'})
+
+        with self.assertNumQueries(4):
+            rows = top_predictors(self.matches, 5, 'twitter')
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['user_id'], best.user_id)
+        self.assertEqual(rows[0]['score'], best.score)
+        self.assertEqual((rows[0]['social_name'], rows[0]['handle']), ('best_handle', True))
+        self.assertFalse(rows[1]['handle'])
+        self.assertEqual([row['score'] for row in rows], sorted(row['score'] for row in rows))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(top_predictors(self.matches, 5, 'twitter'), rows)
+
+        prediction = Prediction.objects.filter(match__in=self.matches, user=best.user).first()
+        prediction.score += 100
+        prediction.save()
+        self.assertNotEqual(top_predictors(self.matches, 5, 'twitter')[0]['user_id'], best.user_id)
+
+    def test_ties_and_users(self):
+        match = self.matches.first()
+        users = User.objects.filter(prediction__match=match)[:3]
+        Prediction.objects.filter(match=match).update(score=1)
+        rows = top_predictors(self.tourn.match_set.filter(pk=match.pk), 10, users=users)
+        self.assertEqual([row['position'] for row in rows], [1, 1, 1])
+
+    def test_csv(self):
+        user = User.objects.create_superuser(username='admin', password='test123', email='a@b.com')
+        self.client.force_login(user)
+        response = self.client.post(reverse('admin:competition_match_changelist'), {
+            'action': 'show_top_ten', '_selected_action': list(self.matches.values_list('pk', flat=True)),
+            'csv': 'Download CSV'})
+        lines = response.content.decode().splitlines()
+        self.assertEqual(lines[0], 'position,username,name,social_name,score,average_margin,predictions')
+        self.assertEqual(len(lines), 11)
+
+        out = StringIO()
+        call_command('top_report', 'reported', top=3, first=1, last=4, stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 4)
+
+
+class KickOffScheduleTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        sport = Sport.objects.create(name='sport')
+        cls.home = Team.objects.create(name='Home', code='HOM', sport=sport)
+        cls.away = Team.objects.create(name='Away', code='AWY', sport=sport)
+        cls.tourn = Tournament.objects.create(name='scheduled', sport=sport, state=Tournament.ACTIVE)
+        cls.closed = Tournament.objects.create(name='closed', sport=sport, state=Tournament.FINISHED)
+        now = timezone.now()
+        cls.soon = cls.add_match(cls.tourn, now + datetime.timedelta(minutes=1))
+        cls.later = cls.add_match(cls.tourn, now + datetime.timedelta(days=1))
+        cls.started = cls.add_match(cls.tourn, now - datetime.timedelta(hours=1))
+        cls.finished = cls.add_match(cls.closed, now + datetime.timedelta(hours=1))
+        cls.user = User.objects.create_user(username='predictor', password='test123')
+
+    @classmethod
+    def add_match(cls, tournament, kick_off):
+        return Match.objects.create(tournament=tournament, kick_off=kick_off,
+                                    home_team=cls.home, away_team=cls.away)
+
+    def setUp(self):
+        cache.clear()
+        self.schedule = KickOffSchedule()
+
+    def test_open_matches(self):
+        self.assertEqual(self.schedule.open_matches(), {self.soon.pk, self.later.pk})
+        self.assertEqual(self.schedule.open_matches(self.closed.pk), set())
+        self.assertTrue(self.schedule.is_open(str(self.soon.pk)))
+        self.assertFalse(self.schedule.is_open(self.started.pk))
+        self.assertEqual(self.schedule.next_lock(), self.soon.kick_off)
+
+        match = self.add_match(self.tourn, timezone.now() + datetime.timedelta(hours=2))
+        self.assertTrue(self.schedule.is_open(match.pk))
+
+    def test_lock_boundary(self):
+        self.schedule.is_open(self.soon.pk)
+        kicked_off = self.soon.kick_off + datetime.timedelta(seconds=1)
+        with mock.patch('competition.schedule.timezone.now', return_value=kicked_off):
+            with self.assertNumQueries(0):
+                self.assertFalse(self.schedule.is_open(self.soon.pk))
+                self.assertTrue(self.schedule.is_open(self.later.pk))
+                self.assertEqual(self.schedule.next_lock(), self.later.kick_off)
+
+    def test_late_write(self):
+        prediction = Prediction(user=self.user, match=self.started, prediction=3)
+        self.assertFalse(prediction.save_before_kick_off())
+        self.assertIsNone(prediction.pk)
+        self.assertFalse(Prediction.objects.exists())
+
+        self.client.force_login(self.user)
+        response = self.client.post(
+                reverse('competition:prediction_create', kwargs={'match_pk': self.started.pk}),
+                {'prediction_prediction': 3})
+        self.assertEqual(response.status_code, 404)
+
+        # kicks off after the schedule was loaded, without bumping it
+        self.client.get(reverse('competition:prediction_create', kwargs={'match_pk': self.soon.pk}))
+        Match.objects.filter(pk=self.soon.pk).update(kick_off=timezone.now())
+        response = self.client.post(
+                reverse('competition:prediction_create', kwargs={'match_pk': self.soon.pk}),
+                {'prediction_prediction': 3})
+        self.assertContains(response, "Match has already started")
+        self.assertFalse(Prediction.objects.exists())
+
+        response = self.client.post(
+                reverse('competition:prediction_create', kwargs={'match_pk': self.later.pk}),
+                {'prediction_prediction': 3})
+        self.assertContains(response, "prediction created")
+        self.assertTrue(Prediction.objects.filter(match=self.later).exists())
+
+
+class SchedulerTest(TestCase):
+    fixtures = ['social.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('generate_tournament', seed=9, name='scheduled', participants=10, benchmarks=2,
+                     organisations=0, played=0.5, stdout=StringIO())
+        cls.tourn = Tournament.objects.get(name='scheduled')
+        cls.pending = Tournament.objects.create(name='pending', sport=cls.tourn.sport)
+
+    def test_lease(self):
+        minute = datetime.timedelta(minutes=1)
+        self.assertTrue(SchedulerLease.objects.acquire(scheduler.LEASE_NAME, 'a', minute))
+        self.assertFalse(SchedulerLease.objects.acquire(scheduler.LEASE_NAME, 'b', minute))
+        self.assertTrue(SchedulerLease.objects.acquire(scheduler.LEASE_NAME, 'a', minute))
+        self.assertIsNone(scheduler.run_once('b'))
+
+        SchedulerLease.objects.filter(name=scheduler.LEASE_NAME).update(expires=timezone.now())
+        self.assertTrue(SchedulerLease.objects.acquire(scheduler.LEASE_NAME, 'b', minute))
+        SchedulerLease.objects.release(scheduler.LEASE_NAME, 'b')
+        self.assertTrue(SchedulerLease.objects.acquire(scheduler.LEASE_NAME, 'a', minute))
+
+    def test_lifecycle(self):
+        now = timezone.now()
+        Tournament.objects.filter(pk=self.pending.pk).update(open_at=now)
+        Tournament.objects.filter(pk=self.tourn.pk).update(close_at=now + datetime.timedelta(days=1))
+
+        with override_settings(DEFER_EMAILS=True):
+            done = scheduler.run_once('runner')
+        self.assertEqual(done['opened'], 1)
+        self.assertEqual(done['closed'], 0)
+        self.assertNotIn('rebuilt', done)
+        self.pending.refresh_from_db()
+        self.assertEqual(self.pending.state, Tournament.ACTIVE)
+        self.assertEqual(OutboxEmail.objects.filter(sent__isnull=True).count(), 0)
+        self.assertEqual(OutboxEmail.objects.count(), User.objects.count())
+
+        Tournament.objects.filter(pk=self.tourn.pk).update(close_at=now)
+        self.assertEqual(scheduler.run_once('runner')['closed'], 1)
+        self.tourn.refresh_from_db()
+        self.assertEqual(self.tourn.state, Tournament.FINISHED)
+        self.assertIsNotNone(self.tourn.winner)
+
+    def test_scoring(self):
+        expected = parity.reference_path(self.tourn)
+        parity.clear_scores(self.tourn)
+        done = scheduler.run_once('runner', rebuild=True)
+        self.assertEqual(done['scored'], self.tourn.match_set.filter(score__isnull=False).count())
+        self.assertEqual(parity.differences(expected, parity.snapshot(self.tourn)), [])
+        self.assertEqual(scheduler.run_once('runner')['scored'], 0)
+
+    def test_outbox_claim(self):
+        for user in User.objects.all()[:3]:
+            OutboxEmail.objects.create(user=user, subject='subject', message='message')
+
+        def other_runner(*args, **kwargs):
+            # claims the remaining emails after this runner selected them
+            OutboxEmail.objects.filter(sent__isnull=True).update(sent=timezone.now())
+            return True
+        with mock.patch('member.models.Profile.email_user', side_effect=other_runner) as send:
+            self.assertEqual(OutboxEmail.objects.send_pending(), 1)
+        self.assertEqual(send.call_count, 1)
+        self.assertEqual(OutboxEmail.objects.filter(sent__isnull=True).count(), 0)
+
+
+class IngestResultsTest(TestCase):
+    fixtures = ['social.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('generate_tournament', seed=10, name='ingested', participants=10, benchmarks=2,
+                     organisations=0, played=0.5, stdout=StringIO())
+        cls.tourn = Tournament.objects.get(name='ingested')
+
+    def ingest(self, suffix, content):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w') as feed:
+            feed.write(content)
+        self.addCleanup(os.remove, path)
+        out, err = StringIO(), StringIO()
+        call_command('ingest_results', self.tourn.slug, path, stdout=out, stderr=err)
+        return out.getvalue().splitlines()[-1], err.getvalue()
+
+    def test_ingest(self):
+        unplayed = self.tourn.match_set.filter(score__isnull=True, home_team__isnull=False,
+                                               away_team__isnull=False).order_by('match_id')
+        by_id, by_name = unplayed[0], unplayed[1]
+        # the results of matches that have kicked off
+        self.tourn.match_set.filter(pk__in=[by_id.pk, by_name.pk]).update(
+            kick_off=timezone.now() - datetime.timedelta(hours=2))
+        pairs = self.tourn.match_set.filter(home_team=by_name.home_team, away_team=by_name.away_team)
+        self.assertEqual(pairs.count(), 1)
+        feed = "match_id,home_team,away_team,score\n%d,,,7\n,%s,%s,-3\n,Nobody,%s,1\n" % (
+            by_id.match_id, by_name.home_team.name.upper(), by_name.away_team.code, by_name.away_team.name)
+
+        summary, errors = self.ingest('.csv', feed)
+        self.assertEqual(summary, "1 results changed, 2 rows rejected")
+        self.assertIn("row 2:", errors)
+        self.assertIn("row 3:", errors)
+
+        self.tourn.match_set.filter(pk=by_id.pk).update(score=None)
+        summary, errors = self.ingest('.json', json.dumps({'results': [
+            {'match_id': by_id.match_id, 'score': 7},
+            {'home_team': by_name.away_team.name, 'away_team': by_name.home_team.name,
+             'home_score': 1, 'away_score': 4},
+        ]}))
+        self.assertEqual(summary, "2 results changed, 0 rows rejected")
+        by_id.refresh_from_db()
+        by_name.refresh_from_db()
+        self.assertEqual((by_id.score, by_name.score), (7, 3))
+        self.assertFalse(Prediction.objects.filter(match__in=[by_id, by_name], score__isnull=True).exists())
+        self.assertEqual(Prediction.objects.filter(match=by_id).count(), self.tourn.participant_set.count())
+
+        scored = parity.snapshot(self.tourn)
+        self.assertEqual(parity.differences(parity.reference_path(self.tourn), scored), [])
+
+        summary, errors = self.ingest('.json', json.dumps([{'match_id': by_id.match_id, 'score': 7}]))
+        self.assertEqual(summary, "0 results changed, 0 rows rejected")
+
+    def test_bad_feeds(self):
+        match = self.tourn.match_set.filter(score__isnull=True).order_by('match_id')[0]
+        summary, errors = self.ingest('.json', json.dumps([
+            [match.match_id, 7], 3, {'match_id': match.match_id, 'score': 2.5},
+            {'match_id': match.match_id, 'home_score': '1', 'away_score': 'x'},
+            {'match_id': match.match_id, 'score': 2},
+        ]))
+        self.assertEqual(summary, "0 results changed, 5 rows rejected")
+        self.assertIn("row 1: Row is not an object", errors)
+        self.assertIn("row 3: Score 2.5 is not a whole number", errors)
+        self.assertGreater(match.kick_off, timezone.now())
+        self.assertIn("row 5: %s has not kicked off" % match, errors)
+        match.refresh_from_db()
+        self.assertIsNone(match.score)
+
+        for content in ('{"matches": []}', '7'):
+            with self.assertRaisesRegex(CommandError, "must be a list"):
+                self.ingest('.json', content)
+
+
+class ReconcileFixturesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        sport = Sport.objects.create(name='sport')
+        cls.teams = [Team.objects.create(name='Team %s' % c, code=c * 3, sport=sport) for c in 'ABCD']
+        cls.tourn = Tournament.objects.create(name='reconciled', sport=sport, state=Tournament.ACTIVE)
+        cls.kick_off = timezone.now().replace(microsecond=0) + datetime.timedelta(days=3)
+        for match_id, (home, away) in enumerate([(0, 1), (2, 3), (0, 2)], 1):
+            Match.objects.create(tournament=cls.tourn, match_id=match_id, kick_off=cls.kick_off,
+                                 home_team=cls.teams[home], away_team=cls.teams[away])
+        cls.user = User.objects.create_user(username='predictor')
+        Prediction.objects.create(user=cls.user, match=cls.tourn.match_set.get(match_id=1), prediction=5)
+
+    def setUp(self):
+        cache.clear()
+
+    def reconcile(self, rows):
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as fixtures:
+            fixtures.write("match_id,home_team,away_team,kick_off,home_team_winner_of,away_team_winner_of,postponed\n")
+            fixtures.write("".join(row + "\n" for row in rows))
+        self.addCleanup(os.remove, path)
+        out, err = StringIO(), StringIO()
+        call_command('reconcile_fixtures', self.tourn.slug, path, stdout=out, stderr=err)
+        return out.getvalue().splitlines()[-1], err.getvalue()
+
+    def test_reconcile(self):
+        later = self.kick_off + datetime.timedelta(days=1)
+        version = competition_cache.tournament_version(self.tourn.pk)
+        summary, errors = self.reconcile([
+            "1,Team A,Team B,%s,,," % later.isoformat(),
+            ",CCC,DDD,%s,,," % (self.kick_off + datetime.timedelta(days=2)).isoformat(),
+            "3,Team A,Team C,%s,,,true" % self.kick_off.isoformat(),
+            "4,TBD,TBD,%s,1,2," % later.isoformat(),
+            "5,Team A,Team X,%s,,," % later.isoformat(),
+            "6,TBD,Team D,%s,9,," % later.isoformat(),
+        ])
+        self.assertEqual(summary, "2 rescheduled, 1 postponed, 1 new, 0 unchanged, 2 rows rejected")
+        self.assertIn("row 5:", errors)
+        self.assertIn("row 6:", errors)
+        self.assertNotEqual(competition_cache.tournament_version(self.tourn.pk), version)
+
+        matches = {m.match_id: m for m in self.tourn.match_set.all()}
+        self.assertEqual(matches[1].kick_off, later)
+        self.assertEqual(matches[2].kick_off, self.kick_off + datetime.timedelta(days=2))
+        self.assertTrue(matches[3].postponed)
+        self.assertEqual(str(matches[4]), "Team A/Team B Vs Team C/Team D")
+        self.assertEqual(Prediction.objects.get(user=self.user).match, matches[1])
+
+        summary, errors = self.reconcile([
+            "1,Team A,Team B,%s,,," % later.isoformat(),
+            "4,TBD,TBD,%s,1,2," % later.isoformat(),
+        ])
+        self.assertEqual(summary, "0 rescheduled, 0 postponed, 0 new, 2 unchanged, 0 rows rejected")
+
+    def test_new_match_ids(self):
+        later = (self.kick_off + datetime.timedelta(days=1)).isoformat()
+        summary, errors = self.reconcile([
+            ",Team C,Team A,%s,,," % later,
+            "4,Team B,Team D,%s,,," % later,
+            "4,Team B,Team D,%s,,," % self.kick_off.isoformat(),
+        ])
+        self.assertEqual(summary, "0 rescheduled, 0 postponed, 2 new, 0 unchanged, 1 rows rejected")
+        self.assertIn("row 3: Match 4 is in the file more than once", errors)
+        matches = {m.match_id: str(m) for m in self.tourn.match_set.all()}
+        self.assertEqual((matches[4], matches[5]), ("Team B Vs Team D", "Team C Vs Team A"))
+
+
+class ArchiveTest(TestCase):
+    fixtures = ['social.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('generate_tournament', seed=11, name='archived', participants=30, benchmarks=2,
+                     organisations=0, played=1.0, stdout=StringIO())
+        cls.tourn = Tournament.objects.get(name='archived')
+        cls.best, cls.other = cls.tourn.participant_set.order_by('score', 'pk')[:2]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_archive(self):
+        self.assertEqual(self.tourn.state, Tournament.FINISHED)
+        history = list(Prediction.objects.filter(user=self.other.user, match__tournament=self.tourn)
+                       .values_list('match__match_id', 'prediction', 'score'))
+
+        match = self.tourn.match_set.first()
+        match_version = competition_cache.match_version(match.pk)
+        user_version = competition_cache.user_version(self.other.user_id)
+
+        out = StringIO()
+        with mock.patch('competition.models.bump_match') as bump_match:
+            call_command('archive_tournament', self.tourn.slug, prune=True, stdout=out)
+        self.assertIn("predictions pruned", out.getvalue())
+        # without a post_delete signal per prediction
+        self.assertFalse(bump_match.called)
+        self.assertNotEqual(competition_cache.match_version(match.pk), match_version)
+        self.assertNotEqual(competition_cache.user_version(self.other.user_id), user_version)
+        self.tourn.refresh_from_db()
+        self.assertEqual(self.tourn.state, Tournament.ARCHIVED)
+        self.assertTrue(self.tourn.snapshot.pruned)
+        for model in (Prediction, BenchmarkPrediction):
+            self.assertFalse(model.objects.filter(match__tournament=self.tourn).exists())
+
+        self.client.force_login(self.best.user)
+        response = self.client.get(reverse('competition:table', kwargs={'slug': self.tourn.slug}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['snapshot'])
+        first = response.context['leaderboard'][0]
+        self.assertEqual((first[1], first[2]), (self.best.get_name(), str(self.best.score)))
+        self.assertEqual(len(first[4]), 5)
+        self.assertEqual(response.context['participants'].paginator.num_pages, 2)
+
+        response = self.client.get(reverse('competition:predictions', kwargs={'slug': self.tourn.slug}),
+                                   {'user': self.other.user.username})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['other_user'], self.other.get_name())
+        predictions = response.context['predictions']
+        self.assertEqual(predictions.paginator.count, len(history))
+        rows = {(p.match.match_id, Decimal(p.prediction), Decimal(p.score)) for p in predictions}
+        self.assertEqual(len(rows), 20)
+        self.assertLessEqual(rows, set(history))
+        self.assertContains(response, str(predictions[0].match))
+
+    def test_pruned_benchmark(self):
+        benchmark = self.tourn.benchmark_set.first()
+        history = list(benchmark.benchmarkprediction_set.filter(match__postponed=False)
+                       .values_list('match__match_id', 'prediction', 'score'))
+        call_command('archive_tournament', self.tourn.slug, prune=True, stdout=StringIO())
+
+        url = reverse('competition:benchmark', kwargs={'benchmark_pk': benchmark.pk})
+        self.client.force_login(self.best.user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response)
+        self.assertEqual(response.context['other_user'], 'Benchmark "%s"' % benchmark.name)
+        predictions = response.context['predictions']
+        self.assertEqual(predictions.paginator.count, len(history))
+        rows = {(p.match.match_id, Decimal(p.prediction), Decimal(p.score)) for p in predictions}
+        self.assertLessEqual(rows, set(history))
+
+        self.client.force_login(User.objects.create_user('outsider', password='test123'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_unpruned(self):
+        snapshot = TournamentSnapshot.objects.filter(tournament=self.tourn)
+        self.assertFalse(snapshot.exists())
+        user = User.objects.create_superuser(username='admin', password='test123', email='a@b.com')
+        self.client.force_login(user)
+        self.client.post(reverse('admin:competition_tournament_changelist'), {
+            'action': 'archive_tournament', '_selected_action': [self.tourn.pk]})
+        self.assertFalse(snapshot.get().pruned)
+        self.assertTrue(Prediction.objects.filter(match__tournament=self.tourn).exists())
+
+        response = self.client.get(reverse('competition:table', kwargs={'slug': self.tourn.slug}))
+        self.assertTrue(response.context['snapshot'])
+        self.assertFalse(response.context['is_participant'])
+
+    def test_admin_skips_active(self):
+        active = Tournament.objects.create(name='still going', sport=self.tourn.sport,
+                                           state=Tournament.ACTIVE)
+        user = User.objects.create_superuser(username='admin', password='test123', email='a@b.com')
+        self.client.force_login(user)
+        response = self.client.post(reverse('admin:competition_tournament_changelist'), {
+            'action': 'archive_tournament', '_selected_action': [active.pk]}, follow=True)
+        self.assertContains(response, 'skipped still going')
+        active.refresh_from_db()
+        self.assertEqual(active.state, Tournament.ACTIVE)
+        self.assertFalse(TournamentSnapshot.objects.filter(tournament=active).exists())
+
+
+class CloseSnapshotTest(TestCase):
+    fixtures = ['social.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('generate_tournament', seed=13, name='closing', participants=30, benchmarks=2,
+                     organisations=0, played=1.0, stdout=StringIO())
+        cls.tourn = Tournament.objects.get(name='closing')
+        cls.best = cls.tourn.participant_set.order_by('score', 'pk')[0]
+
+    def setUp(self):
+        cache.clear()
+        Tournament.objects.filter(pk=self.tourn.pk).update(state=Tournament.ACTIVE)
+        self.tourn.refresh_from_db()
+        self.tourn.close()
+        self.client.force_login(self.best.user)
+
+    def test_snapshot_is_immutable(self):
+        snapshot = self.tourn.snapshot
+        self.assertEqual(self.tourn.state, Tournament.FINISHED)
+        Participant.objects.filter(pk=self.best.pk).update(score=0)
+        self.assertEqual(take_snapshot(self.tourn).pk, snapshot.pk)
+        snapshot.refresh_from_db()
+        self.assertEqual(decompress(snapshot.data)['participants'][0][3], str(self.best.score))
+
+    def test_close_is_atomic(self):
+        TournamentSnapshot.objects.filter(tournament=self.tourn).delete()
+        Tournament.objects.filter(pk=self.tourn.pk).update(state=Tournament.ACTIVE)
+        tourn = Tournament.objects.get(pk=self.tourn.pk)
+        with mock.patch('member.models.Profile.email_user', return_value=True) as send:
+            with self.captureOnCommitCallbacks(execute=True):
+                with mock.patch('competition.snapshot.take_snapshot', side_effect=RuntimeError):
+                    with self.assertRaises(RuntimeError):
+                        tourn.close()
+            self.assertEqual(Tournament.objects.get(pk=self.tourn.pk).state, Tournament.ACTIVE)
+            self.assertEqual(send.call_count, 0)
+
+        with override_settings(DEFER_EMAILS=True):
+            with mock.patch('competition.snapshot.take_snapshot', side_effect=RuntimeError):
+                with self.assertRaises(RuntimeError):
+                    tourn.close()
+        self.assertEqual(OutboxEmail.objects.count(), 0)
+
+        with mock.patch('member.models.Profile.email_user', return_value=True) as send:
+            with self.captureOnCommitCallbacks(execute=True):
+                tourn.close()
+            self.assertEqual(send.call_count, tourn.participants.count())
+
+    def test_close_once(self):
+        # a runner that loaded the tournament before another one closed it
+        Tournament.objects.filter(pk=self.tourn.pk).update(state=Tournament.ACTIVE)
+        first, second = (Tournament.objects.get(pk=self.tourn.pk) for _ in range(2))
+        TournamentSnapshot.objects.filter(tournament=self.tourn).delete()
+        with override_settings(DEFER_EMAILS=True):
+            first.close()
+            second.close()
+        self.assertEqual(OutboxEmail.objects.count(), self.tourn.participants.count())
+        self.assertEqual(TournamentSnapshot.objects.filter(tournament=self.tourn).count(), 1)
+
+    def test_resnapshot(self):
+        url = reverse('competition:table', kwargs={'slug': self.tourn.slug})
+        etag = self.client.get(url)['ETag']
+        Participant.objects.filter(pk=self.best.pk).update(score=0)
+
+        out, err = StringIO(), StringIO()
+        call_command('archive_tournament', self.tourn.slug, resnapshot=True, stdout=out, stderr=err)
+        self.assertIn("snapshot retaken", out.getvalue())
+        self.tourn.refresh_from_db()
+        self.assertEqual(self.tourn.state, Tournament.FINISHED)
+        self.assertEqual(decompress(self.tourn.snapshot.data)['participants'][0][3],
+                         str(Participant.objects.get(pk=self.best.pk).score))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['leaderboard'][0][2],
+                         str(Participant.objects.get(pk=self.best.pk).score))
+
+        call_command('archive_tournament', self.tourn.slug, prune=True, stdout=StringIO())
+        call_command('archive_tournament', self.tourn.slug, resnapshot=True, stdout=out, stderr=err)
+        self.assertIn("pruned, skipped", err.getvalue())
+
+    def test_http_caching(self):
+        url = reverse('competition:table', kwargs={'slug': self.tourn.slug})
+        response = self.client.get(url)
+        self.assertTrue(response.context['snapshot'])
+        self.assertIn('max-age=%d' % settings.SNAPSHOT_MAX_AGE, response['Cache-Control'])
+        self.assertIn('private', response['Cache-Control'])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        self.client.force_login(self.tourn.participant_set.exclude(pk=self.best.pk)[0].user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_benchmark_table(self):
+        response = self.client.get(reverse('competition:benchmark_table', kwargs={'slug': self.tourn.slug}))
+        self.assertTrue(response.context['snapshot'])
+        self.assertEqual(response.context['participants'].paginator.count, 32)
+        scores = [Decimal(row[2]) for row in response.context['leaderboard']]
+        self.assertEqual(scores, sorted(scores))
+
+    def test_match(self):
+        match = self.tourn.match_set.order_by('kick_off')[0]
+        url = reverse('competition:match', kwargs={'match_pk': match.pk})
+        response = self.client.get(url)
+        self.assertTrue(response.context['snapshot'])
+        self.assertEqual(response.context['prediction'].prediction,
+                         str(match.prediction_set.get(user=self.best.user).prediction))
+        predictions = response.context['predictions']
+        self.assertEqual(predictions.paginator.count, match.prediction_set.count())
+        self.assertIn(predictions[0].predictor_name,
+                      [p.get_name() for p in self.tourn.participant_set.all()])
+        scores = [Decimal(p.score) for p in predictions]
+        self.assertEqual(scores, sorted(scores))
+
+        response = self.client.get(url, {'benchmarks': 'show'})
+        self.assertEqual(response.context['predictions'].paginator.count,
+                         match.prediction_set.count() + match.benchmarkprediction_set.count())
@@ -6,6 +6,7 @@ app_name = "competition"
 
 urlpatterns = [
     url(r'^$', views.index, name='index'),
+    url(r'^dashboard/home/$', views.dashboard, name='dashboard'),
     url(r'^match/(?P<match_pk>[0-9]+)/$', views.match, name='match'),
     url(r'^match/(?P<match_pk>[0-9]+)/predict/$', views.prediction_create, name='prediction_create'),
     url(r'^benchmark/(?P<benchmark_pk>[0-9]+)/$', views.benchmark, name='benchmark'),
@@ -2,26 +2,70 @@ from django.shortcuts import redirect, get_object_or_404, render
 from django.http import HttpResponse, Http404
 from django.template import loader
 from django.template.defaultfilters import pluralize
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.models import User
 from django.contrib.sites.shortcuts import get_current_site
+from django.contrib.messages import get_messages
 from django.core.paginator import Paginator
 from django.db import IntegrityError
-from django.db.models import Q
+from django.db.models import F, Max, OuterRef, Q, Subquery
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag, urlencode
+from django.utils.functional import SimpleLazyObject
 from django.utils.translation import gettext as _
 
 import logging
 import decimal
-import datetime
-from itertools import chain
+import hashlib
 from .models import Tournament, Match, Prediction, Participant, Benchmark
-from member.models import Competition
+from .cache import tournament_version, match_version, tournament_list_version
+from .cache import tournament_cached, match_cached
+from .pagination import KeysetPaginator
+from .projection import get_projection
+from .dashboard import get_dashboard
+from .schedule import kick_off_schedule
+from .snapshot import SnapshotPaginator, get_snapshot
+from member.models import CompetitionStanding
+from server.db import replica_reads
 
 g_logger = logging.getLogger(__name__)
 
 
+def leaderboard_rows(predictors, odds=None):
+    leaderboard = []
+    for predictor in predictors:
+        leaderboard.append((predictor.get_url(),
+                            predictor.get_name(),
+                            predictor.score,
+                            predictor.margin_per_match,
+                            predictor.get_predictions().filter(match__score__isnull=False)[:5],
+                            odds.get(predictor.pk) if odds else None,
+                            ))
+    return leaderboard
+
+
+def prediction_page(predictions, page):
+    predictions = predictions.select_related('match__home_team', 'match__away_team')
+    paginator = Paginator(predictions, 20, orphans=5)
+    return paginator.get_page(page)
+
+
+def keyset_page(request, paginator, own=None):
+    if own is not None and request.GET.get('mine'):
+        return paginator.page_around(own)
+    return paginator.page(after=request.GET.get('after'), before=request.GET.get('before'))
+
+
+def last_kick_off(tournament):
+    # predictions of other users become visible as each match starts
+    return Match.objects.filter(tournament=tournament,
+                                kick_off__lt=timezone.now(),
+                                postponed=False).aggregate(Max('kick_off'))['kick_off__max']
+
+
 @login_required
 def index(request):
     template = loader.get_template('index.html')
@@ -45,7 +89,7 @@ def submit(request, slug):
         return redirect("competition:join", slug=slug)
 
     fixture_list = Match.objects.filter(
-        Q(postponed=True) | Q(kick_off__gt=timezone.now()),
+        Q(postponed=True) | Q(pk__in=kick_off_schedule.open_matches(tournament.pk)),
         tournament=tournament).order_by('kick_off')
 
     predicted_matches = [p.match.pk for p in Prediction.objects.filter(user=request.user,
@@ -69,9 +113,35 @@ def submit(request, slug):
     return HttpResponse(template.render(context, request))
 
 
+def other_predictions(request, tournament):
+    """(name, predictions, fragment_key, page_query) of the user given by ?user=, or None"""
+    username = request.GET.get('user')
+    if not username:
+        return None
+    try:
+        other_user = User.objects.get(username=username)
+    except User.DoesNotExist:
+        g_logger.debug("User(%s) tried to look at %s's predictions but '%s' does not exist"
+                       % (request.user, username, username))
+        return None
+    if other_user == request.user:
+        return None
+    predictions = Prediction.objects.filter(user=other_user,
+                                            match__tournament=tournament,
+                                            match__kick_off__lt=timezone.now(),
+                                            match__postponed=False
+                                            )
+    return (other_user.profile.get_name(), predictions, "user:%d" % other_user.pk,
+            urlencode({'user': other_user.username}) + "&")
+
+
 @login_required
+@replica_reads
 def predictions(request, slug):
     tournament = get_object_or_404(Tournament, slug=slug)
+    snapshot = get_snapshot(tournament)
+    if snapshot is not None:
+        return snapshot_response(request, snapshot, snapshot_predictions, tournament)
 
     is_participant = True
     if not tournament.participants.filter(pk=request.user.pk).exists():
@@ -79,30 +149,14 @@ def predictions(request, slug):
             return redirect("competition:table", slug=slug)
         is_participant = False
 
-    other_user = None
     user_score = None
-
-    if request.GET:
-        try:
-            other_user = User.objects.get(username=request.GET['user'])
-            if other_user == request.user:
-                other_user = None
-            else:
-                predictions = Prediction.objects.filter(user=other_user,
-                                                        match__tournament=tournament,
-                                                        match__kick_off__lt=timezone.now(),
-                                                        match__postponed=False
-                                                        )
-                other_user = other_user.profile.get_name()
-        except User.DoesNotExist:
-            g_logger.debug("User(%s) tried to look at %s's predictions but '%s' does not exist"
-                  % (request.user, request.GET['user'], request.GET['user']))
-        except KeyError:
-            other_user = None
-
-    if not other_user:
+    other = other_predictions(request, tournament)
+    if other is not None:
+        other_user, predictions, fragment_key, page_query = other
+    else:
         if not is_participant:
             return redirect("competition:table", slug=slug)
+        other_user, fragment_key, page_query = None, None, ""
         user_score = Participant.objects.get(user=request.user, tournament=tournament).score
         predictions = Prediction.objects.filter(user=request.user,
                                                 match__tournament=tournament
@@ -115,16 +169,25 @@ def predictions(request, slug):
         'other_user': other_user,
         'user_score': user_score,
         'TOURNAMENT': tournament,
-        'predictions': predictions,
+        'predictions': prediction_page(predictions, request.GET.get('page')),
+        'page_query': page_query,
         'is_participant': is_participant,
         'live_tournaments': Tournament.objects.filter(state=Tournament.ACTIVE),
+        'fragment_key': fragment_key,
     }
+    if fragment_key:
+        context['tournament_version'] = tournament_version(tournament.pk)
+        context['last_kick_off'] = last_kick_off(tournament)
     return HttpResponse(template.render(context, request))
 
 
 @login_required
+@replica_reads
 def table(request, slug):
     tournament = get_object_or_404(Tournament, slug=slug)
+    snapshot = get_snapshot(tournament)
+    if snapshot is not None:
+        return snapshot_response(request, snapshot, snapshot_table, tournament)
     try:
         participant = Participant.objects.get(tournament=tournament, user=request.user)
         is_participant = True
@@ -134,23 +197,21 @@ def table(request, slug):
         is_participant = False
 
     if is_participant:
-        competitions = participant.competition_set.all()
+        competitions = [standing.competition for standing in CompetitionStanding.objects.filter(
+            participant=participant).select_related('competition__organisation')]
     else:
         competitions = None
 
-    participant_list = Participant.objects.filter(tournament=tournament).order_by('score')
-    paginator = Paginator(participant_list, 20, orphans=5)
-    page = request.GET.get('page')
-    predictors = paginator.get_page(page)
+    participant_list = Participant.objects.filter(tournament=tournament).select_related('user',
+                                                                                      'tournament')
+    paginator = KeysetPaginator(participant_list, 20,
+                                count=lambda: tournament_cached(tournament.pk, 'participant_count',
+                                                                participant_list.count))
+    predictors = keyset_page(request, paginator, participant if is_participant else None)
 
-    leaderboard = []
-    for predictor in predictors:
-        leaderboard.append((predictor.get_url(),
-                            predictor.get_name(),
-                            predictor.score,
-                            predictor.margin_per_match,
-                            predictor.get_predictions().filter(match__score__isnull=False)[:5]
-                            ))
+    projection = get_projection(tournament.pk) if tournament.state == Tournament.ACTIVE else None
+    leaderboard = SimpleLazyObject(
+        lambda: leaderboard_rows(predictors, projection and projection['odds']))
 
     current_site = get_current_site(request)
     template = loader.get_template('table.html')
@@ -162,26 +223,171 @@ def table(request, slug):
         'live_tournaments': Tournament.objects.filter(state=Tournament.ACTIVE),
         'participants': predictors,
         'competitions': competitions,
-        'has_benchmark': tournament.benchmark_set.count(),
+        'show_position': is_participant,
+        'has_benchmark': tournament_cached(tournament.pk, 'benchmark_count',
+                                           tournament.benchmark_set.count),
+        'leaderboard_name': 'table',
+        'tournament_version': tournament_version(tournament.pk),
+        'projection': projection,
+    }
+    return HttpResponse(template.render(context, request))
+
+
+def snapshot_response(request, snapshot, view, *args):
+    """Serve a page of a finished tournament from its snapshot with HTTP caching
+
+    The pages differ per user so they may only be cached privately, and the
+    ETag changes with the user and the live tournaments in the navigation."""
+    etag = "%s:%s:%s:%s" % (snapshot.taken, request.user.pk, tournament_list_version(),
+                            request.get_full_path())
+    etag = quote_etag(hashlib.md5(etag.encode()).hexdigest())
+    response = None
+    # a 304 would lose any messages waiting to be shown
+    if not len(get_messages(request)):
+        response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = view(request, *args, snapshot)
+        if response.status_code != 200:
+            return response
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=settings.SNAPSHOT_MAX_AGE)
+    return response
+
+
+def snapshot_predictions(request, tournament, snapshot):
+    own = snapshot.participant(request.user.pk)
+    other = snapshot.users.get(request.GET.get('user'))
+    if other is not None and other['user_id'] == request.user.pk:
+        other = None
+    if other is None and own is None:
+        return redirect("competition:table", slug=tournament.slug)
+
+    predictor = other or own
+    current_site = get_current_site(request)
+    template = loader.get_template('predictions.html')
+    context = {
+        'site_name': current_site.name,
+        'other_user': other and other['name'],
+        'user_score': None if other else own['score'],
+        'TOURNAMENT': tournament,
+        'predictions': Paginator(snapshot.history(predictor['user_id']), 20, orphans=5).get_page(
+            request.GET.get('page')),
+        'page_query': urlencode({'user': other['username']}) + "&" if other else "",
+        'is_participant': own is not None,
+        'live_tournaments': Tournament.objects.filter(state=Tournament.ACTIVE),
+    }
+    return HttpResponse(template.render(context, request))
+
+
+def snapshot_table(request, tournament, snapshot):
+    participants = SnapshotPaginator(snapshot.participants, 20, orphans=3).get_page(
+        request.GET.get('page'))
+
+    current_site = get_current_site(request)
+    template = loader.get_template('table.html')
+    context = {
+        'site_name': current_site.name,
+        'leaderboard': SimpleLazyObject(lambda: snapshot.leaderboard(participants)),
+        'TOURNAMENT': tournament,
+        'is_participant': snapshot.participant(request.user.pk) is not None,
+        'live_tournaments': Tournament.objects.filter(state=Tournament.ACTIVE),
+        'participants': participants,
+        'has_benchmark': bool(snapshot.benchmarks),
+        'leaderboard_name': 'snapshot',
+        'tournament_version': tournament_version(tournament.pk),
+        'snapshot': True,
+    }
+    return HttpResponse(template.render(context, request))
+
+
+def snapshot_benchmark_table(request, tournament, snapshot):
+    if snapshot.participant(request.user.pk) is None:
+        return redirect("competition:table", slug=tournament.slug)
+    predictors = SnapshotPaginator(snapshot.predictors(), 20, orphans=3).get_page(
+        request.GET.get('page'))
+
+    current_site = get_current_site(request)
+    template = loader.get_template('table.html')
+    context = {
+        'site_name': current_site.name,
+        'leaderboard': SimpleLazyObject(lambda: snapshot.leaderboard(predictors)),
+        'TOURNAMENT': tournament,
+        'is_participant': True,
+        'live_tournaments': Tournament.objects.filter(state=Tournament.ACTIVE),
+        'participants': predictors,
+        'leaderboard_name': 'snapshot_benchmark',
+        'tournament_version': tournament_version(tournament.pk),
+        'snapshot': True,
+    }
+    return HttpResponse(template.render(context, request))
+
+
+def snapshot_benchmark(request, tournament, benchmark_pk, snapshot):
+    benchmark = snapshot.benchmark(benchmark_pk)
+    if snapshot.participant(request.user.pk) is None or benchmark is None:
+        raise Http404("User is not a Participant")
+
+    current_site = get_current_site(request)
+    template = loader.get_template('predictions.html')
+    context = {
+        'site_name': current_site.name,
+        'other_user': 'Benchmark "%s"' % benchmark['name'],
+        'user_score': benchmark['score'],
+        'TOURNAMENT': tournament,
+        'predictions': Paginator(snapshot.benchmark_history(benchmark_pk), 20, orphans=5).get_page(
+            request.GET.get('page')),
+        'is_participant': True,
+        'live_tournaments': Tournament.objects.filter(state=Tournament.ACTIVE),
+    }
+    return HttpResponse(template.render(context, request))
+
+
+def snapshot_match(request, match, snapshot):
+    show_benchmarks = match.score is not None and bool(request.GET.get('benchmarks'))
+    predictions = None
+    if match.has_started():
+        predictions = SnapshotPaginator(snapshot.match_predictions(match.pk, show_benchmarks), 20,
+                                        orphans=5).get_page(request.GET.get('page'))
+
+    current_site = get_current_site(request)
+    template = loader.get_template('match.html')
+    context = {
+        'site_name': current_site.name,
+        'TOURNAMENT': match.tournament,
+        'is_participant': True,
+        'live_tournaments': Tournament.objects.filter(state=Tournament.ACTIVE),
+        'predictions': predictions,
+        'match': match,
+        'prediction': snapshot.prediction(request.user.pk, match.pk),
+        'show_benchmarks': show_benchmarks,
+        'page_query': 'benchmarks=show&' if show_benchmarks else '',
+        'has_benchmark': bool(snapshot.benchmarks),
+        'match_version': match_version(match.pk),
+        'snapshot': True,
     }
     return HttpResponse(template.render(context, request))
 
 
 @login_required
+@replica_reads
 def org_table(request, slug, org_name):
     tournament = get_object_or_404(Tournament, slug=slug)
     participant = get_object_or_404(Participant, tournament=tournament, user=request.user)
+    own_standings = CompetitionStanding.objects.filter(
+        participant=participant).select_related('competition__organisation')
     try:
-        comp = participant.competition_set.get(organisation__name=org_name)
-        competitions = participant.competition_set.all().exclude(pk=comp.pk)
-        competitions = [comp] + [c for c in competitions]
-    except Competition.DoesNotExist:
+        own_standing = [s for s in own_standings if s.competition.organisation.name == org_name][0]
+    except IndexError:
         raise Http404("Organisation does not exist")
+    comp = own_standing.competition
+    competitions = [comp] + [s.competition for s in own_standings if s.competition != comp]
 
-    participant_list = comp.participants.order_by('score')
-    paginator = Paginator(participant_list, 20, orphans=5)
-    page = request.GET.get('page')
-    participants = paginator.get_page(page)
+    standings = comp.competitionstanding_set.select_related('participant__user',
+                                                            'participant__tournament')
+    paginator = KeysetPaginator(standings, 20, field='rank',
+                                count=lambda: tournament_cached(tournament.pk, 'org_count',
+                                                                standings.count, comp.pk))
+    participants = keyset_page(request, paginator, own_standing)
 
     current_site = get_current_site(request)
     template = loader.get_template('org_table.html')
@@ -192,6 +398,7 @@ def org_table(request, slug, org_name):
         'live_tournaments': Tournament.objects.filter(state=Tournament.ACTIVE),
         'participants': participants,
         'competitions': competitions,
+        'show_position': True,
     }
     return HttpResponse(template.render(context, request))
 
@@ -303,39 +510,48 @@ def rules(request, slug):
 
 
 @login_required
+@replica_reads
 def match(request, match_pk):
     match = get_object_or_404(Match, pk=match_pk)
 
     if not match.tournament.participants.filter(pk=request.user.pk).exists():
         raise Http404("User is not a Participant")
 
+    snapshot = get_snapshot(match.tournament)
+    if snapshot is not None and snapshot.match(match.pk) is not None:
+        return snapshot_response(request, snapshot, snapshot_match, match)
+
     show_benchmarks = False
 
+    try:
+        user_prediction = match.prediction_set.get(user=request.user)
+    except Prediction.DoesNotExist:
+        user_prediction = None
+
     if match.has_started():
+        field, descending = 'score', False
+        # names come from the participant rows in the same query as the predictions
+        prediction_list = [match.prediction_set.annotate(predictor_name=Subquery(
+            Participant.objects.filter(tournament=match.tournament_id,
+                                       user=OuterRef('user')).values('display_name')[:1]))]
         if match.score is None:
-            prediction_list = match.prediction_set.all().order_by('-prediction')
+            field, descending = 'prediction', True
         else:
-            show_benchmarks = request.GET.get('benchmarks')
+            show_benchmarks = bool(request.GET.get('benchmarks'))
 
             if show_benchmarks:
-                prediction_list = sorted(
-                    chain(
-                        match.prediction_set.all(),
-                        match.benchmarkprediction_set.all()),
-                    key=lambda obj: obj.score)
-            else:
-                prediction_list = match.prediction_set.all().order_by('score')
-
-        paginator = Paginator(prediction_list, 20, orphans=5)
-        predictions = paginator.get_page(request.GET.get('page'))
+                prediction_list.append(match.benchmarkprediction_set.annotate(
+                    predictor_name=F('benchmark__name')))
+
+        paginator = KeysetPaginator(prediction_list, 20, field=field, descending=descending,
+                                    count=lambda: match_cached(
+                                        match.pk, 'prediction_count',
+                                        lambda: sum(qs.count() for qs in prediction_list),
+                                        show_benchmarks))
+        predictions = keyset_page(request, paginator, user_prediction)
     else:
         predictions = None
 
-    try:
-        user_prediction = match.prediction_set.get(user=request.user)
-    except Prediction.DoesNotExist:
-        user_prediction = None
-
     current_site = get_current_site(request)
     template = loader.get_template('match.html')
     context = {
@@ -347,39 +563,38 @@ def match(request, match_pk):
         'match': match,
         'prediction': user_prediction,
         'show_benchmarks': show_benchmarks,
-        'has_benchmark': match.tournament.benchmark_set.count(),
+        'page_query': 'benchmarks=show&' if show_benchmarks else '',
+        'show_position': user_prediction is not None,
+        'has_benchmark': tournament_cached(match.tournament_id, 'benchmark_count',
+                                           match.tournament.benchmark_set.count),
+        'match_version': match_version(match.pk),
     }
     return HttpResponse(template.render(context, request))
 
 
 @login_required
+@replica_reads
 def benchmark_table(request, slug):
     tournament = get_object_or_404(Tournament, slug=slug)
+    snapshot = get_snapshot(tournament)
+    if snapshot is not None:
+        return snapshot_response(request, snapshot, snapshot_benchmark_table, tournament)
 
     try:
-        Participant.objects.get(tournament=tournament, user=request.user)
+        participant = Participant.objects.get(tournament=tournament, user=request.user)
     except Participant.DoesNotExist:
         return redirect("competition:join", slug=slug)
 
-    participant_list = tournament.participant_set.all()
+    participant_list = tournament.participant_set.select_related('user', 'tournament')
     benchmark_list = tournament.benchmark_set.all()
 
-    sorted_list = sorted(chain(participant_list,
-                               benchmark_list),
-                         key=lambda obj: obj.score or 0)
+    paginator = KeysetPaginator([participant_list, benchmark_list], 20,
+                                count=lambda: tournament_cached(
+                                    tournament.pk, 'predictor_count',
+                                    lambda: participant_list.count() + benchmark_list.count()))
+    predictors = keyset_page(request, paginator, participant)
 
-    paginator = Paginator(sorted_list, 20, orphans=5)
-    page = request.GET.get('page')
-    predictors = paginator.get_page(page)
-
-    leaderboard = []
-    for predictor in predictors:
-        leaderboard.append((predictor.get_url(),
-                            predictor.get_name(),
-                            predictor.score,
-                            predictor.margin_per_match,
-                            predictor.get_predictions().filter(match__score__isnull=False)[:5]
-                            ))
+    leaderboard = SimpleLazyObject(lambda: leaderboard_rows(predictors))
 
     current_site = get_current_site(request)
     template = loader.get_template('table.html')
@@ -390,6 +605,9 @@ def benchmark_table(request, slug):
         'is_participant': True,
         'live_tournaments': Tournament.objects.filter(state=Tournament.ACTIVE),
         'participants': predictors,
+        'show_position': True,
+        'leaderboard_name': 'benchmark',
+        'tournament_version': tournament_version(tournament.pk),
     }
     return HttpResponse(template.render(context, request))
 
@@ -399,6 +617,10 @@ def benchmark(request, benchmark_pk):
     benchmark = get_object_or_404(Benchmark, pk=benchmark_pk)
     tournament = benchmark.tournament
 
+    snapshot = get_snapshot(tournament)
+    if snapshot is not None:
+        return snapshot_response(request, snapshot, snapshot_benchmark, tournament, benchmark.pk)
+
     if not tournament.participants.filter(pk=request.user.pk).exists():
         raise Http404("User is not a Participant")
 
@@ -413,66 +635,45 @@ def benchmark(request, benchmark_pk):
         'other_user': 'Benchmark "%s"' % benchmark.name,
         'user_score': benchmark.score,
         'TOURNAMENT': tournament,
-        'predictions': predictions,
+        'predictions': prediction_page(predictions, request.GET.get('page')),
         'is_participant': True,
         'live_tournaments': Tournament.objects.filter(state=Tournament.ACTIVE),
+        'fragment_key': "benchmark:%d" % benchmark.pk,
+        'tournament_version': tournament_version(tournament.pk),
+        'last_kick_off': last_kick_off(tournament),
     }
     return HttpResponse(template.render(context, request))
 
 
 @login_required
+@replica_reads
+def dashboard(request):
+    return render(request, 'partial/dashboard.html', get_dashboard(request.user))
+
+
+@login_required
+@replica_reads
 def tournament_list_open(request):
-    context = {
-        'live_tournaments': Tournament.objects.filter(state=Tournament.ACTIVE),
-    }
-    return render(request, 'partial/tournament_list_open.html', context)
+    return render(request, 'partial/tournament_list_open.html', get_dashboard(request.user))
 
 
 @login_required
+@replica_reads
 def tournament_list_closed(request):
-    context = {
-        'closed_tournaments': Tournament.objects.filter(state=Tournament.FINISHED).order_by('-pk'),
-    }
-    return render(request, 'partial/tournament_list_closed.html', context)
+    return render(request, 'partial/tournament_list_closed.html', get_dashboard(request.user))
 
 
 @login_required
+@replica_reads
 def match_list_todaytomorrow(request):
-    user_tourns = Tournament.objects.filter(state=Tournament.ACTIVE,
-                                            participant__user=request.user)
-
-    now = timezone.now()
-    last_24hrs = now - datetime.timedelta(days=1)
-    matches_recent = Match.objects.filter(
-            tournament__in=user_tourns,
-            kick_off__gt=last_24hrs,
-            kick_off__lt=now,
-            postponed=False
-            ).order_by('kick_off')
-
-    next_48hrs = now + datetime.timedelta(days=2)
-    matches_future = Match.objects.filter(
-            tournament__in=user_tourns,
-            kick_off__gt=now,
-            kick_off__lt=next_48hrs,
-            postponed=False
-            ).order_by('kick_off')
-
-    matches_predicted = matches_future.filter(prediction__user=request.user)
-
-    context = {
-        'matches_recent': matches_recent,
-        'matches_future': matches_future,
-        'matches_predicted': matches_predicted,
-        }
-    return render(request, 'partial/match_list_todaytomorrow.html', context)
+    return render(request, 'partial/match_list_todaytomorrow.html', get_dashboard(request.user))
 
 
 @login_required
 def prediction_create(request, match_pk):
-    match = get_object_or_404(Match,
-                              pk=match_pk,
-                              kick_off__gt=timezone.now())
+    if not kick_off_schedule.is_open(match_pk):
+        raise Http404("Match %s is not open for predictions" % match_pk)
+    match = get_object_or_404(Match, pk=match_pk)
     context = {
         'htmx': True,
         'match': match
@@ -484,9 +685,11 @@ def prediction_create(request, match_pk):
         try:
             prediction = Prediction(user=request.user, match=match,
                     prediction=float(request.POST['prediction_prediction']))
-            prediction.save()
-            context['prediction'] = prediction
-            messages.success(request, _("prediction created"))
+            if prediction.save_before_kick_off():
+                context['prediction'] = prediction
+                messages.success(request, _("prediction created"))
+            else:
+                messages.error(request, _("Match has already started"))
             template_name = 'partial/messages.html'
         except (KeyError, ValueError):
             # messages.error(request, _("prediction failed to be created"))
@@ -503,10 +706,9 @@ def prediction_create(request, match_pk):
 
 @login_required
 def prediction_update(request, prediction_pk):
-    prediction = get_object_or_404(Prediction,
-                                   pk=prediction_pk,
-                                   user=request.user,
-                                   match__kick_off__gt=timezone.now())
+    prediction = get_object_or_404(Prediction, pk=prediction_pk, user=request.user)
+    if not kick_off_schedule.is_open(prediction.match_id):
+        raise Http404("Match %s is not open for predictions" % prediction.match_id)
 
     template_name = 'partial/prediction_update.html'
 
@@ -515,7 +717,9 @@ def prediction_update(request, prediction_pk):
             prediction_prediction = float(request.POST['prediction_prediction'])
             if prediction.prediction != prediction_prediction:
                 prediction.prediction = prediction_prediction
-                prediction.save()
+                if not prediction.save_before_kick_off():
+                    messages.error(request, _("Match has already started"))
+                    prediction.refresh_from_db()
                 # messages.success(request, _("prediction updated"))
         except (KeyError, ValueError):
             # messages.error(request, _("prediction failed to be updated"))
@@ -1,8 +1,12 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
+from django.db import IntegrityError
+from django.http import HttpResponseRedirect
 from django.shortcuts import render
 from allauth.socialaccount.models import SocialApp
 from member.models import Profile, Organisation, Competition, Ticket
+from member.forms import AddTicketsForm
+from member.social import social_names
 import logging
 
 g_logger = logging.getLogger(__name__)
@@ -70,9 +74,34 @@ class CompetitionAdmin(admin.ModelAdmin):
 
     def add_tickets(self, request, queryset):
         g_logger.debug("add_tickets(%r, %r, %r)", self, request, queryset)
-        for comp in queryset:
-            for i in range(10):
-                Ticket.objects.create(competition=comp)
+
+        if 'apply' in request.POST:
+            form = AddTicketsForm(request.POST)
+            if form.is_valid():
+                count = form.cleaned_data['count']
+                for comp in queryset:
+                    try:
+                        Ticket.objects.mint(comp, count)
+                    except (IntegrityError, ValueError) as e:
+                        g_logger.error("Failed to add tickets to %s: %s", comp, e)
+                        self.message_user(request, "Failed to add tickets to %s: %s" % (comp, e),
+                                          level=messages.ERROR)
+                        continue
+                    self.message_user(request, "Added %d tickets to %s" % (count, comp))
+                return HttpResponseRedirect(request.get_full_path())
+        else:
+            form = AddTicketsForm()
+
+        context = {
+            'competitions': queryset,
+            'form': form,
+            'opts': self.model._meta,
+            'media': self.media,
+        }
+
+        return render(request,
+                      'admin/add_tickets.html',
+                      context=context)
     add_tickets.allowed_permissions = ('add',)
 
 
@@ -89,9 +118,8 @@ class ProfileAdmin(admin.ModelAdmin):
         return ['user__' + f for f in UserAdmin.search_fields]
 
     def display_social_names(self, request, queryset):
-        info = {}
-        for s_app in SocialApp.objects.all():
-            info[s_app.provider] = [(p, p.get_social_name(s_app.provider)) for p in queryset]
+        providers = list(dict.fromkeys(SocialApp.objects.values_list('provider', flat=True)))
+        info = social_names(queryset.select_related('user'), providers)
 
         return render(request,
                       'admin/social_display_names.html',
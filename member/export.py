@@ -0,0 +1,59 @@
+from django.template import loader
+import csv
+import logging
+
+g_logger = logging.getLogger(__name__)
+
+TICKETS_PER_SHEET = 8
+CHUNK_SIZE = 2000
+
+# Ticket exports are generated one row (or sheet) at a time so that the memory
+# used does not depend on the number of tickets. The same generators are used
+# for streamed responses and the export_tickets command.
+
+
+class Echo:
+    """File-like object that returns what is written, for csv.writer"""
+    def write(self, value):
+        return value
+
+
+def unused_tokens(comp):
+    return comp.ticket_set.filter(used=False).order_by('pk').values_list(
+        'token', flat=True).iterator(chunk_size=CHUNK_SIZE)
+
+
+def ticket_csv_rows(comp):
+    writer = csv.writer(Echo())
+    yield writer.writerow(['token', 'organisation', 'tournament'])
+    organisation = comp.organisation.name
+    tournament = comp.tournament.name
+    for token in unused_tokens(comp):
+        yield writer.writerow([token, organisation, tournament])
+
+
+def ticket_sheets(comp, site_name, request=None, per_sheet=TICKETS_PER_SHEET):
+    # the page around the tickets is rendered up front so that errors are
+    # raised before the response starts
+    placeholder = '<!-- tickets -->'
+    page = loader.render_to_string('tickets.html', {
+        'site_name': site_name,
+        'comp': comp,
+        'tickets_placeholder': placeholder,
+    }, request)
+    head, tail = page.split(placeholder)
+    sheet = loader.get_template('partial/ticket_sheet.html')
+
+    def sheets():
+        yield head
+        tokens = []
+        for token in unused_tokens(comp):
+            tokens.append(token)
+            if len(tokens) == per_sheet:
+                yield sheet.render({'site_name': site_name, 'comp': comp, 'tokens': tokens})
+                tokens = []
+        if tokens:
+            yield sheet.render({'site_name': site_name, 'comp': comp, 'tokens': tokens})
+        yield tail
+
+    return sheets()
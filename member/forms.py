@@ -24,5 +24,10 @@ class AnnouncementForm(forms.Form):
     tournament = forms.ModelChoiceField(queryset=Tournament.objects.filter(state=Tournament.ACTIVE), required=False)
 
 
+class AddTicketsForm(forms.Form):
+    count = forms.IntegerField(min_value=1, max_value=10000, initial=10,
+                               help_text="Number of tickets to add to each competition")
+
+
 class SocialProviderForm(forms.Form):
     social_provider = forms.ModelChoiceField(queryset=SocialApp.objects.all(), required=False)
@@ -0,0 +1,44 @@
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import slugify
+from member.export import ticket_csv_rows, ticket_sheets
+from member.models import Competition, Ticket
+import logging
+
+g_logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Write the unused tickets of a competition to a CSV or printable HTML file. " \
+           "Use this instead of the ticket pages for very large runs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('competition', type=int, help="pk of the Competition")
+        parser.add_argument('--format', choices=['csv', 'html'], default='csv')
+        parser.add_argument('--output',
+                            help="file to write (default <organisation>-tickets.<format>)")
+        parser.add_argument('--mint', type=int, default=0, metavar='N',
+                            help="create N new tickets before exporting")
+
+    def handle(self, *args, **options):
+        try:
+            comp = Competition.objects.select_related('organisation', 'tournament').get(
+                pk=options['competition'])
+        except Competition.DoesNotExist:
+            raise CommandError("Competition %s does not exist" % options['competition'])
+
+        if options['mint']:
+            Ticket.objects.mint(comp, options['mint'])
+            self.stdout.write("Created %d tickets for %s" % (options['mint'], comp))
+
+        if options['format'] == 'csv':
+            chunks = ticket_csv_rows(comp)
+        else:
+            chunks = ticket_sheets(comp, Site.objects.get_current().name)
+
+        output = options['output'] or "%s-tickets.%s" % (slugify(comp), options['format'])
+        with open(output, 'w', newline='') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        g_logger.info("Exported tickets for %s to %s", comp, output)
+        self.stdout.write("Wrote %s" % output)
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.24 on 2026-10-19 11:49
+
+from django.db import migrations, models
+from django.db.models import F
+import django.db.models.deletion
+
+
+def build_standings(apps, schema_editor):
+    competition_model = apps.get_model('member', 'Competition')
+    standing_model = apps.get_model('member', 'CompetitionStanding')
+    for competition in competition_model.objects.all():
+        participants = competition.participants.order_by(F('score').asc(nulls_last=True), 'pk')
+        standing_model.objects.bulk_create(
+            standing_model(competition=competition, participant_id=pk, rank=rank,
+                           score=score, margin_per_match=margin_per_match)
+            for rank, (pk, score, margin_per_match) in enumerate(
+                participants.values_list('pk', 'score', 'margin_per_match'), 1))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('competition', '0015_keyset_indexes'),
+        ('member', '0008_auto_20210531_2118'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompetitionStanding',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveIntegerField()),
+                ('score', models.DecimalField(blank=True, decimal_places=2, max_digits=6, null=True)),
+                ('margin_per_match', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('competition', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='member.competition')),
+                ('participant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='competition.participant')),
+            ],
+            options={
+                'ordering': ['rank'],
+                'unique_together': {('competition', 'participant'), ('competition', 'rank')},
+            },
+        ),
+        migrations.RunPython(build_standings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.2.24 on 2026-10-19 12:11
+
+from django.db import migrations, models
+
+
+def fill_display_names(apps, schema_editor):
+    # historical models have no get_name(), this is the same rule
+    profile_model = apps.get_model('member', 'Profile')
+    participant_model = apps.get_model('competition', 'Participant')
+    profiles = list(profile_model.objects.select_related('user'))
+    for profile in profiles:
+        user = profile.user
+        if profile.display_name_format == 0:
+            name = " ".join([user.first_name, user.last_name]).strip() or user.username
+        elif profile.display_name_format == 1:
+            name = user.username
+        else:
+            name = "user_%d" % user.pk
+        profile.display_name = name
+    profile_model.objects.bulk_update(profiles, ['display_name'], batch_size=500)
+
+    names = {profile.user_id: profile.display_name for profile in profiles}
+    participants = list(participant_model.objects.all())
+    for participant in participants:
+        participant.display_name = names.get(participant.user_id, '')
+    participant_model.objects.bulk_update(participants, ['display_name'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('competition', '0016_participant_display_name'),
+        ('member', '0009_competitionstanding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='display_name',
+            field=models.CharField(blank=True, editable=False, max_length=301),
+        ),
+        migrations.RunPython(fill_display_names, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,16 @@
 from django.contrib.auth.models import User
 from django.core import mail
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Q
+from django.db.models.signals import post_save, m2m_changed
 from django.dispatch import receiver
 import logging
 import smtplib
 import string
 import random
 from competition.models import Tournament, Participant
+from competition.cache import bump_tournament
+from competition.signals import table_updated
 from allauth.socialaccount.models import SocialAccount
 from allauth.account.admin import EmailAddress
 
@@ -54,6 +57,21 @@ class Profile(models.Model):
                  (1, "no advertising cookies"),
                  (2, "functional cookies only")),
         help_text="The user consents to the following level of cookies")
+    # get_name() as of the last save, long enough for a first and last name
+    display_name = models.CharField(max_length=301, blank=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        name = self.get_name()
+        changed = name != self.display_name
+        self.display_name = name
+        super().save(*args, **kwargs)
+
+        if changed:
+            # the name is shown from the participant rows of every tournament entered
+            participants = Participant.objects.filter(user_id=self.user_id)
+            participants.exclude(display_name=name).update(display_name=name)
+            for tournament_pk in participants.values_list('tournament', flat=True):
+                bump_tournament(tournament_pk)
 
     def get_name(self):
         if self.display_name_format == self.DNF_FULL:
@@ -64,17 +82,22 @@ class Profile(models.Model):
         if self.display_name_format == self.DNF_ID:
             return "user_%d" % self.user.pk
 
-    def get_social_name(self, provider=None):
+    def get_social_name(self, provider=None, accounts=None):
+        """accounts maps user_id to the SocialAccount for provider when already loaded"""
         if self.social_display_name_format == self.SDNF_USR:
             return self.user.username
         if self.social_display_name_format == self.SDNF_DN:
             return self.get_name()
 
-        try:
-            sa = SocialAccount.objects.get(user=self.user, provider=provider)
-            name = sa.get_provider_account().to_str()
-        except SocialAccount.DoesNotExist:
-            name = None
+        if accounts is not None:
+            sa = accounts.get(self.user_id)
+            name = sa and sa.get_provider_account().to_str()
+        else:
+            try:
+                sa = SocialAccount.objects.get(user=self.user, provider=provider)
+                name = sa.get_provider_account().to_str()
+            except SocialAccount.DoesNotExist:
+                name = None
 
         if self.social_display_name_format == self.SDNF_SAU_USR:
             return name or self.user.username
@@ -142,18 +165,126 @@ class Competition(models.Model):
     def __str__(self):
         return self.organisation.name
 
+    def update_standings(self):
+        participants = self.participants.order_by(F('score').asc(nulls_last=True), 'pk')
+        standings = [CompetitionStanding(competition=self,
+                                         participant_id=pk,
+                                         rank=rank,
+                                         score=score,
+                                         margin_per_match=margin_per_match)
+                     for rank, (pk, score, margin_per_match) in enumerate(
+                         participants.values_list('pk', 'score', 'margin_per_match'), 1)]
+        with transaction.atomic():
+            self.competitionstanding_set.all().delete()
+            CompetitionStanding.objects.bulk_create(standings)
+        g_logger.debug("%s: %d standings", self, len(standings))
+
     class Meta:
         unique_together = ('tournament', 'organisation',)
 
 
+class CompetitionStanding(models.Model):
+    competition = models.ForeignKey(Competition, models.CASCADE)
+    participant = models.ForeignKey(Participant, models.CASCADE)
+    rank = models.PositiveIntegerField()
+    score = models.DecimalField(blank=True, null=True, max_digits=6, decimal_places=2)
+    margin_per_match = models.DecimalField(blank=True, null=True, max_digits=5, decimal_places=2)
+
+    def __str__(self):
+        return "%s:%s %d" % (self.competition, self.participant, self.rank)
+
+    class Meta:
+        unique_together = (('competition', 'participant',), ('competition', 'rank',))
+        ordering = ['rank']
+
+
+@receiver(table_updated)
+def update_competition_standings(sender, tournament, **kwargs):
+    for competition in Competition.objects.filter(tournament=tournament):
+        competition.update_standings()
+
+
+@receiver(m2m_changed, sender=Competition.participants.through)
+def competition_participants_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # instance is a Participant
+        competitions = Competition.objects.filter(
+            Q(pk__in=pk_set or ()) | Q(competitionstanding__participant=instance)).distinct()
+    else:
+        competitions = [instance]
+    for competition in competitions:
+        competition.update_standings()
+    bump_tournament(instance.tournament_id)
+
+
+TOKEN_CHARS = string.ascii_uppercase + string.digits
+TOKEN_ATTEMPTS = 10
+
+
+def generate_token(length):
+    rng = random.SystemRandom()
+    return ''.join(rng.choice(TOKEN_CHARS) for _ in range(length))
+
+
+class TicketManager(models.Manager):
+    def mint(self, competition, count, batch_size=500):
+        """Create count unused tickets for competition, returns the new tokens"""
+        if count > len(TOKEN_CHARS) ** competition.token_len:
+            raise ValueError("%s tokens are too short for %d tickets" % (competition, count))
+
+        minted = []
+        retries = 0
+        while len(minted) < count:
+            size = min(batch_size, count - len(minted))
+            tokens = set()
+            while len(tokens) < size:
+                tokens.add(generate_token(competition.token_len))
+            tokens -= set(self.filter(token__in=tokens).values_list('token', flat=True))
+
+            # a concurrent mint may still take one of the tokens, those rows are skipped
+            self.bulk_create([Ticket(competition=competition, token=token) for token in tokens],
+                             ignore_conflicts=True)
+            new = list(self.filter(competition=competition, token__in=tokens)
+                       .values_list('token', flat=True))
+            minted.extend(new)
+
+            if len(new) < size:
+                retries += 1
+                g_logger.debug("%d token collisions minting tickets for %s",
+                               size - len(new), competition)
+            if not new and retries >= TOKEN_ATTEMPTS:
+                raise IntegrityError("Only %d of %d tickets could be created for %s"
+                                     % (len(minted), count, competition))
+        g_logger.debug("Minted %d tickets for %s with %d retries", count, competition, retries)
+        return minted
+
+    def redeem(self, token):
+        """Mark the ticket as used, returns None if it does not exist or has been used"""
+        if not self.filter(token=token, used=False).update(used=True):
+            return None
+        return self.select_related('competition__tournament',
+                                   'competition__organisation').get(token=token)
+
+
 class Ticket(models.Model):
     competition = models.ForeignKey(Competition, models.CASCADE)
     token = models.CharField(max_length=10, unique=True, blank=True)
     used = models.BooleanField(default=False)
 
+    objects = TicketManager()
+
     def save(self, *args, **kwargs):
-        if self.pk is None:
-            all_chars = string.ascii_uppercase + string.digits
-            n = self.competition.token_len
-            self.token = ''.join(random.SystemRandom().choice(all_chars) for _ in range(n))
-        super(Ticket, self).save(*args, **kwargs)
+        if self.pk is not None:
+            return super(Ticket, self).save(*args, **kwargs)
+
+        for attempt in range(TOKEN_ATTEMPTS):
+            self.token = generate_token(self.competition.token_len)
+            try:
+                with transaction.atomic():
+                    return super(Ticket, self).save(*args, **kwargs)
+            except IntegrityError:
+                if attempt == TOKEN_ATTEMPTS - 1:
+                    raise
+                g_logger.debug("Token %s already exists, retrying", self.token)
@@ -0,0 +1,28 @@
+from allauth.socialaccount.models import SocialAccount
+import logging
+
+g_logger = logging.getLogger(__name__)
+
+
+# Social display names for many users at once. Profile.get_social_name looks
+# up the user's SocialAccount for the provider on each call; here the accounts
+# of every user and provider wanted are loaded with one query, keyed by
+# (provider, user), and passed to get_social_name so that the names are worked
+# out in memory.
+
+def social_accounts(users, providers):
+    """{provider: {user_id: SocialAccount}}, the first account when a user has several"""
+    accounts = {provider: {} for provider in providers}
+    linked = SocialAccount.objects.filter(user__in=users, provider__in=providers)
+    for account in linked.order_by('pk'):
+        accounts[account.provider].setdefault(account.user_id, account)
+    return accounts
+
+
+def social_names(profiles, providers):
+    """{provider: [(profile, social name)]} for profiles with their users loaded"""
+    profiles = list(profiles)
+    accounts = social_accounts([profile.user_id for profile in profiles], providers)
+    return {provider: [(profile, profile.get_social_name(provider, accounts=accounts[provider]))
+                       for profile in profiles]
+            for provider in providers}
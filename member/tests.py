@@ -1,13 +1,24 @@
 from django.contrib.auth.models import User, Permission
 from django.core import mail
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
+from django.db import IntegrityError
 from django.test import TestCase
 
+import csv
+import io
+import os
+import tempfile
 import unittest
+from unittest import mock
 
-from .models import Organisation, Competition, Ticket
-from competition.models import Tournament, Sport, Participant
+from .models import Organisation, Competition, CompetitionStanding, Ticket, Profile
+from .social import social_names
+from allauth.socialaccount.models import SocialAccount
+from competition.models import Tournament, Sport, Participant, Team, Match, Prediction
+from django.utils import timezone
+import datetime
 
 
 class MemberViewLoggedOutTest(TestCase):
@@ -186,6 +197,73 @@ class MemberViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'tickets.html')
 
+class CompetitionStandingTest(TestCase):
+    fixtures = ['social.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        sport = Sport.objects.create(name='sport')
+        cls.tourn = Tournament.objects.create(name='tourn', sport=sport, state=Tournament.ACTIVE)
+        cls.users = [User.objects.create_user(username='testuser%d' % i, password='test123')
+                     for i in range(3)]
+        cls.participants = [Participant.objects.create(user=user, tournament=cls.tourn)
+                            for user in cls.users]
+        cls.comp = Competition.objects.create(organisation=Organisation.objects.create(name='Org'),
+                                              tournament=cls.tourn)
+        team_a = Team.objects.create(name='team A', code='AAA', sport=sport)
+        team_b = Team.objects.create(name='team B', code='BBB', sport=sport)
+        cls.match = Match.objects.create(tournament=cls.tourn, home_team=team_a, away_team=team_b,
+                                         kick_off=timezone.now() + datetime.timedelta(hours=1))
+        for user, prediction in zip(cls.users, [10, 2, -5]):
+            Prediction.objects.create(match=cls.match, user=user, prediction=prediction)
+
+    def standings(self):
+        return [(s.participant, s.rank) for s in self.comp.competitionstanding_set.all()]
+
+    def test_membership_changes(self):
+        first, second, third = self.participants
+        self.comp.participants.add(first, second)
+        self.assertEqual(self.standings(), [(first, 1), (second, 2)])
+
+        third.competition_set.add(self.comp)
+        self.assertEqual(self.standings(), [(first, 1), (second, 2), (third, 3)])
+
+        first.competition_set.remove(self.comp)
+        self.assertEqual(self.standings(), [(second, 1), (third, 2)])
+
+        self.comp.participants.clear()
+        self.assertEqual(self.standings(), [])
+
+    def test_results_update_ranks(self):
+        first, second, third = self.participants
+        self.comp.participants.add(first, third)
+
+        Match.objects.filter(pk=self.match.pk).update(kick_off=timezone.now() - datetime.timedelta(hours=1))
+        self.match.refresh_from_db()
+        self.match.score = 1
+        self.match.save()
+
+        # 10 vs 1 scores 9 - 2, -5 vs 1 scores 6
+        self.assertEqual(self.standings(), [(third, 1), (first, 2)])
+        standing = CompetitionStanding.objects.get(competition=self.comp, participant=first)
+        self.assertEqual(standing.score, 7)
+
+        self.client.login(username=first.user.username, password='test123')
+        response = self.client.get(reverse('competition:org_table',
+                                           kwargs={'slug': self.tourn.slug, 'org_name': 'Org'}))
+        self.assertEqual([s.participant for s in response.context['participants']], [third, first])
+        self.assertEqual(response.context['competitions'], [self.comp])
+
+        response = self.client.get(reverse('competition:table', kwargs={'slug': self.tourn.slug}))
+        self.assertEqual(response.context['competitions'], [self.comp])
+
+    def test_not_a_member(self):
+        self.client.login(username='testuser0', password='test123')
+        response = self.client.get(reverse('competition:org_table',
+                                           kwargs={'slug': self.tourn.slug, 'org_name': 'Org'}))
+        self.assertEqual(response.status_code, 404)
+
+
 class AnnouncementTest(TestCase):
     fixtures = ['social.json', 'accounts.json', 'tourns.json']
 
@@ -278,10 +356,11 @@ class AnnouncementTest(TestCase):
         expected_emails = User.objects.exclude(username__in=excluded_users).values_list('email', flat=True)
 
         url = reverse('admin:competition_tournament_changelist')
-        response = self.client.post(url, {
-            'action': 'open_tournament',
-            '_selected_action': [tourn.pk],
-            })
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {
+                'action': 'open_tournament',
+                '_selected_action': [tourn.pk],
+                })
         self.assertEqual(response.status_code, 302)
         self.assertRedirects(response, url)
 
@@ -306,10 +385,11 @@ class AnnouncementTest(TestCase):
 
 
         url = reverse('admin:competition_tournament_changelist')
-        response = self.client.post(url, {
-            'action': 'close_tournament',
-            '_selected_action': [tourn.pk],
-            })
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {
+                'action': 'close_tournament',
+                '_selected_action': [tourn.pk],
+                })
         self.assertEqual(response.status_code, 302)
         self.assertRedirects(response, url)
 
@@ -319,3 +399,235 @@ class AnnouncementTest(TestCase):
 
         self.assertEqual(email.subject, "Thank you for participating in %s" % tourn.name)
 
+
+
+class TicketTest(TestCase):
+    fixtures = ['social.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        sport = Sport.objects.create(name='sport')
+        cls.tourn = Tournament.objects.create(name='tourn', sport=sport, state=Tournament.ACTIVE)
+        cls.comp = Competition.objects.create(organisation=Organisation.objects.create(name='Org'),
+                                              tournament=cls.tourn)
+        cls.user = User.objects.create_user(username='testuser1', password='test123')
+
+    def test_mint(self):
+        tokens = Ticket.objects.mint(self.comp, 1200, batch_size=500)
+        self.assertEqual(len(tokens), 1200)
+        self.assertEqual(len(set(tokens)), 1200)
+        self.assertEqual(self.comp.ticket_set.filter(used=False).count(), 1200)
+        self.assertTrue(all(len(token) == self.comp.token_len for token in tokens))
+
+    def test_mint_collisions(self):
+        Ticket.objects.create(competition=self.comp)
+        taken = Ticket.objects.get().token
+        tokens = iter([taken, 'AAAAAA', 'AAAAAA', taken, 'BBBBBB', 'CCCCCC'])
+        with mock.patch('member.models.generate_token', lambda length: next(tokens)):
+            minted = Ticket.objects.mint(self.comp, 2, batch_size=2)
+        self.assertEqual(sorted(minted), ['AAAAAA', 'BBBBBB'])
+        self.assertEqual(self.comp.ticket_set.count(), 3)
+
+        with mock.patch('member.models.generate_token', lambda length: taken):
+            with self.assertRaises(IntegrityError):
+                Ticket.objects.mint(self.comp, 1)
+
+        self.comp.token_len = 2
+        with self.assertRaises(ValueError):
+            Ticket.objects.mint(self.comp, 1297)
+
+    def test_save_retries(self):
+        taken = Ticket.objects.create(competition=self.comp).token
+        tokens = iter([taken, taken, 'NEWTKN'])
+        with mock.patch('member.models.generate_token', lambda length: next(tokens)):
+            ticket = Ticket.objects.create(competition=self.comp)
+        self.assertEqual(ticket.token, 'NEWTKN')
+
+        with mock.patch('member.models.generate_token', lambda length: taken):
+            with self.assertRaises(IntegrityError):
+                Ticket.objects.create(competition=self.comp)
+
+    def test_redeem(self):
+        token = Ticket.objects.mint(self.comp, 1)[0]
+        ticket = Ticket.objects.redeem(token)
+        self.assertEqual(ticket.competition, self.comp)
+        self.assertTrue(ticket.used)
+        self.assertIsNone(Ticket.objects.redeem(token))
+        self.assertIsNone(Ticket.objects.redeem('NOTOKEN'))
+
+    def test_use_token_twice(self):
+        token = Ticket.objects.mint(self.comp, 1)[0]
+        other = User.objects.create_user(username='testuser2', password='test123')
+        self.client.login(username='testuser1', password='test123')
+        self.client.post(reverse('member:use_token'), {'token': token.lower()})
+        self.assertTrue(self.comp.participants.filter(user=self.user).exists())
+
+        self.client.login(username='testuser2', password='test123')
+        response = self.client.post(reverse('member:use_token'), {'token': token})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Participant.objects.filter(user=other).exists())
+
+    def test_add_tickets_action(self):
+        self.user.is_superuser = True
+        self.user.is_staff = True
+        self.user.save()
+        self.client.login(username='testuser1', password='test123')
+        url = reverse('admin:member_competition_changelist')
+
+        response = self.client.post(url, {'action': 'add_tickets', '_selected_action': [self.comp.pk]})
+        self.assertTemplateUsed(response, 'admin/add_tickets.html')
+        self.assertEqual(self.comp.ticket_set.count(), 0)
+
+        response = self.client.post(url, {'action': 'add_tickets', '_selected_action': [self.comp.pk],
+                                          'apply': 'Add tickets', 'count': 250})
+        self.assertRedirects(response, url)
+        self.assertEqual(self.comp.ticket_set.count(), 250)
+
+
+class TicketExportTest(TestCase):
+    fixtures = ['social.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        sport = Sport.objects.create(name='sport')
+        cls.tourn = Tournament.objects.create(name='tourn', sport=sport, state=Tournament.ACTIVE)
+        cls.comp = Competition.objects.create(organisation=Organisation.objects.create(name='Org'),
+                                              tournament=cls.tourn)
+        cls.tokens = Ticket.objects.mint(cls.comp, 20)
+        Ticket.objects.redeem(cls.tokens[0])
+        cls.user = User.objects.create_user(username='testuser1', password='test123')
+        cls.user.user_permissions.add(Permission.objects.get(name='Can change match'))
+
+    def setUp(self):
+        self.client.login(username='testuser1', password='test123')
+
+    def test_csv(self):
+        response = self.client.get(reverse('member:tickets_csv', kwargs={'comp_pk': self.comp.pk}))
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], ['token', 'organisation', 'tournament'])
+        self.assertEqual(sorted(row[0] for row in rows[1:]), sorted(self.tokens[1:]))
+        self.assertEqual(rows[1][1:], ['Org', 'tourn'])
+
+    def test_sheets(self):
+        response = self.client.get(reverse('member:tickets', kwargs={'comp_pk': self.comp.pk}))
+        content = b''.join(response.streaming_content).decode()
+        # 19 unused tickets on 8 ticket sheets
+        self.assertEqual(content.count('<div class=sheet>'), 3)
+        self.assertEqual(content.count('<div class=ticket>'), 19)
+        self.assertNotIn(self.tokens[0], content)
+        self.assertIn('</body>', content)
+
+    def test_no_tickets(self):
+        Ticket.objects.all().delete()
+        response = self.client.get(reverse('member:tickets', kwargs={'comp_pk': self.comp.pk}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_export_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'tickets.csv')
+            call_command('export_tickets', self.comp.pk, mint=5, output=output, stdout=io.StringIO())
+            with open(output) as f:
+                self.assertEqual(len(list(csv.reader(f))), 25)
+
+            output = os.path.join(tmp, 'tickets.html')
+            call_command('export_tickets', self.comp.pk, format='html', output=output,
+                         stdout=io.StringIO())
+            with open(output) as f:
+                self.assertEqual(f.read().count('<div class=ticket>'), 24)
+
+
+class SocialNamesTest(TestCase):
+    fixtures = ['social.json']
+
+    def setUp(self):
+        self.users = [User.objects.create_user(username='user%d' % i, first_name='First%d' % i)
+                      for i in range(6)]
+        SocialAccount.objects.create(user=self.users[0], provider='twitter', uid='1',
+                                     extra_data={'screen_name': 'tweeter'})
+        SocialAccount.objects.create(user=self.users[1], provider='facebook', uid='2',
+                                     extra_data={'name': 'Face Book'})
+        profile = self.users[2].profile
+        profile.social_display_name_format = Profile.SDNF_DN
+        profile.save()
+
+    def test_social_names(self):
+        profiles = Profile.objects.filter(user__in=self.users).select_related('user').order_by('user')
+        with self.assertNumQueries(2):
+            names = social_names(profiles, ['twitter', 'facebook'])
+        self.assertEqual([name for _, name in names['twitter']],
+                         ['tweeter', 'user1', 'First2', 'user3', 'user4', 'user5'])
+        self.assertEqual([name for _, name in names['facebook']],
+                         ['user0', 'Face Book', 'First2', 'user3', 'user4', 'user5'])
+        for provider, rows in names.items():
+            for profile, name in rows:
+                self.assertEqual(profile.get_social_name(provider), name)
+
+    def test_admin_action(self):
+        admin_user = User.objects.create_superuser(username='admin', password='test123', email='a@b.com')
+        self.client.force_login(admin_user)
+        selected = list(Profile.objects.filter(user__in=self.users).values_list('pk', flat=True))
+        # the same number of queries however many profiles are selected
+        with self.assertNumQueries(7):
+            response = self.client.post(reverse('admin:member_profile_changelist'), {
+                'action': 'display_social_names', '_selected_action': selected})
+        self.assertEqual(len(response.context['info']['facebook']), 6)
+
+
+class DisplayNameTest(TestCase):
+    fixtures = ['social.json']
+
+    def setUp(self):
+        sport = Sport.objects.create(name='sport')
+        self.tourn = Tournament.objects.create(name='tourn', sport=sport, state=Tournament.ACTIVE)
+        self.user = User.objects.create_user(username='testuser', password='test123',
+                                             first_name='Test', last_name='User')
+        self.participant = Participant.objects.create(user=self.user, tournament=self.tourn)
+
+    def test_maintained(self):
+        self.assertEqual(self.user.profile.display_name, 'Test User')
+        self.assertEqual(self.participant.display_name, 'Test User')
+
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Changed'
+        user.save()
+        self.participant.refresh_from_db()
+        self.assertEqual(self.participant.display_name, 'Changed User')
+
+        profile = Profile.objects.get(user=self.user)
+        profile.display_name_format = Profile.DNF_USR
+        profile.save()
+        self.participant.refresh_from_db()
+        self.assertEqual(self.participant.get_name(), 'testuser')
+
+    def test_without_profile(self):
+        user = User.objects.create_user(username='noprofile', password='test123')
+        Profile.objects.filter(user=user).delete()
+        participant = Participant.objects.create(user=User.objects.get(pk=user.pk),
+                                                 tournament=self.tourn)
+        self.assertEqual(participant.display_name, 'noprofile')
+
+        Participant.objects.filter(pk=participant.pk).update(display_name='')
+        self.assertEqual(Participant.objects.get(pk=participant.pk).get_name(), 'noprofile')
+
+    def test_table(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('competition:table', kwargs={'slug': self.tourn.slug}))
+        self.assertContains(response, 'Test User')
+
+        profile = self.user.profile
+        profile.display_name_format = Profile.DNF_ID
+        profile.save()
+        response = self.client.get(reverse('competition:table', kwargs={'slug': self.tourn.slug}))
+        self.assertContains(response, 'user_%d' % self.user.pk)
+
+    def test_match(self):
+        sport = self.tourn.sport
+        match = Match.objects.create(tournament=self.tourn,
+                                     home_team=Team.objects.create(name='team A', code='AAA', sport=sport),
+                                     away_team=Team.objects.create(name='team B', code='BBB', sport=sport),
+                                     kick_off=timezone.now() - datetime.timedelta(hours=1))
+        Prediction.objects.create(match=match, user=self.user, prediction=3)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('competition:match', kwargs={'match_pk': match.pk}))
+        self.assertContains(response, '<td>Test User</td>', html=True)
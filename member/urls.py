@@ -8,4 +8,5 @@ urlpatterns = [
     url(r'^use_token/$', views.use_token, name='use_token'),
     url(r'^announcement/$', views.announcement, name='announcement'),
     url(r'^competition/(?P<comp_pk>[0-9]+)/$', views.print_tickets, name='tickets'),
+    url(r'^competition/(?P<comp_pk>[0-9]+)/tickets.csv$', views.tickets_csv, name='tickets_csv'),
 ]
@@ -1,5 +1,5 @@
 from django.shortcuts import redirect, get_object_or_404
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, Http404, StreamingHttpResponse
 from django.template import loader
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib import messages
@@ -7,8 +7,11 @@ from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth.models import User
 from django.contrib.sites.shortcuts import get_current_site
 from django.core import mail
+from django.db import transaction
+from django.template.defaultfilters import slugify
 from django.utils.translation import gettext as _
 from .models import Ticket, Competition
+from .export import ticket_csv_rows, ticket_sheets
 from .forms import ProfileEditForm, NameChangeForm, AnnouncementForm
 from competition.models import Participant
 import logging
@@ -62,20 +65,21 @@ def use_token(request):
     if request.method == 'POST':
         try:
             token = request.POST['token'].upper()
-            ticket = Ticket.objects.get(used=False, token=token)
-            ticket.used = True
-            g_logger.debug("Found ticket for token:%s" % token)
-            tourn = ticket.competition.tournament
-            try:
-                participant = Participant.objects.get(user=request.user,
-                                                      tournament=tourn)
-            except Participant.DoesNotExist:
-                participant = Participant(user=request.user,
-                                          tournament=tourn)
-                participant.save()
-                messages.success(request, _("You have joined the competition"))
-            ticket.competition.participants.add(participant)
-            ticket.save()
+            with transaction.atomic():
+                ticket = Ticket.objects.redeem(token)
+                if ticket is None:
+                    raise Ticket.DoesNotExist("Token %s does not exist or has been used" % token)
+                g_logger.debug("Found ticket for token:%s" % token)
+                tourn = ticket.competition.tournament
+                try:
+                    participant = Participant.objects.get(user=request.user,
+                                                          tournament=tourn)
+                except Participant.DoesNotExist:
+                    participant = Participant(user=request.user,
+                                              tournament=tourn)
+                    participant.save()
+                    messages.success(request, _("You have joined the competition"))
+                ticket.competition.participants.add(participant)
             messages.success(request, _("Ticket accepted"))
             return redirect('competition:org_table',
                             slug=tourn.slug,
@@ -155,16 +159,16 @@ def print_tickets(request, comp_pk):
 
     comp = get_object_or_404(Competition, pk=comp_pk)
 
-    tickets = comp.ticket_set.filter(used=False)
-
-    if not tickets:
+    if not comp.ticket_set.filter(used=False).exists():
         raise Http404("Competition has no tickets")
 
-    template = loader.get_template('tickets.html')
-    context = {
-        'site_name': current_site.name,
-        'comp': comp,
-        'tickets': tickets,
-    }
+    return StreamingHttpResponse(ticket_sheets(comp, current_site.name, request))
 
-    return HttpResponse(template.render(context, request))
+
+@permission_required('competition.change_match')
+def tickets_csv(request, comp_pk):
+    comp = get_object_or_404(Competition, pk=comp_pk)
+
+    response = StreamingHttpResponse(ticket_csv_rows(comp), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="%s-tickets.csv"' % slugify(comp)
+    return response
@@ -1,4 +1,8 @@
 from django.conf import settings
+from server import db
+
 
 def selected_settings(request):
-    return {'APP_VERSION_NUMBER': settings.APP_VERSION_NUMBER}
+    return {'APP_VERSION_NUMBER': settings.APP_VERSION_NUMBER,
+            'FRAGMENT_CACHE_TIMEOUT': db.cache_timeout(settings.FRAGMENT_CACHE_TIMEOUT),
+            'READ_DB': db.read_alias()}
@@ -0,0 +1,101 @@
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from functools import wraps
+import contextlib
+import threading
+
+REPLICA = 'replica'
+STICKY_COOKIE = 'primary_reads'
+
+_state = threading.local()
+
+
+# Read replica routing. When a 'replica' database is configured (see
+# DJANGO_REPLICA_* in settings) the views decorated with replica_reads, the
+# tables, prediction history and the partial lists, read from it while every
+# write, and every other view, uses the default database.
+#
+# A replica lags behind, so a user who has just written something must not
+# read from it: ReplicaStickinessMiddleware sets a short lived cookie on the
+# response to any POST and the decorated views read from the default database
+# while it is present. Other users may briefly see the data as it was before.
+#
+# The cached data and template fragments are keyed on version counters that a
+# write bumps straight away, so what is cached while reading the replica is
+# also keyed on read_alias() and only kept for REPLICA_CACHE_SECONDS: it is
+# never served to a user reading the default database, and rows the replica
+# had not caught up with are not served to anyone for longer than that.
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+def reading_replica():
+    return getattr(_state, 'replica', False)
+
+
+def read_alias():
+    """The database being read, part of the key of anything cached from it"""
+    return REPLICA if reading_replica() else 'default'
+
+
+def cache_timeout(timeout):
+    if not reading_replica():
+        return timeout
+    if timeout is None or timeout is DEFAULT_TIMEOUT:
+        return settings.REPLICA_CACHE_SECONDS
+    return min(timeout, settings.REPLICA_CACHE_SECONDS)
+
+
+@contextlib.contextmanager
+def replica():
+    previous = reading_replica()
+    _state.replica = replica_configured()
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+def replica_reads(view):
+    """Run a read only view against the replica unless the user has just written"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        read_only = request.method in ('GET', 'HEAD')
+        sticky = STICKY_COOKIE in request.COOKIES
+        request.replica_reads = read_only and not sticky and replica_configured()
+        if not request.replica_reads:
+            return view(request, *args, **kwargs)
+        with replica():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if reading_replica():
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same rows as the default database
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
+
+
+class ReplicaStickinessMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if replica_configured() and request.method not in ('GET', 'HEAD', 'OPTIONS') \
+                and response.status_code < 500:
+            response.set_cookie(STICKY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
@@ -60,6 +60,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'server.db.ReplicaStickinessMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.security.SecurityMiddleware',
 ]
@@ -96,6 +97,63 @@ DATABASES = {
     }
 }
 
+# An optional read replica for the read only views, see server/db.py. Locally
+# it can be a second SQLite file copied from config.db (DJANGO_REPLICA_NAME)
+# or a PostgreSQL server standing in for one.
+if os.getenv('DJANGO_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        'ENGINE': os.getenv('DJANGO_REPLICA_ENGINE', 'django.db.backends.sqlite3'),
+        'NAME': os.getenv('DJANGO_REPLICA_NAME'),
+        'HOST': os.getenv('DJANGO_REPLICA_HOST', ''),
+        'PORT': os.getenv('DJANGO_REPLICA_PORT', ''),
+        'USER': os.getenv('DJANGO_REPLICA_USER', ''),
+        'PASSWORD': os.getenv('DJANGO_REPLICA_PASSWORD', ''),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['server.db.ReplicaRouter']
+
+# Seconds a user reads from the default database after a write of their own
+REPLICA_STICKY_SECONDS = int(os.getenv('DJANGO_REPLICA_STICKY_SECONDS', 10))
+# Seconds data read from the replica is cached for, longer than it usually lags
+REPLICA_CACHE_SECONDS = int(os.getenv('DJANGO_REPLICA_CACHE_SECONDS', 60))
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# The site runs as several mod_wsgi processes, so production needs a cache that
+# is shared between them: file (default), memcached (needs pymemcache) or
+# redis (needs django-redis). locmem is only visible to a single process.
+
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+    'redis': 'django_redis.cache.RedisCache',
+    'dummy': 'django.core.cache.backends.dummy.DummyCache',
+}
+CACHE_DEFAULT_LOCATIONS = {
+    'locmem': 'gamlaffo',
+    'file': os.path.join(BASE_DIR, 'cache'),
+    'memcached': '127.0.0.1:11211',
+    'redis': 'redis://127.0.0.1:6379/1',
+    'dummy': '',
+}
+
+CACHE_BACKEND = os.getenv('DJANGO_CACHE_BACKEND', 'locmem' if DEBUG else 'file')
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.getenv('DJANGO_CACHE_LOCATION', CACHE_DEFAULT_LOCATIONS[CACHE_BACKEND]),
+        'KEY_PREFIX': 'gamlaffo',
+        'TIMEOUT': 60 * 5,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        } if CACHE_BACKEND in ['locmem', 'file'] else {},
+    }
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/1.8/topics/i18n/
@@ -217,6 +275,18 @@ SITE_ID = 1
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 
+# Queue the emails sent when a tournament opens or closes for run_scheduler to
+# send, rather than sending them while handling the admin request.
+DEFER_EMAILS = os.getenv('DJANGO_DEFER_EMAILS', 'False') in ['True', 'true']
+
+# How long cached template fragments are kept (seconds). Fragments are keyed on
+# version counters, so this only bounds how long unused entries linger.
+FRAGMENT_CACHE_TIMEOUT = 60 * 60
+
+# How long browsers may reuse the pages of a finished tournament, which are
+# served from its snapshot, before revalidating them with their ETag (seconds).
+SNAPSHOT_MAX_AGE = int(os.getenv('DJANGO_SNAPSHOT_MAX_AGE', 24 * 60 * 60))
+
 with open(os.path.join(BASE_DIR, "VERSION")) as v_file:
     APP_VERSION_NUMBER = v_file.read().strip()
 
@@ -1,9 +1,17 @@
 from django.contrib.auth.models import User
 from django.core import mail
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
 from django.urls import reverse
+from io import StringIO
+from unittest import mock
 import unittest
 import re
+from competition.cache import tournament_cached
+from competition.models import Prediction, Tournament
+from server import db
 # import pdb; pdb.set_trace()
 
 class ServerViewTest (TestCase):
@@ -204,3 +212,70 @@ class SignupTest(TestCase):
         login = self.client.login(username='new_user', password='password1')
         self.assertFalse(login)
 
+
+
+@mock.patch('server.db.replica_configured', return_value=True)
+class ReplicaRoutingTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser1', password='test123')
+
+    def setUp(self):
+        self.view = db.replica_reads(lambda request: HttpResponse(str(db.reading_replica())))
+
+    def test_router(self, configured):
+        router = db.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(User))
+        with db.replica():
+            self.assertEqual(router.db_for_read(User), db.REPLICA)
+            self.assertEqual(router.db_for_write(User), 'default')
+        self.assertIsNone(router.db_for_read(User))
+        self.assertFalse(router.allow_migrate(db.REPLICA, 'competition'))
+
+        configured.return_value = False
+        with db.replica():
+            self.assertIsNone(router.db_for_read(User))
+
+    def test_sticky_after_write(self, configured):
+        factory = RequestFactory()
+        self.assertEqual(self.view(factory.get('/')).content, b'True')
+        self.assertEqual(self.view(factory.post('/')).content, b'False')
+        self.assertFalse(db.reading_replica())
+
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('competition:prediction_create', kwargs={'match_pk': 1}))
+        self.assertIn(db.STICKY_COOKIE, response.cookies)
+
+        request = factory.get('/')
+        request.COOKIES[db.STICKY_COOKIE] = response.cookies[db.STICKY_COOKIE].value
+        self.assertEqual(self.view(request).content, b'False')
+
+    def test_cache_keyed_on_database(self, configured):
+        cache.clear()
+        with db.replica():
+            self.assertEqual(tournament_cached(1, 'rows', lambda: 'replica'), 'replica')
+        self.assertEqual(tournament_cached(1, 'rows', lambda: 'default'), 'default')
+        with db.replica():
+            self.assertEqual(tournament_cached(1, 'rows', lambda: 'again'), 'replica')
+
+    def test_writer_after_replica_render(self, configured):
+        cache.clear()
+        call_command('generate_tournament', seed=1, name='replicated', participants=3, benchmarks=0,
+                     organisations=0, played=0.5, stdout=StringIO())
+        tourn = Tournament.objects.get(name='replicated')
+        match = tourn.match_set.filter(score__isnull=False).order_by('match_id')[0]
+        writer, reader = [p.user for p in tourn.participant_set.order_by('pk')[:2]]
+        url = reverse('competition:match', kwargs={'match_pk': match.pk})
+
+        # the test database stands in for a replica that has not caught up with the writer
+        with mock.patch.object(db.ReplicaRouter, 'db_for_read', return_value=None):
+            self.client.force_login(reader)
+            self.client.get(url)
+        Prediction.objects.filter(match=match, user=writer).update(prediction=987)
+        prediction = Prediction.objects.get(match=match, user=writer)
+
+        self.client.force_login(writer)
+        self.client.cookies[db.STICKY_COOKIE] = '1'
+        response = self.client.get(url)
+        self.assertContains(response, '<td>%s</td>' % prediction.prediction)